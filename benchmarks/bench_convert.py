@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Benchmark raw to volts conversion: per-sample comedi_to_phys loop (the
+original acquire_data implementation) versus the vectorized RawConverter.
+
+usage: python benchmarks/bench_convert.py [-n sample_num] [-c nchans]
+"""
+import os
+import sys
+import time
+import optparse
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simple_daq.convert import RawConverter
+
+try:
+    import comedi as c
+    comedi_to_phys = c.comedi_to_phys
+except ImportError:
+    c = None
+
+    def comedi_to_phys(data, cr, maxdata):
+        """
+        Pure python equivalent of comedi_to_phys used when comedi is not
+        available.
+        """
+        if data == 0 or data == maxdata:
+            return numpy.nan
+        return (float(data)/maxdata)*(cr.max - cr.min) + cr.min
+
+
+class Range(object):
+
+    def __init__(self, min, max, unit=0):
+        self.min = min
+        self.max = max
+        self.unit = unit
+
+
+def loop_convert(dataarray, nchans, cr, maxdata):
+    """
+    The original per-sample conversion loop from acquire_data.
+    """
+    array_list = []
+    for i in range(0,nchans):
+        temp_array = dataarray[i::nchans]
+        temp_array = numpy.array([comedi_to_phys(int(x),cr,maxdata)for x in temp_array])
+        temp_array = numpy.reshape(temp_array,(temp_array.shape[0],1))
+        array_list.append(temp_array)
+    return numpy.concatenate(tuple(array_list),1)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]...')
+    parser.add_option('-n', '--sample_num', type='int', dest='sample_num', default=100000)
+    parser.add_option('-c', '--nchans', type='int', dest='nchans', default=8)
+    options, args = parser.parse_args()
+
+    maxdata = 65535
+    if c is None:
+        cr = Range(-10.0, 10.0)
+    else:
+        cr = c.comedi_range()
+        cr.min, cr.max, cr.unit = -10.0, 10.0, 0
+    nchans = options.nchans
+    n = options.sample_num
+    raw = numpy.random.randint(0, maxdata+1, size=n*nchans).astype(numpy.uint16)
+    converter = RawConverter([(cr.min, cr.max, cr.unit)]*nchans, [maxdata]*nchans)
+
+    t0 = time.time()
+    loop_samples = loop_convert(raw, nchans, cr, maxdata)
+    loop_time = time.time() - t0
+
+    results = []
+    for dtype in (numpy.float64, numpy.float32):
+        t0 = time.time()
+        samples = converter.convert(raw, dtype=dtype)
+        results.append((numpy.dtype(dtype).name, time.time() - t0, samples))
+
+    print 'samples: %d x %d channels'%(n, nchans)
+    print '\tloop:    %8.4f sec, %12.0f samples/sec'%(loop_time, n*nchans/loop_time)
+    for name, dt, samples in results:
+        dt = max(dt, 1.0e-9)
+        err = numpy.nanmax(numpy.abs(samples - loop_samples))
+        print '\t%s: %8.4f sec, %12.0f samples/sec, speedup %6.0fx, max err %g'%(name, dt, n*nchans/dt, loop_time/dt, err)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Benchmark fan-out of a stream of raw scans to several consumer processes
+on the same host: the shared memory ring (one copy into the ring, the
+consumers read it in place) versus a pipe per consumer (a copy of every
+block for every consumer). For each number of consumers the producer
+publishes sample_num scans as fast as it can, each consumer sums every
+block it receives, and the aggregate throughput (samples received by all
+consumers per second) is reported. The ring producer waits for the
+slowest consumer (using the consumer cursors) so no scans are lost, as
+the pipes do - with --free_run it does not wait, like the acquisition,
+and scans lost by consumers which fall more than the ring capacity
+behind are reported.
+
+usage: python benchmarks/bench_shmring.py [OPTION]...
+"""
+import os
+import sys
+import time
+import json
+import optparse
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simple_daq import shmring
+
+RING_NAME = 'bench_shmring.%d'%(os.getpid(),)
+METHODS = ('shm', 'pipe')
+
+
+def get_blocks(nchans, block_size):
+    """
+    Returns list of distinct blocks which are published in turn.
+    """
+    blocks = []
+    rand = numpy.random.RandomState(0)
+    for i in range(8):
+        blocks.append(rand.randint(0, 65536, size=(block_size, nchans)).astype(numpy.uint16))
+    return blocks
+
+
+def read_exact(fd, n):
+    chunks = []
+    while n > 0:
+        data = os.read(fd, min(n, 1 << 20))
+        if not data:
+            return None
+        chunks.append(data)
+        n -= len(data)
+    return ''.join(chunks)
+
+
+def read_all(fd):
+    chunks = []
+    while True:
+        data = os.read(fd, 1 << 16)
+        if not data:
+            break
+        chunks.append(data)
+    return ''.join(chunks)
+
+
+def shm_consumer(result_fd):
+    consumer = shmring.ShmConsumer(RING_NAME, timeout=10.0)
+    scans = 0
+    for index, view in consumer:
+        view.sum()
+        scans += view.shape[0]
+    os.write(result_fd, json.dumps({'scans' : scans, 'lost' : consumer.lost}))
+    consumer.close()
+
+
+def pipe_consumer(fd, nchans, block_size, result_fd):
+    scans = 0
+    block_bytes = block_size*nchans*2
+    while True:
+        data = read_exact(fd, block_bytes)
+        if data is None:
+            break
+        numpy.frombuffer(data, dtype=numpy.uint16).sum()
+        scans += block_size
+    os.write(result_fd, json.dumps({'scans' : scans, 'lost' : 0}))
+
+
+def run(method, consumer_num, nchans, block_size, sample_num, capacity, free_run=False):
+    """
+    Returns (elapsed time, list of consumer results).
+    """
+    blocks = get_blocks(nchans, block_size)
+    producer = None
+    if method == 'shm':
+        producer = shmring.ShmProducer(RING_NAME, nchans, capacity)
+    pids = []
+    result_fds = []
+    pipe_fds = []
+    for i in range(consumer_num):
+        result_r, result_w = os.pipe()
+        if method == 'pipe':
+            data_r, data_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                try:
+                    os.close(result_r)
+                    if method == 'shm':
+                        shm_consumer(result_w)
+                    else:
+                        os.close(data_w)
+                        for fd in pipe_fds:
+                            os.close(fd)
+                        pipe_consumer(data_r, nchans, block_size, result_w)
+                except Exception, err:
+                    sys.stderr.write('consumer error: %s\n'%(err,))
+                    status = 1
+            finally:
+                os._exit(status)
+        os.close(result_w)
+        if method == 'pipe':
+            os.close(data_r)
+            pipe_fds.append(data_w)
+        pids.append(pid)
+        result_fds.append(result_r)
+
+    if method == 'shm':
+        # Wait for the consumers to attach
+        while len(producer.consumers()) < consumer_num:
+            time.sleep(0.001)
+    t0 = time.time()
+    for i, index in enumerate(xrange(0, sample_num, block_size)):
+        block = blocks[i % len(blocks)]
+        if method == 'shm':
+            while not free_run and producer.lag() + block_size > capacity:
+                time.sleep(0.0001)
+            producer.publish(index, block)
+        else:
+            data = block.tostring()
+            for fd in pipe_fds:
+                os.write(fd, data)
+    if method == 'shm':
+        producer.close()
+    else:
+        for fd in pipe_fds:
+            os.close(fd)
+    results = []
+    for pid, fd in zip(pids, result_fds):
+        results.append(json.loads(read_all(fd)))
+        os.close(fd)
+        os.waitpid(pid, 0)
+    return time.time() - t0, results
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]...')
+    parser.add_option('-c', '--nchans', type='int', dest='nchans', default=16)
+    parser.add_option('-b', '--block_size', type='int', dest='block_size', default=4096)
+    parser.add_option('-n', '--sample_num', type='int', dest='sample_num', default=1 << 21)
+    parser.add_option('--consumers', type='string', dest='consumers', default='1 2 4 8',
+                      help='numbers of consumers to run')
+    parser.add_option('--capacity', type='int', dest='capacity', default=shmring.DEFAULT_CAPACITY,
+                      help='ring capacity in scans')
+    parser.add_option('--methods', type='string', dest='methods', default=' '.join(METHODS))
+    parser.add_option('--free_run', action='store_true', dest='free_run', default=False,
+                      help='ring producer does not wait for slow consumers')
+    options, args = parser.parse_args()
+
+    print 'nchans %d, block size %d, %d scans'%(options.nchans, options.block_size, options.sample_num)
+    print '%-6s %9s %16s %16s %10s'%('method', 'consumers', 'samples/sec', 'per consumer', 'lost')
+    for method in options.methods.split():
+        for consumer_num in [int(x) for x in options.consumers.split()]:
+            elapsed, results = run(method, consumer_num, options.nchans, options.block_size,
+                                   options.sample_num, options.capacity, options.free_run)
+            samples = sum([x['scans'] for x in results])*options.nchans
+            lost = sum([x['lost'] for x in results])
+            rate = samples/max(elapsed, 1.0e-9)
+            print '%-6s %9d %16.0f %16.0f %10d'%(method, consumer_num, rate, rate/consumer_num, lost)
+
+
+if __name__ == '__main__':
+    main()
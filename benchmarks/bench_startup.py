@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Benchmark start up time of the command line programs, as seen by batch
+scripts which launch them many times. Each case is run in a new python
+process and the wall clock time of the whole process is reported:
+
+    python     - python interpreter alone, for reference
+    import     - import simple_daq
+    config     - import and resolve the daq-acquire configuration
+    acquire    - daq-acquire of a few scans from the simulated device
+    plot       - plot-daq of a short recording (non-interactive matplotlib
+                 backend, so the window is not shown)
+
+The config case also reports the time of resolving the configuration
+again within the same process, where the parsed configuration files are
+cached. Run once beforehand (or with --compile) so the package bytecode
+is written, otherwise compilation is included in every launch.
+
+usage: python benchmarks/bench_startup.py [OPTION]...
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import optparse
+import tempfile
+import subprocess
+import compileall
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CASES = ('python', 'import', 'config', 'acquire', 'plot')
+
+SCRIPTS = {
+    'python' : 'pass',
+    'import' : 'import simple_daq',
+    'config' : """
+import sys, time, json
+sys.argv = ['daq-acquire', '-d', 'sim']
+import simple_daq
+simple_daq.set_config()
+t0 = time.time()
+for i in range(%(repeat)d):
+    simple_daq.set_config()
+sys.stderr.write(json.dumps({'resolve' : (time.time() - t0)/%(repeat)d}))
+""",
+    'acquire' : """
+import sys
+sys.argv = ['daq-acquire', '-d', 'sim:speed=0', '-c', '0', '-n', '10', '-o', %(raw_file)r]
+import simple_daq
+simple_daq.daq_acquire_main()
+""",
+    'plot' : """
+import sys
+sys.argv = ['plot-daq', %(raw_file)r]
+import simple_daq
+simple_daq.plot_daq_main()
+""",
+    }
+
+
+def run_case(case, params, env):
+    """
+    Returns (elapsed time, stderr output) of running case in a new python
+    process.
+    """
+    script = SCRIPTS[case]%params
+    t0 = time.time()
+    proc = subprocess.Popen([sys.executable, '-c', script], env=env, cwd=params['work_dir'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    elapsed = time.time() - t0
+    if proc.returncode != 0:
+        raise RuntimeError, '%s failed: %s'%(case, err.strip().splitlines()[-1:])
+    return elapsed, err
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]...')
+    parser.add_option('--cases', type='string', dest='cases', default=' '.join(CASES),
+                      help='benchmark cases (default "%s")'%(' '.join(CASES),))
+    parser.add_option('-r', '--repeat', type='int', dest='repeat', default=10,
+                      help='launches of each case')
+    parser.add_option('--compile', action='store_true', dest='compile', default=False,
+                      help='write the package bytecode first')
+    parser.add_option('-o', '--output', type='string', dest='output', default=None,
+                      help='json results file')
+    options, args = parser.parse_args()
+
+    if options.compile:
+        compileall.compile_dir(os.path.join(ROOT, 'simple_daq'), quiet=1)
+
+    work_dir = tempfile.mkdtemp(prefix='bench_startup.')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.abspath(ROOT)] + filter(None, [env.get('PYTHONPATH')]))
+    env['MPLBACKEND'] = 'Agg'
+    env['HOME'] = work_dir
+    params = {
+        'repeat' : 100,
+        'work_dir' : work_dir,
+        'raw_file' : os.path.join(work_dir, 'startup.raw'),
+        }
+
+    results = []
+    try:
+        # plot-daq needs a recording
+        run_case('acquire', params, env)
+        print '%-8s %10s %10s %10s'%('case', 'min ms', 'median ms', 'max ms')
+        for case in options.cases.split():
+            if not case in SCRIPTS:
+                parser.error("unknown case '%s'"%(case,))
+            times = []
+            extra = {}
+            for i in range(options.repeat):
+                elapsed, err = run_case(case, params, env)
+                if case == 'config':
+                    # Repeated resolutions are not part of the launch
+                    extra = json.loads(err)
+                    elapsed -= params['repeat']*extra['resolve']
+                times.append(elapsed)
+            times.sort()
+            result = {
+                'case' : case,
+                'min' : times[0],
+                'median' : times[len(times)//2],
+                'max' : times[-1],
+                }
+            result.update(extra)
+            results.append(result)
+            msg = '%-8s %10.1f %10.1f %10.1f'%(case, 1.0e3*times[0], 1.0e3*result['median'], 1.0e3*times[-1])
+            if 'resolve' in extra:
+                msg += '   (resolve again in process %.3f ms)'%(1.0e3*extra['resolve'],)
+            print msg
+    finally:
+        shutil.rmtree(work_dir)
+
+    if options.output is not None:
+        fid = open(options.output, 'w')
+        json.dump({'python' : sys.version, 'results' : results}, fid, indent=2)
+        fid.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the acquisition to disk pipeline using the simulated
+device. Sweeps channel count, sample rate, sample number and output format
+over the cases
+
+    acquire  - repeated acquisitions with DaqSession (acquire_data)
+    convert  - raw to volts conversion with RawConverter
+    write    - writing blocks with each output format writer
+    load     - opening each output format and reading slices of it
+
+and reports throughput (samples/sec), latency percentiles of the timed
+operation and the peak resident set size. Each case runs in its own
+forked process so the peak RSS belongs to that case alone. Results are
+written as json and can be compared with an earlier run, e.g.
+
+    python benchmarks/bench_suite.py -o base.json
+    ... change code ...
+    python benchmarks/bench_suite.py -o new.json --compare base.json
+
+usage: python benchmarks/bench_suite.py [OPTION]...
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import platform
+import optparse
+import resource
+import tempfile
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simple_daq import simple_daq
+from simple_daq import formats
+from simple_daq import loader
+from simple_daq.convert import RawConverter
+
+CASES = ('acquire', 'convert', 'write', 'load')
+BLOCK_SIZE = 1000
+LOAD_SLICES = 50
+REGRESSION_THRESHOLD = 0.2       # fractional throughput drop reported
+
+
+def get_config(nchans, rate, sample_num, speed):
+    """
+    Returns daq-acquire configuration for the simulated device.
+    """
+    return {
+        'device' : 'sim:speed=%g'%(speed,),
+        'sample_num' : sample_num,
+        'sample_freq' : rate,
+        'channels' : range(nchans),
+        'gains' : [0]*nchans,
+        'subdev' : 0,
+        'aref' : 'ground',
+        'verbose' : False,
+        'read_engine' : 'read',
+        'read_timeout' : None,
+        }
+
+
+def get_info(nchans, rate, sample_num):
+    """
+    Returns acquisition information for the output writers.
+    """
+    return {
+        'device' : 'sim',
+        'subdev' : 0,
+        'channels' : range(nchans),
+        'gains' : [0]*nchans,
+        'aref' : 'ground',
+        'ranges' : [[-10.0, 10.0, 0]]*nchans,
+        'maxdata' : [65535]*nchans,
+        'units' : ['V']*nchans,
+        'sample_freq' : rate,
+        'sample_period' : 1.0/rate,
+        'sample_num' : sample_num,
+        'start_time' : time.time(),
+        }
+
+
+def get_raw(nchans, sample_num):
+    """
+    Returns (sample_num, nchans) array of sine wave sample codes.
+    """
+    t = numpy.arange(sample_num, dtype=numpy.float64)[:,None]
+    freq = (numpy.arange(nchans) + 1)[None,:]*1.0e-3
+    return numpy.round(32767.5 + 29000*numpy.sin(2*numpy.pi*freq*t)).astype(numpy.uint16)
+
+
+def bench_acquire(params, repeat, tmp_dir):
+    config = get_config(params['nchans'], params['rate'], params['sample_num'], params['speed'])
+    times = []
+    session = simple_daq.DaqSession(config)
+    session.open()
+    try:
+        for i in range(repeat):
+            t0 = time.time()
+            t, samples = session.acquire()
+            times.append(time.time() - t0)
+    finally:
+        session.close()
+    return times, params['sample_num']*params['nchans']
+
+
+def bench_convert(params, repeat, tmp_dir):
+    raw = get_raw(params['nchans'], params['sample_num'])
+    converter = RawConverter([(-10.0, 10.0, 0)]*params['nchans'], [65535]*params['nchans'])
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        converter.convert(raw)
+        times.append(time.time() - t0)
+    return times, raw.size
+
+
+def write_file(params, tmp_dir):
+    """
+    Write file in the case's format. Returns (filename, block write times).
+    """
+    nchans, rate, sample_num = params['nchans'], params['rate'], params['sample_num']
+    raw = get_raw(nchans, sample_num)
+    filename = os.path.join(tmp_dir, 'bench' + {'text' : '.txt', 'raw' : '.raw', 'npy' : '.npy',
+                                                'chunked' : '.sdq'}[params['format']])
+    writer = formats.open_writer(filename, get_info(nchans, rate, sample_num), params['format'])
+    times = []
+    for index in range(0, sample_num, BLOCK_SIZE):
+        t0 = time.time()
+        writer.write(index, raw[index:index + BLOCK_SIZE])
+        times.append(time.time() - t0)
+    t0 = time.time()
+    writer.close()
+    times[-1] += time.time() - t0
+    return filename, times
+
+
+def bench_write(params, repeat, tmp_dir):
+    times = []
+    for i in range(repeat):
+        filename, block_times = write_file(params, tmp_dir)
+        times.extend(block_times)
+    # Throughput over all blocks, latency per block
+    return times, params['sample_num']*params['nchans']*repeat
+
+
+def bench_load(params, repeat, tmp_dir):
+    filename, block_times = write_file(params, tmp_dir)
+    sample_num = params['sample_num']
+    times = []
+    total = 0
+    rand = numpy.random.RandomState(0)
+    for i in range(repeat):
+        t0 = time.time()
+        recording = loader.open_recording(filename)
+        recording.get_samples(0, len(recording))
+        times.append(time.time() - t0)
+        total += sample_num*params['nchans']
+        for j in range(LOAD_SLICES):
+            start = rand.randint(0, max(sample_num - BLOCK_SIZE, 1))
+            t0 = time.time()
+            recording.get_samples(start, start + BLOCK_SIZE)
+            times.append(time.time() - t0)
+            total += BLOCK_SIZE*params['nchans']
+        # Parse text again on the next repeat
+        if os.path.exists(filename + loader.TEXT_CACHE_EXT):
+            os.remove(filename + loader.TEXT_CACHE_EXT)
+    return times, total
+
+
+BENCH_FUNCS = {
+    'acquire' : bench_acquire,
+    'convert' : bench_convert,
+    'write' : bench_write,
+    'load' : bench_load,
+    }
+
+
+def run_case(case, params, repeat):
+    """
+    Run benchmark case and return result dictionary.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='bench_suite')
+    try:
+        times, samples = BENCH_FUNCS[case](params, repeat, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    times = numpy.array(times)
+    total = max(times.sum(), 1.0e-9)
+    return {
+        'case' : case,
+        'params' : params,
+        'samples_per_sec' : samples/total,
+        'latency' : {
+            'count' : times.shape[0],
+            'p50' : float(numpy.percentile(times, 50)),
+            'p90' : float(numpy.percentile(times, 90)),
+            'p99' : float(numpy.percentile(times, 99)),
+            'max' : float(times.max()),
+            },
+        }
+
+
+def run_forked(case, params, repeat):
+    """
+    Run case in a child process. Returns result with the peak resident set
+    size (kB) of the child.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 0
+        try:
+            try:
+                result = run_case(case, params, repeat)
+            except Exception, err:
+                result = {'case' : case, 'params' : params, 'error' : str(err)}
+                status = 1
+            data = json.dumps(result)
+            pos = 0
+            while pos < len(data):
+                pos += os.write(write_fd, data[pos:])
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    data = []
+    while True:
+        chunk = os.read(read_fd, 1 << 16)
+        if not chunk:
+            break
+        data.append(chunk)
+    os.close(read_fd)
+    pid, status, rusage = os.wait4(pid, 0)
+    if not data:
+        return {'case' : case, 'params' : params, 'error' : 'benchmark process failed'}
+    result = json.loads(''.join(data))
+    result['peak_rss_kb'] = rusage.ru_maxrss
+    return result
+
+
+def get_cases(options):
+    """
+    Returns list of (case, params) for the sweep.
+    """
+    case_list = []
+    for case in options.cases.split():
+        if not case in CASES:
+            raise ValueError, "unknown case '%s'"%(case,)
+        for nchans in [int(x) for x in options.channels.split()]:
+            for sample_num in [int(x) for x in options.sample_nums.split()]:
+                if case == 'acquire':
+                    for rate in [int(x) for x in options.rates.split()]:
+                        params = {'nchans' : nchans, 'rate' : rate, 'sample_num' : sample_num,
+                                  'speed' : options.speed}
+                        case_list.append((case, params))
+                elif case == 'convert':
+                    case_list.append((case, {'nchans' : nchans, 'sample_num' : sample_num}))
+                else:
+                    rate = int(options.rates.split()[0])
+                    for fmt in options.formats.split():
+                        params = {'nchans' : nchans, 'rate' : rate, 'sample_num' : sample_num,
+                                  'format' : fmt}
+                        case_list.append((case, params))
+    return case_list
+
+
+def case_key(result):
+    params = result['params']
+    return (result['case'],) + tuple(sorted(params.items()))
+
+
+def compare(results, base_results):
+    """
+    Print throughput of results relative to base_results and flag drops
+    larger than REGRESSION_THRESHOLD. Returns number of regressions.
+    """
+    base = {}
+    for result in base_results:
+        base[case_key(result)] = result
+    regressions = 0
+    print
+    print 'comparison with base run'
+    for result in results:
+        other = base.get(case_key(result))
+        if other is None or 'error' in result or 'error' in other:
+            continue
+        ratio = result['samples_per_sec']/max(other['samples_per_sec'], 1.0e-9)
+        flag = ''
+        if ratio < 1.0 - REGRESSION_THRESHOLD:
+            flag = '  <-- regression'
+            regressions += 1
+        print '\t%-8s %-50s %6.2fx%s'%(result['case'], format_params(result['params']), ratio, flag)
+    return regressions
+
+
+def format_params(params):
+    return ' '.join(['%s=%s'%(k, params[k]) for k in sorted(params)])
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]...')
+    parser.add_option('--cases', type='string', dest='cases', default=' '.join(CASES),
+                      help='benchmark cases (default "%s")'%(' '.join(CASES),))
+    parser.add_option('-c', '--channels', type='string', dest='channels', default='1 8 64',
+                      help='channel counts to sweep')
+    parser.add_option('-f', '--rates', type='string', dest='rates', default='10000 100000',
+                      help='sample rates (Hz) to sweep')
+    parser.add_option('-n', '--sample_nums', type='string', dest='sample_nums', default='10000 100000',
+                      help='sample numbers to sweep')
+    parser.add_option('--formats', type='string', dest='formats', default=' '.join(formats.FORMATS),
+                      help='output formats to sweep')
+    parser.add_option('--speed', type='float', dest='speed', default=0.0,
+                      help='simulated device speed, 0 = as fast as possible (default 0)')
+    parser.add_option('-r', '--repeat', type='int', dest='repeat', default=5,
+                      help='repeats of each case')
+    parser.add_option('-o', '--output', type='string', dest='output', default=None,
+                      help='json results file (default = stdout)')
+    parser.add_option('--compare', type='string', dest='compare', default=None,
+                      help='json results of an earlier run to compare with')
+    options, args = parser.parse_args()
+
+    try:
+        case_list = get_cases(options)
+    except ValueError, err:
+        parser.error(str(err))
+
+    results = []
+    for case, params in case_list:
+        result = run_forked(case, params, options.repeat)
+        results.append(result)
+        if 'error' in result:
+            msg = '%-8s %-50s error: %s\n'%(case, format_params(params), result['error'])
+        else:
+            msg = '%-8s %-50s %14.0f samples/sec  p50 %9.6f  p99 %9.6f sec  rss %7d kB\n'
+            msg = msg%(case, format_params(params), result['samples_per_sec'],
+                       result['latency']['p50'], result['latency']['p99'], result['peak_rss_kb'])
+        sys.stderr.write(msg)
+
+    run = {
+        'meta' : {
+            'time' : time.time(),
+            'python' : platform.python_version(),
+            'numpy' : numpy.__version__,
+            'platform' : platform.platform(),
+            'repeat' : options.repeat,
+            },
+        'results' : results,
+        }
+    if options.output is None:
+        json.dump(run, sys.stdout, indent=1, sort_keys=True)
+        print
+    else:
+        fid = open(options.output, 'w')
+        json.dump(run, fid, indent=1, sort_keys=True)
+        fid.close()
+
+    if options.compare is not None:
+        fid = open(options.compare)
+        base_run = json.load(fid)
+        fid.close()
+        if compare(results, base_run['results']) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
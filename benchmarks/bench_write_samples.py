@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Benchmark text output: the original per-value write_samples loop versus
+the block-wise formatter. Also checks the output is byte for byte the
+same.
+
+usage: python benchmarks/bench_write_samples.py [-n sample_num] [-c nchans]
+"""
+import os
+import sys
+import time
+import optparse
+import tempfile
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simple_daq.formats import write_samples
+
+
+def loop_write_samples(fid, t, samples):
+    """
+    The original write_samples implementation.
+    """
+    for i in xrange(0,t.shape[0]):
+        fid.write('%f '%(t[i],))
+        for j in range(0,samples.shape[1]):
+            fid.write('%f '%(samples[i,j],))
+        fid.write('\n')
+
+
+def time_write(func, t, samples):
+    """
+    Returns (time, output file contents) for writing with func.
+    """
+    fid = tempfile.TemporaryFile()
+    t0 = time.time()
+    func(fid, t, samples)
+    fid.flush()
+    dt = time.time() - t0
+    fid.seek(0)
+    return dt, fid.read()
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [OPTION]...')
+    parser.add_option('-n', '--sample_num', type='int', dest='sample_num', default=1000000)
+    parser.add_option('-c', '--nchans', type='int', dest='nchans', default=8)
+    options, args = parser.parse_args()
+
+    n = options.sample_num
+    t = numpy.arange(n)*1.0e-5
+    samples = numpy.random.uniform(-10.0, 10.0, (n, options.nchans))
+
+    loop_time, loop_out = time_write(loop_write_samples, t, samples)
+    block_time, block_out = time_write(write_samples, t, samples)
+
+    print 'rows: %d x %d channels'%(n, options.nchans)
+    print '\tloop:  %8.3f sec, %10.0f rows/sec'%(loop_time, n/loop_time)
+    print '\tblock: %8.3f sec, %10.0f rows/sec, speedup %.1fx'%(block_time, n/block_time, loop_time/block_time)
+    print '\toutput identical:', loop_out == block_out
+
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,8 @@ setup(name='simple_daq',
         'console_scripts': [
             'daq-acquire = simple_daq:daq_acquire_main',
             'plot-daq = simple_daq:plot_daq_main',
+            'daq-server = simple_daq:daq_server_main',
+            'daq-query = simple_daq:daq_query_main',
             ]
         }
      )
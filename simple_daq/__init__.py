@@ -21,5 +21,4 @@ You should have received a copy of the GNU Lesser General Public
 License along with simple_daq.  If not, see
 <http://www.gnu.org/licenses/>.  
 """
-import pkg_resources
 from simple_daq import *
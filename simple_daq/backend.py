@@ -0,0 +1,605 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Device backends for data acquisition. A backend provides open,
+command test/execution, a file-descriptor for reading samples,
+maxdata/range lookup and close. ComediDevice uses the comedi python
+bindings and SimulatedDevice generates deterministic waveforms at the
+commanded sample rate (or as fast as possible) so that the read,
+conversion and output paths can be tested and benchmarked without a daq
+card.
+
+Simulated devices are selected with a device string of the form
+
+    sim[:key=value,key=value,...]
+
+where the keys are
+
+    speed    - sample rate multiplier, 0 = as fast as possible (default 1)
+    maxdata  - maximum sample code (default 65535)
+    range    - full scale range in volts for gain 0 (default 10)
+    freq     - base waveform frequency in Hz (default 1)
+    mmap     - 1 = provide a file backed kernel buffer for the mmap read
+               engine instead of a pipe (default 0)
+    poly     - 1 = report a (slightly non-linear) calibration polynomial
+               for each channel (default 0)
+
+"""
+import os
+import time
+import mmap
+import errno
+import tempfile
+import threading
+import numpy
+
+# Comedi trigger sources, reference modes and subdevice flags. The values
+# are those of comedi.h so they can be used with either backend.
+TRIG_NONE = 0x0001
+TRIG_NOW = 0x0002
+TRIG_FOLLOW = 0x0004
+TRIG_TIME = 0x0008
+TRIG_TIMER = 0x0010
+TRIG_COUNT = 0x0020
+TRIG_EXT = 0x0040
+TRIG_INT = 0x0080
+
+AREF_GROUND = 0x00
+AREF_COMMON = 0x01
+AREF_DIFF = 0x02
+
+SDF_BUSY = 0x0001
+SDF_SOFT_CALIBRATED = 0x2000
+SDF_RUNNING = 0x08000000
+
+UNIT_VOLT = 0
+
+SIM_PREFIX = 'sim'
+
+# Simulated device defaults
+SIM_DEFAULT_SPEED = 1.0
+SIM_DEFAULT_MAXDATA = 65535
+SIM_DEFAULT_RANGE = 10.0
+SIM_DEFAULT_FREQ = 1.0
+SIM_TIMER_BASE = 50          # ns, driver timer resolution
+SIM_BLOCK_SCANS = 4096       # scans generated per write
+SIM_BUFFER_SIZE = 1 << 20    # bytes, size of simulated kernel buffer
+
+
+def get_device(device):
+    """
+    Returns the backend for the device string - a SimulatedDevice for
+    strings starting with 'sim' otherwise a ComediDevice.
+    """
+    if device.split(':')[0] == SIM_PREFIX:
+        return SimulatedDevice.from_string(device)
+    return ComediDevice(device)
+
+
+def cr_pack(chan, rng, aref):
+    """
+    Pack channel, range and reference - same as comedi CR_PACK.
+    """
+    return ((aref & 0x3) << 24) | ((rng & 0xff) << 16) | (chan & 0xffff)
+
+
+def cr_unpack(chanspec):
+    """
+    Returns (chan, rng, aref) from packed chanspec.
+    """
+    return chanspec & 0xffff, (chanspec >> 16) & 0xff, (chanspec >> 24) & 0x3
+
+
+class Device(object):
+    """
+    Base class for device backends.
+    """
+
+    def open(self):
+        """
+        Open the device. Raises IOError on failure.
+        """
+        raise NotImplementedError
+
+    # False if samples can only be read through the kernel buffer (see
+    # buffer), not with read on the file-descriptor
+    fd_readable = True
+
+    def fileno(self):
+        """
+        Returns file-descriptor for reading samples.
+        """
+        raise NotImplementedError
+
+    def cmd_struct(self, chanspecs):
+        """
+        Returns an empty command structure whose chanlist holds the packed
+        chanspecs (see cr_pack).
+        """
+        raise NotImplementedError
+
+    def command_test(self, cmd):
+        """
+        Test and adjust the command. Returns comedi_command_test code.
+        """
+        raise NotImplementedError
+
+    def command(self, cmd):
+        """
+        Execute command (non blocking). Returns 0 on success.
+        """
+        raise NotImplementedError
+
+    def cancel(self, subdev):
+        raise NotImplementedError
+
+    def get_maxdata(self, subdev, channel):
+        raise NotImplementedError
+
+    def get_range(self, subdev, channel, gain):
+        """
+        Returns (min, max, unit) of range for channel and gain.
+        """
+        raise NotImplementedError
+
+    def get_polynomial(self, subdev, channel, gain):
+        """
+        Returns calibration polynomial (coefficients, expansion_origin) for
+        converting sample codes of channel and gain to physical units, as
+        used by comedi_to_physical, or None if the device is not calibrated.
+        """
+        return None
+
+    def buffer(self, subdev):
+        """
+        Returns kernel buffer operations for use by MmapReader. Raises
+        EnvironmentError if the buffer cannot be accessed.
+        """
+        raise EnvironmentError, 'kernel buffer access not supported'
+
+    def close(self):
+        raise NotImplementedError
+
+
+class ComediDevice(Device):
+    """
+    Comedi device backend.
+    """
+
+    def __init__(self, path):
+        import comedi
+        self.c = comedi
+        self.path = path
+        self.dev = None
+        self.calibration = None
+        self.chanlist = None
+
+    def open(self):
+        self.dev = self.c.comedi_open(self.path)
+        if not self.dev:
+            self.dev = None
+            raise IOError, 'unable to open comedi device %s'%(self.path,)
+
+    def fileno(self):
+        return self.c.comedi_fileno(self.dev)
+
+    def cmd_struct(self, chanspecs):
+        """
+        The command only holds a pointer to the chanlist array, so the array
+        is filled first and kept alive on the device for as long as the
+        command may be used.
+        """
+        nchans = len(chanspecs)
+        channel_list = self.c.chanlist(nchans)
+        for i in range(nchans):
+            channel_list[i] = chanspecs[i]
+        self.chanlist = channel_list
+        cmd = self.c.comedi_cmd_struct()
+        cmd.chanlist = channel_list
+        cmd.chanlist_len = nchans
+        return cmd
+
+    def command_test(self, cmd):
+        return self.c.comedi_command_test(self.dev, cmd)
+
+    def command(self, cmd):
+        return self.c.comedi_command(self.dev, cmd)
+
+    def cancel(self, subdev):
+        return self.c.comedi_cancel(self.dev, subdev)
+
+    def get_maxdata(self, subdev, channel):
+        return self.c.comedi_get_maxdata(self.dev, subdev, channel)
+
+    def get_range(self, subdev, channel, gain):
+        cr = self.c.comedi_get_range(self.dev, subdev, channel, gain)
+        return cr.min, cr.max, cr.unit
+
+    def get_subdevice_flags(self, subdev):
+        return self.c.comedi_get_subdevice_flags(self.dev, subdev)
+
+    def get_polynomial(self, subdev, channel, gain):
+        """
+        Software calibrated subdevices use the softcal converter from the
+        device's default calibration file, others the hardcal converter.
+        """
+        c = self.c
+        if not hasattr(c, 'comedi_polynomial_t'):
+            # Bindings for comedilib older than 0.8
+            return None
+        poly = c.comedi_polynomial_t()
+        flags = c.comedi_get_subdevice_flags(self.dev, subdev)
+        if flags & SDF_SOFT_CALIBRATED:
+            if self.calibration is None:
+                path = c.comedi_get_default_calibration_path(self.dev)
+                self.calibration = c.comedi_parse_calibration_file(path)
+                if not self.calibration:
+                    self.calibration = None
+                    return None
+            ret = c.comedi_get_softcal_converter(subdev, channel, gain, c.COMEDI_TO_PHYSICAL,
+                                                 self.calibration, poly)
+        else:
+            ret = c.comedi_get_hardcal_converter(self.dev, subdev, channel, gain,
+                                                 c.COMEDI_TO_PHYSICAL, poly)
+        if ret < 0:
+            return None
+        coefficients = [poly.coefficients[i] for i in range(poly.order + 1)]
+        return coefficients, poly.expansion_origin
+
+    def buffer(self, subdev):
+        if not hasattr(self.c, 'comedi_get_buffer_contents'):
+            raise EnvironmentError, 'comedi bindings have no buffer functions'
+        return ComediBuffer(self, subdev)
+
+    def close(self):
+        if self.calibration is not None:
+            self.c.comedi_cleanup_calibration(self.calibration)
+            self.calibration = None
+        if self.dev is not None:
+            self.c.comedi_close(self.dev)
+            self.dev = None
+
+
+class ComediBuffer(object):
+    """
+    Comedi kernel buffer operations for a subdevice as used by MmapReader.
+    """
+
+    def __init__(self, device, subdev):
+        self.c = device.c
+        self.dev = device.dev
+        self.subdev = subdev
+
+    def size(self):
+        return self.c.comedi_get_buffer_size(self.dev, self.subdev)
+
+    def contents(self):
+        return self.c.comedi_get_buffer_contents(self.dev, self.subdev)
+
+    def offset(self):
+        return self.c.comedi_get_buffer_offset(self.dev, self.subdev)
+
+    def mark_read(self, nbytes):
+        return self.c.comedi_mark_buffer_read(self.dev, self.subdev, nbytes)
+
+    def running(self):
+        flags = self.c.comedi_get_subdevice_flags(self.dev, self.subdev)
+        return bool(flags & SDF_RUNNING)
+
+
+class SimCmd(object):
+    """
+    Command structure for the simulated device.
+    """
+
+    def __init__(self, chanspecs):
+        nchans = len(chanspecs)
+        self.subdev = 0
+        self.flags = 0
+        self.start_src = TRIG_NOW
+        self.start_arg = 0
+        self.scan_begin_src = TRIG_TIMER
+        self.scan_begin_arg = 0
+        self.convert_src = TRIG_TIMER
+        self.convert_arg = 0
+        self.scan_end_src = TRIG_COUNT
+        self.scan_end_arg = nchans
+        self.stop_src = TRIG_COUNT
+        self.stop_arg = 0
+        self.chanlist = list(chanspecs)
+        self.chanlist_len = nchans
+
+
+class SimulatedDevice(Device):
+    """
+    Simulated device which writes deterministic waveforms to a pipe (or a
+    file backed kernel buffer) from a background thread. Channel k is a
+    sine wave of frequency (k+1)*freq with amplitude 0.9*full scale.
+    """
+
+    def __init__(self, speed=SIM_DEFAULT_SPEED, maxdata=SIM_DEFAULT_MAXDATA,
+                 range=SIM_DEFAULT_RANGE, freq=SIM_DEFAULT_FREQ, use_mmap=False,
+                 poly=False):
+        self.speed = float(speed)
+        self.maxdata = int(maxdata)
+        self.range = float(range)
+        self.freq = float(freq)
+        self.use_mmap = use_mmap
+        # The buffer file can not be read like the device
+        self.fd_readable = not use_mmap
+        self.poly = poly
+        self.is_open = False
+        self.thread = None
+        self.running = False
+        self.flags = 0
+
+    @classmethod
+    def from_string(cls, device):
+        """
+        Create simulated device from 'sim[:key=value,...]' string.
+        """
+        kwargs = {}
+        parts = device.split(':', 1)
+        if len(parts) == 2 and parts[1]:
+            for item in parts[1].split(','):
+                try:
+                    key, value = item.split('=')
+                except ValueError:
+                    raise ValueError, "invalid simulated device option '%s'"%(item,)
+                key = key.strip().lower()
+                if key == 'mmap':
+                    kwargs['use_mmap'] = bool(int(value))
+                elif key == 'poly':
+                    kwargs['poly'] = bool(int(value))
+                elif key in ('speed', 'maxdata', 'range', 'freq'):
+                    kwargs[key] = float(value)
+                else:
+                    raise ValueError, "unknown simulated device option '%s'"%(key,)
+        return cls(**kwargs)
+
+    def open(self):
+        if self.use_mmap:
+            self.buf_file = tempfile.TemporaryFile()
+            self.buf_file.truncate(SIM_BUFFER_SIZE)
+            self.read_fd = self.buf_file.fileno()
+            self.buf_map = mmap.mmap(self.read_fd, SIM_BUFFER_SIZE)
+            self.buf_head = 0
+            self.buf_tail = 0
+            self.buf_lock = threading.Lock()
+        else:
+            self.read_fd, self.write_fd = os.pipe()
+        self.is_open = True
+
+    def fileno(self):
+        return self.read_fd
+
+    def cmd_struct(self, chanspecs):
+        return SimCmd(chanspecs)
+
+    def command_test(self, cmd):
+        """
+        Round timer arguments to the timer resolution and make sure the
+        scan period is long enough for the conversions, like a driver.
+        """
+        if cmd.chanlist_len <= 0:
+            return 5
+        ret = 0
+        for name in ('scan_begin_arg', 'convert_arg'):
+            value = getattr(cmd, name)
+            rounded = max(SIM_TIMER_BASE*int(round(float(value)/SIM_TIMER_BASE)), SIM_TIMER_BASE)
+            if rounded != value:
+                setattr(cmd, name, rounded)
+                ret = 3
+        if cmd.convert_arg*cmd.chanlist_len > cmd.scan_begin_arg:
+            cmd.scan_begin_arg = cmd.convert_arg*cmd.chanlist_len
+            ret = 4
+        return ret
+
+    def command(self, cmd):
+        if not self.is_open or self.running:
+            return -1
+        if not self.use_mmap and self.write_fd is None:
+            # Re-arm after a finished command - new pipe on the same read
+            # file-descriptor, as comedi keeps the device fd across commands
+            read_fd, self.write_fd = os.pipe()
+            os.dup2(read_fd, self.read_fd)
+            os.close(read_fd)
+        self.cmd = cmd
+        self.channels = [cr_unpack(x)[0] for x in cmd.chanlist[:cmd.chanlist_len]]
+        self.gains = [cr_unpack(x)[1] for x in cmd.chanlist[:cmd.chanlist_len]]
+        self.running = True
+        self.flags = SDF_BUSY | SDF_RUNNING
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return 0
+
+    def waveform(self, index, nscans):
+        """
+        Returns (nscans, nchans) uint16 array of samples starting at scan
+        index.
+        """
+        period = self.cmd.scan_begin_arg*1.0e-9
+        t = (index + numpy.arange(nscans, dtype=numpy.float64))*period
+        freq = self.freq*(numpy.array(self.channels, dtype=numpy.float64) + 1)
+        amp = 0.45*self.maxdata
+        data = numpy.sin((2*numpy.pi*t)[:,None]*freq[None,:])*amp + 0.5*self.maxdata
+        return numpy.round(data).astype(numpy.uint16)
+
+    def run(self):
+        """
+        Generate samples until stop_arg scans are written or the command is
+        cancelled.
+        """
+        if self.cmd.stop_src == TRIG_COUNT:
+            scans_total = self.cmd.stop_arg
+        else:
+            scans_total = None
+        scan_rate = 1.0e9/self.cmd.scan_begin_arg
+        t_start = time.time()
+        index = 0
+        try:
+            while self.running and (scans_total is None or index < scans_total):
+                nscans = SIM_BLOCK_SCANS
+                if scans_total is not None:
+                    nscans = min(nscans, scans_total - index)
+                if self.speed > 0:
+                    # Pace output to the (scaled) sample rate
+                    due = int((time.time() - t_start)*scan_rate*self.speed)
+                    if due <= index:
+                        time.sleep(min(SIM_BLOCK_SCANS/(scan_rate*self.speed), 0.01))
+                        continue
+                    nscans = min(nscans, due - index)
+                self.write(self.waveform(index, nscans).tostring())
+                index += nscans
+        except (IOError, OSError), err:
+            if err.args[0] != errno.EPIPE:
+                raise
+        self.running = False
+        self.flags = 0
+        if not self.use_mmap:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    def write(self, data):
+        """
+        Write bytes to the pipe or simulated kernel buffer.
+        """
+        if not self.use_mmap:
+            pos = 0
+            while pos < len(data):
+                pos += os.write(self.write_fd, data[pos:])
+            return
+        pos = 0
+        while pos < len(data) and self.running:
+            self.buf_lock.acquire()
+            free = SIM_BUFFER_SIZE - (self.buf_head - self.buf_tail)
+            self.buf_lock.release()
+            offset = self.buf_head % SIM_BUFFER_SIZE
+            n = min(free, len(data) - pos, SIM_BUFFER_SIZE - offset)
+            if n <= 0:
+                time.sleep(0.0005)
+                continue
+            self.buf_map[offset:offset + n] = data[pos:pos + n]
+            self.buf_lock.acquire()
+            self.buf_head += n
+            self.buf_lock.release()
+            pos += n
+
+    def cancel(self, subdev):
+        self.running = False
+        if self.thread is not None:
+            if not self.use_mmap:
+                # Unblock writer waiting on a full pipe
+                try:
+                    while self.thread.isAlive():
+                        if not os.read(self.read_fd, 1 << 16):
+                            break
+                except OSError:
+                    pass
+            self.thread.join()
+            self.thread = None
+        if self.use_mmap and self.is_open:
+            # Discard unread data like comedi_cancel
+            self.buf_lock.acquire()
+            self.buf_tail = self.buf_head
+            self.buf_lock.release()
+        return 0
+
+    def get_maxdata(self, subdev, channel):
+        return self.maxdata
+
+    def get_range(self, subdev, channel, gain):
+        full_scale = self.range/(2**gain)
+        return -full_scale, full_scale, UNIT_VOLT
+
+    def get_polynomial(self, subdev, channel, gain):
+        """
+        Linear range plus small channel dependent offset, gain error and
+        quadratic term when poly is set.
+        """
+        if not self.poly:
+            return None
+        range_min, range_max, unit = self.get_range(subdev, channel, gain)
+        origin = 0.5*self.maxdata
+        scale = (range_max - range_min)/self.maxdata
+        c0 = 0.5*(range_min + range_max) + 1.0e-3*(channel + 1)*range_max
+        c1 = scale*(1.0 + 1.0e-3*(channel + 1))
+        c2 = -1.0e-2*range_max/(origin*origin)
+        return [c0, c1, c2], origin
+
+    def get_subdevice_flags(self, subdev):
+        return self.flags
+
+    def buffer(self, subdev):
+        if not self.use_mmap:
+            raise EnvironmentError, 'simulated device not using mmap buffer'
+        return SimulatedBuffer(self)
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.cancel(0)
+        if self.use_mmap:
+            self.buf_map.close()
+            self.buf_file.close()
+        else:
+            os.close(self.read_fd)
+            if self.write_fd is not None:
+                os.close(self.write_fd)
+                self.write_fd = None
+        self.is_open = False
+
+
+class SimulatedBuffer(object):
+    """
+    Kernel buffer operations for the simulated device's file backed buffer.
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def size(self):
+        return SIM_BUFFER_SIZE
+
+    def contents(self):
+        dev = self.device
+        dev.buf_lock.acquire()
+        nbytes = dev.buf_head - dev.buf_tail
+        dev.buf_lock.release()
+        return nbytes
+
+    def offset(self):
+        return self.device.buf_tail % SIM_BUFFER_SIZE
+
+    def mark_read(self, nbytes):
+        dev = self.device
+        dev.buf_lock.acquire()
+        dev.buf_tail += nbytes
+        dev.buf_lock.release()
+        return 0
+
+    def running(self):
+        return self.device.running
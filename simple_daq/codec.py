@@ -0,0 +1,210 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Codecs for the chunks of the chunked format. A chunk of raw
+sample codes is stored channel by channel, so the samples of a slowly
+varying channel are next to each other, passed through the filters and
+compressed with a compressor:
+
+    filters      delta   - difference from the previous sample of the
+                           channel (modulo 2**16, so it is lossless)
+                 shuffle - high bytes of all samples, then the low bytes
+
+    compressors  zlib, bz2, lzma (if the lzma module, or backports.lzma,
+                 is installed) and none. Others can be added with
+                 register_compressor.
+
+Each chunk is encoded on its own so it can be decoded without the rest
+of the file. CompressPool encodes chunks in worker threads - zlib, bz2
+and lzma release the interpreter lock while compressing.
+
+"""
+import sys
+import zlib
+import bz2
+import threading
+import Queue
+import numpy
+
+FILTERS = ('delta', 'shuffle')
+DEFAULT_FILTERS = ('delta', 'shuffle')
+DEFAULT_COMPRESSOR = 'zlib'
+DEFAULT_LEVEL = 1
+DEFAULT_THREADS = 2
+
+COMPRESSORS = {}
+
+
+def register_compressor(name, compress, decompress):
+    """
+    Add compressor name - compress(data, level) and decompress(data) take
+    and return strings.
+    """
+    COMPRESSORS[name] = (compress, decompress)
+
+
+register_compressor('zlib', zlib.compress, zlib.decompress)
+register_compressor('bz2', lambda data, level: bz2.compress(data, min(max(level, 1), 9)),
+                    bz2.decompress)
+register_compressor('none', lambda data, level: data, lambda data: data)
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+if lzma is not None:
+    register_compressor('lzma', lambda data, level: lzma.compress(data, preset=min(max(level, 0), 9)),
+                        lzma.decompress)
+
+
+def get_compressor(name):
+    """
+    Returns (compress, decompress) functions of compressor name.
+    """
+    try:
+        return COMPRESSORS[name]
+    except KeyError:
+        if name == 'lzma':
+            raise ValueError, 'lzma compressor requires the lzma module (or backports.lzma)'
+        raise ValueError, "unknown compressor '%s'"%(name,)
+
+
+def parse_filters(filters):
+    """
+    Returns tuple of filter names from a list or a string of names
+    separated by '+' ('' or 'none' for no filters).
+    """
+    if filters is None:
+        return ()
+    if isinstance(filters, basestring):
+        filters = [x for x in filters.split('+') if x and x != 'none']
+    for name in filters:
+        if not name in FILTERS:
+            raise ValueError, "unknown filter '%s'"%(name,)
+    return tuple(filters)
+
+
+def encode_chunk(chunk, compressor=DEFAULT_COMPRESSOR, filters=DEFAULT_FILTERS, level=DEFAULT_LEVEL):
+    """
+    Returns compressed string of (nscans, nchans) chunk of uint16 sample
+    codes.
+    """
+    data = numpy.array(chunk.T, dtype='<u2', order='C')
+    if 'delta' in filters:
+        data[:,1:] = numpy.diff(data, axis=1)
+    if 'shuffle' in filters:
+        pairs = data.reshape(-1).view(numpy.uint8).reshape((-1, 2))
+        data = numpy.empty((2, pairs.shape[0]), dtype=numpy.uint8)
+        data[0] = pairs[:,1]
+        data[1] = pairs[:,0]
+    return get_compressor(compressor)[0](data.tostring(), level)
+
+
+def decode_chunk(data, nchans, compressor=DEFAULT_COMPRESSOR, filters=DEFAULT_FILTERS):
+    """
+    Returns (nscans, nchans) array of sample codes from a string encoded
+    by encode_chunk.
+    """
+    data = get_compressor(compressor)[1](data)
+    if 'shuffle' in filters:
+        planes = numpy.frombuffer(data, dtype=numpy.uint8).reshape((2, -1))
+        pairs = numpy.empty((planes.shape[1], 2), dtype=numpy.uint8)
+        pairs[:,1] = planes[0]
+        pairs[:,0] = planes[1]
+        data = pairs
+    data = numpy.frombuffer(data, dtype='<u2').reshape((nchans, -1))
+    if 'delta' in filters:
+        data = numpy.cumsum(data, axis=1, dtype='<u2')
+    return data.T
+
+
+class CompressPool(object):
+    """
+    Threads which encode chunks with encode_chunk. submit returns a Job
+    whose result waits for the encoded string.
+    """
+
+    def __init__(self, threads=DEFAULT_THREADS):
+        self.queue = Queue.Queue()
+        self.threads = []
+        for i in range(threads):
+            thread = threading.Thread(target=self.run)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            job.run()
+
+    def submit(self, chunk, compressor, filters, level):
+        job = Job(encode_chunk, (chunk, compressor, filters, level))
+        self.queue.put(job)
+        return job
+
+    def close(self):
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+class Job(object):
+    """
+    Function call run by a CompressPool thread.
+    """
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args)
+        except BaseException:
+            self.error = sys.exc_info()
+        self.event.set()
+
+    def done(self):
+        return self.event.isSet()
+
+    def result(self):
+        """
+        Returns the function's value, waiting for it if necessary, or
+        raises its exception.
+        """
+        self.event.wait()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
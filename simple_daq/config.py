@@ -0,0 +1,163 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Resolution of the daq-acquire configuration from its layers -
+command line options, configuration files and defaults. Each option takes
+its value from the first layer which has it, the merged values are checked
+and converted once (by process_config in simple_daq.py) and the result is
+a read only Config.
+
+"""
+import os
+
+# Parsed configuration files, path -> (modification time, options)
+FILE_CACHE = {}
+
+
+def parse_config_file(filename):
+    """
+    Parse configuration file. Returns a dictionary of option name (lower
+    case) to value string. Each line holds an option name followed by its
+    value; blank lines and lines starting with a '#' word are skipped.
+    The parsed options are cached by the file's modification time, so a
+    program which resolves its configuration many times only parses the
+    file again when it changes.
+    """
+    path = os.path.abspath(filename)
+    fid = open(path)
+    try:
+        mtime = os.fstat(fid.fileno()).st_mtime
+        cached = FILE_CACHE.get(path)
+        if cached is not None and cached[0] == mtime:
+            return dict(cached[1])
+        config = {}
+        for line in fid:
+            line = line.split()
+            if len(line) == 0:
+                continue
+            if line[0] == '#':
+                continue
+            config[line[0].lower()] = ' '.join(line[1:])
+    finally:
+        fid.close()
+    FILE_CACHE[path] = (mtime, config)
+    return dict(config)
+
+
+class ConfigSource(dict):
+    """
+    Name of the layer each option came from, for error messages. Options
+    not in the dictionary are from default_name.
+    """
+
+    def __init__(self, default_name='combined config'):
+        dict.__init__(self)
+        self.default_name = default_name
+
+    def __missing__(self, key):
+        return self.default_name
+
+
+class Config(object):
+    """
+    Resolved configuration - a read only mapping of option name to value
+    which can also be read as attributes, e.g. config['sample_freq'] or
+    config.sample_freq. sources gives the layer each option came from.
+    """
+
+    def __init__(self, values, sources=None):
+        object.__setattr__(self, '_values', dict(values))
+        object.__setattr__(self, 'sources', sources or ConfigSource())
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __getattr__(self, key):
+        if key.startswith('__') or key == '_values':
+            raise AttributeError, key
+        try:
+            return self._values[key]
+        except KeyError:
+            raise AttributeError, key
+
+    def __setattr__(self, key, value):
+        raise TypeError, 'configuration is read only - use replace'
+
+    def __setitem__(self, key, value):
+        raise TypeError, 'configuration is read only - use replace'
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def keys(self):
+        return self._values.keys()
+
+    def items(self):
+        return self._values.items()
+
+    def replace(self, **changes):
+        """
+        Returns copy of the configuration with the given options changed.
+        The new values are used as they are so they must already be of the
+        processed type.
+        """
+        values = dict(self._values)
+        values.update(changes)
+        sources = ConfigSource(self.sources.default_name)
+        sources.update(self.sources)
+        for key in changes:
+            sources[key] = 'program'
+        return Config(values, sources)
+
+    def __repr__(self):
+        return 'Config(%r)'%(self._values,)
+
+
+def resolve_config(layers, process=None):
+    """
+    Returns Config from layers, a list of (source name, dictionary of option
+    values) from highest to lowest precedence. process(values, sources),
+    if given, is called once on the merged values to check and convert
+    them in place.
+    """
+    values = {}
+    sources = ConfigSource()
+    for name, layer in layers:
+        for key, value in layer.items():
+            if not key in values:
+                values[key] = value
+                sources[key] = name
+    if process is not None:
+        process(values, sources)
+    return Config(values, sources)
@@ -0,0 +1,216 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Conversion of raw (interleaved, unsigned) sample codes read from
+a comedi device into physical units. The channel ranges and maxdata
+values are looked up once and the whole buffer is converted with a single
+vectorized numpy operation rather than calling comedi_to_phys per sample.
+
+Calibrated devices give a polynomial per channel (comedi_to_physical with
+the softcal or hardcal converter). For converters of up to 16 bits the
+polynomials are evaluated once for every sample code into a lookup table
+and the buffer is converted with a single take from the tables.
+
+"""
+import numpy
+
+# Out of range behavior - matches comedi_set_global_oor_behavior
+OOR_NAN = 'nan'
+OOR_NUMBER = 'number'
+
+# Unit names for comedi range unit codes (UNIT_volt, UNIT_mA, UNIT_none)
+UNIT_NAMES = {0: 'V', 1: 'mA', 2: ''}
+
+# Largest number of sample codes converted with a lookup table
+LUT_MAX_CODES = 1 << 16
+
+
+def converter_from_info(info, oor=OOR_NAN):
+    """
+    Returns RawConverter for the acquisition information written by
+    daq-acquire (see formats).
+    """
+    return RawConverter(info['ranges'], info['maxdata'], oor, info.get('polynomials'))
+
+
+def polyval(coefficients, origin, x):
+    """
+    Evaluate calibration polynomial sum c[i]*(x - origin)**i, as in
+    comedi_to_physical.
+    """
+    x = numpy.asarray(x, dtype=numpy.float64) - origin
+    y = numpy.zeros(x.shape, dtype=numpy.float64)
+    for c in reversed(coefficients):
+        y *= x
+        y += c
+    return y
+
+
+class RawConverter(object):
+    """
+    Converts interleaved raw sample codes to physical units.
+
+    ranges is a list with one (min, max, unit) tuple per channel and
+    maxdata is a list with the maximum sample code for each channel.
+    polynomials is an optional list with a calibration polynomial
+    (coefficients, expansion_origin) or None for each channel. Channels
+    without a polynomial are converted linearly from their range.
+    """
+
+    def __init__(self, ranges, maxdata, oor=OOR_NAN, polynomials=None):
+        if len(ranges) != len(maxdata):
+            raise ValueError, 'number of ranges must equal number of maxdata values'
+        if not oor in (OOR_NAN, OOR_NUMBER):
+            raise ValueError, "unknown out of range behavior '%s'"%(oor,)
+        if polynomials is not None and len(polynomials) != len(ranges):
+            raise ValueError, 'number of polynomials must equal number of ranges'
+        self.nchans = len(ranges)
+        self.ranges = [tuple(r) for r in ranges]
+        self.units = [r[2] for r in ranges]
+        self.oor = oor
+        self.maxdata = numpy.array(maxdata, dtype=numpy.uint32)
+        range_min = numpy.array([r[0] for r in ranges], dtype=numpy.float64)
+        range_max = numpy.array([r[1] for r in ranges], dtype=numpy.float64)
+        self.scale = (range_max - range_min)/self.maxdata
+        self.offset = range_min
+        self.polynomials = None
+        if polynomials is not None and [p for p in polynomials if p]:
+            self.polynomials = []
+            for p in polynomials:
+                if p:
+                    p = (list(p[0]), float(p[1]))
+                else:
+                    p = None
+                self.polynomials.append(p)
+        self.tables = {}
+
+    def calibrated(self):
+        """
+        Returns True if any channel has a calibration polynomial.
+        """
+        return self.polynomials is not None
+
+    def get_table(self, dtype):
+        """
+        Returns flat lookup table of type dtype holding the value of every
+        sample code, channel after channel, with LUT_MAX_CODES entries per
+        channel, or None if the codes do not fit. Out of range codes are NaN
+        in the table for OOR_NAN.
+        """
+        dtype = numpy.dtype(dtype)
+        if dtype in self.tables:
+            return self.tables[dtype]
+        if self.maxdata.max() >= LUT_MAX_CODES:
+            table = None
+        else:
+            codes = numpy.arange(LUT_MAX_CODES)
+            table = numpy.empty((self.nchans, LUT_MAX_CODES), dtype=dtype)
+            for i in range(self.nchans):
+                table[i] = self.convert_codes(i, codes)
+                if self.oor == OOR_NAN:
+                    table[i, 0] = numpy.nan
+                    table[i, self.maxdata[i]:] = numpy.nan
+            table = table.ravel()
+        self.tables[dtype] = table
+        return table
+
+    def convert_codes(self, i, codes):
+        """
+        Returns float64 values of sample codes of column i.
+        """
+        if self.polynomials is not None and self.polynomials[i] is not None:
+            coefficients, origin = self.polynomials[i]
+            return polyval(coefficients, origin, codes)
+        return codes*self.scale[i] + self.offset[i]
+
+    def scans(self, raw):
+        """
+        Returns a (scan_num, nchans) view of the interleaved raw data.
+        """
+        raw = numpy.asarray(raw)
+        if raw.ndim == 2 and raw.shape[1] == self.nchans:
+            return raw
+        if raw.size % self.nchans != 0:
+            raise ValueError, 'raw data is not a whole number of scans'
+        return raw.reshape((raw.size//self.nchans, self.nchans))
+
+    def out_of_range(self, raw):
+        """
+        Returns a boolean (scan_num, nchans) array which is True where the
+        raw sample code is 0 or maxdata, i.e. where the converter saturated.
+        """
+        raw = self.scans(raw)
+        return (raw == 0) | (raw == self.maxdata)
+
+    def convert(self, raw, dtype=numpy.float64, out=None):
+        """
+        Convert raw sample codes to physical units. Returns a (scan_num,
+        nchans) array of type dtype. Out of range codes are set to NaN when
+        the out of range behavior is OOR_NAN (the comedi default).
+        """
+        raw = self.scans(raw)
+        if out is None:
+            out = numpy.empty(raw.shape, dtype=dtype)
+        if self.polynomials is not None:
+            return self.convert_calibrated(raw, out)
+        numpy.multiply(raw, self.scale.astype(out.dtype), out=out)
+        out += self.offset.astype(out.dtype)
+        if self.oor == OOR_NAN:
+            out[self.out_of_range(raw)] = numpy.nan
+        return out
+
+    def convert_calibrated(self, raw, out):
+        """
+        Convert with the calibration polynomials - a take from the lookup
+        tables, or evaluating the polynomials when there are no tables.
+        """
+        table = self.get_table(out.dtype)
+        if table is not None:
+            index = raw.astype(numpy.intp)
+            index += (numpy.arange(self.nchans)*LUT_MAX_CODES)[None,:]
+            table.take(index, out=out, mode='clip')
+            return out
+        for i in range(self.nchans):
+            out[:,i] = self.convert_codes(i, raw[:,i])
+        if self.oor == OOR_NAN:
+            out[self.out_of_range(raw)] = numpy.nan
+        return out
+
+    def select(self, channels):
+        """
+        Returns converter for the given subset of channels (column numbers).
+        """
+        ranges = [self.ranges[i] for i in channels]
+        maxdata = [int(self.maxdata[i]) for i in channels]
+        polynomials = None
+        if self.polynomials is not None:
+            polynomials = [self.polynomials[i] for i in channels]
+        return RawConverter(ranges, maxdata, self.oor, polynomials)
+
+    def unit_names(self):
+        """
+        Returns list of unit names for each channel.
+        """
+        return [UNIT_NAMES.get(u, '') for u in self.units]
@@ -0,0 +1,500 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Output file formats for acquired data. All writers take blocks
+of raw (scan_num, nchans) sample codes together with the scan index of
+the first scan in the block so they can be used with both single shot
+and streaming acquisitions. The formats are
+
+    text     - time column plus one column per channel in volts (default)
+    raw      - little-endian uint16 sample codes plus a json sidecar file
+               (<file>.json) with the channel ranges, maxdata, etc.
+    npy      - numpy .npy file of volts written through a memmap, plus
+               json sidecar
+    chunked  - chunked, compressed container of sample codes with a chunk
+               index holding the min, max and mean of each channel in
+               each chunk (.sdq), see codec.py for the chunk encoding
+
+The acquisition information (info) passed to the writers is a dictionary
+with the keys device, subdev, channels, gains, aref, ranges, maxdata,
+units, sample_freq, sample_period, convert_period, start_time and
+sample_num. Blocks which have been through a processing stage (see
+process.py) are already in physical units - their info has physical set to
+True, t0 set to the time of the first output scan and a columns list - and
+can only be written in the text and npy formats.
+
+"""
+import sys
+import os
+import json
+import zlib
+import struct
+import collections
+import numpy
+from convert import converter_from_info
+from timebase import TimeAxis
+
+FORMATS = ('text', 'raw', 'npy', 'chunked')
+
+# File extensions used to pick the format when none is given
+FORMAT_EXTENSIONS = {
+    '.raw': 'raw',
+    '.bin': 'raw',
+    '.npy': 'npy',
+    '.sdq': 'chunked',
+    }
+
+SIDECAR_EXT = '.json'
+
+# text writer settings
+TEXT_DEFAULT_PRECISION = 6      # digits after decimal point, same as '%f'
+TEXT_BLOCK_ROWS = 4096          # rows formatted per write
+
+# npy writer settings
+NPY_HEADER_LEN = 128            # bytes, fixed so shape can be rewritten
+NPY_GROW_SCANS = 1 << 16        # minimum number of scans to grow file by
+
+# chunked container layout
+CHUNKED_MAGIC = 'SDAQCHNK'
+CHUNKED_VERSION = 2                  # 1 - zlib only, no filters
+CHUNKED_CHUNK_MAGIC = 'CHNK'
+CHUNKED_INDEX_MAGIC = 'INDX'
+CHUNKED_STATS_MAGIC = 'STA2'         # 'STAT' - sample code statistics, ignored
+CHUNKED_END_MAGIC = 'SDAQEND!'
+CHUNKED_CHUNK_HEADER = '<4sQII'      # magic, index, nscans, nbytes
+CHUNKED_FOOTER = '<Q8s'              # index offset, end magic
+CHUNKED_DEFAULT_CHUNK_SIZE = 1 << 16 # scans per chunk
+CHUNKED_DEFAULT_LEVEL = 1            # codec.DEFAULT_LEVEL
+CHUNKED_DEFAULT_COMPRESSOR = 'zlib'  # codec.DEFAULT_COMPRESSOR
+CHUNKED_DEFAULT_FILTERS = 'delta+shuffle'
+CHUNKED_DEFAULT_THREADS = 2          # codec.DEFAULT_THREADS
+CHUNKED_INDEX_DTYPE = numpy.dtype([
+    ('index', '<u8'),
+    ('nscans', '<u4'),
+    ('offset', '<u8'),
+    ('nbytes', '<u4'),
+    ])
+
+
+def get_stats_dtype(nchans):
+    """
+    Returns dtype of the chunk statistics - min, max and mean in physical
+    units of each of nchans channels, and the number of samples they are
+    computed from.
+    """
+    return numpy.dtype([
+        ('min', '<f8', (nchans,)),
+        ('max', '<f8', (nchans,)),
+        ('mean', '<f8', (nchans,)),
+        ('count', '<u4', (nchans,)),
+        ])
+
+
+def get_chunk_stats(samples):
+    """
+    Returns (min, max, mean, count) statistics (see get_stats_dtype) of
+    (nscans, nchans) array of samples in physical units. Out of range (NaN)
+    samples are left out - count is the number of samples used and the
+    statistics of a channel with none are NaN.
+    """
+    valid = ~numpy.isnan(samples)
+    count = valid.sum(axis=0)
+    # fmin and fmax skip NaN, giving NaN only for a channel with none valid
+    low = numpy.fmin.reduce(samples, axis=0).astype(numpy.float64)
+    high = numpy.fmax.reduce(samples, axis=0).astype(numpy.float64)
+    if count.min() < samples.shape[0]:
+        samples = numpy.where(valid, samples, 0)
+    mean = samples.sum(axis=0, dtype=numpy.float64)/numpy.maximum(count, 1)
+    mean[count == 0] = numpy.nan
+    return low, high, mean, count
+
+
+def get_format(filename, fmt=None):
+    """
+    Returns output format - fmt if given otherwise determined from the
+    filename extension. Text is used when there is no filename.
+    """
+    if fmt is not None:
+        if not fmt in FORMATS:
+            raise ValueError, "unknown output format '%s'"%(fmt,)
+        return fmt
+    if filename is None:
+        return 'text'
+    ext = os.path.splitext(filename)[1].lower()
+    return FORMAT_EXTENSIONS.get(ext, 'text')
+
+
+def open_writer(filename, info, fmt=None, precision=TEXT_DEFAULT_PRECISION,
+                compressor=CHUNKED_DEFAULT_COMPRESSOR, filters=CHUNKED_DEFAULT_FILTERS,
+                level=CHUNKED_DEFAULT_LEVEL, threads=CHUNKED_DEFAULT_THREADS):
+    """
+    Open writer for output file. If filename is None text is written to
+    stdout. precision is only used by the text format and compressor,
+    filters, level and threads only by the chunked format.
+    """
+    fmt = get_format(filename, fmt)
+    if filename is None and fmt != 'text':
+        raise ValueError, '%s format requires an output file'%(fmt,)
+    if info.get('physical') and fmt in ('raw', 'chunked'):
+        raise ValueError, '%s format stores sample codes, not processed samples'%(fmt,)
+    if fmt == 'text':
+        return TextWriter(filename, info, precision)
+    elif fmt == 'raw':
+        return RawWriter(filename, info)
+    elif fmt == 'npy':
+        return NpyWriter(filename, info)
+    else:
+        return ChunkedWriter(filename, info, compressor=compressor, filters=filters,
+                             level=level, threads=threads)
+
+
+def decode_chunk(data, header):
+    """
+    Returns (nscans, nchans) array of sample codes from compressed chunk
+    data of a chunked file with the given header.
+    """
+    nchans = len(header['channels'])
+    if not 'filters' in header:
+        # Version 1 - zlib compressed scans
+        return numpy.frombuffer(zlib.decompress(data), dtype='<u2').reshape((-1, nchans))
+    import codec
+    return codec.decode_chunk(data, nchans, header['codec'], header['filters'])
+
+
+def write_samples(fid, t, samples, precision=TEXT_DEFAULT_PRECISION, block_rows=TEXT_BLOCK_ROWS):
+    """
+    Write time and samples to output file. Each row is the time followed
+    by the samples for each channel, each value formatted as '%.<precision>f '.
+    Rows are formatted block_rows at a time with a single string format
+    operation and written with one write call per block.
+    """
+    n = t.shape[0]
+    if samples.ndim == 1:
+        samples = samples.reshape((n, 1))
+    m = samples.shape[1]
+    row_fmt = ('%%.%df '%(precision,))*(m + 1) + '\n'
+    rows = numpy.empty((min(block_rows, n), m + 1), dtype=numpy.float64)
+    for i in xrange(0, n, block_rows):
+        j = min(i + block_rows, n)
+        block = rows[:j - i]
+        block[:,0] = t[i:j]
+        block[:,1:] = samples[i:j]
+        fid.write((row_fmt*(j - i))%tuple(block.ravel().tolist()))
+
+
+def write_sidecar(filename, info, scan_num):
+    """
+    Write json sidecar file with acquisition information.
+    """
+    sidecar = dict(info)
+    sidecar['scan_num'] = scan_num
+    fid = open(filename + SIDECAR_EXT, 'w')
+    json.dump(sidecar, fid, indent=2, sort_keys=True)
+    fid.close()
+
+
+class Writer(object):
+    """
+    Base class for output writers.
+    """
+
+    def __init__(self, filename, info):
+        self.filename = filename
+        self.info = info
+        self.nchans = len(info['channels'])
+        self.scan_num = 0
+
+    def write(self, index, raw):
+        """
+        Write (scan_num, nchans) block of raw sample codes starting at scan
+        index, or of samples if info['physical'] is set.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TextWriter(Writer):
+    """
+    Writes time and samples in volts as text.
+    """
+
+    def __init__(self, filename, info, precision=TEXT_DEFAULT_PRECISION):
+        Writer.__init__(self, filename, info)
+        self.precision = precision
+        if filename is None:
+            self.fid = sys.stdout
+        else:
+            self.fid = open(filename, 'w')
+        self.converter = None
+        if not info.get('physical'):
+            self.converter = converter_from_info(info)
+        self.period = info['sample_period']
+        self.t0 = info.get('t0', 0.0)
+
+    def write(self, index, raw):
+        t = TimeAxis(index, raw.shape[0], self.period)
+        if self.t0:
+            t = t + self.t0
+        samples = raw
+        if self.converter is not None:
+            samples = self.converter.convert(raw)
+        write_samples(self.fid, t, samples, self.precision)
+        self.scan_num = max(self.scan_num, index + raw.shape[0])
+
+    def close(self):
+        if self.fid is sys.stdout:
+            self.fid.flush()
+        else:
+            self.fid.close()
+
+
+class RawWriter(Writer):
+    """
+    Writes little-endian uint16 sample codes plus json sidecar.
+    """
+
+    def __init__(self, filename, info):
+        Writer.__init__(self, filename, info)
+        self.fid = open(filename, 'wb')
+        write_sidecar(filename, info, 0)
+
+    def write(self, index, raw):
+        self.fid.seek(index*self.nchans*2)
+        self.fid.write(numpy.ascontiguousarray(raw, dtype='<u2').data)
+        self.scan_num = max(self.scan_num, index + raw.shape[0])
+
+    def close(self):
+        self.fid.close()
+        write_sidecar(self.filename, self.info, self.scan_num)
+
+
+class NpyAppender(object):
+    """
+    Writes a (row_num, ncols) array to a .npy file through a memmap. The
+    file is grown as rows are requested so the number of rows need not be
+    known in advance, and the header is rewritten with the final shape on
+    close.
+    """
+
+    def __init__(self, filename, ncols, dtype=numpy.float64, row_num=None):
+        self.dtype = numpy.dtype(dtype).newbyteorder('<')
+        self.ncols = ncols
+        self.row_bytes = ncols*self.dtype.itemsize
+        self.fid = open(filename, 'w+b')
+        self.map = None
+        self.capacity = 0
+        self.row_num = 0
+        self.write_header(0)
+        if row_num:
+            self.grow(row_num)
+
+    def write_header(self, row_num):
+        """
+        Write npy version 1.0 header padded to NPY_HEADER_LEN bytes.
+        """
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d, %d), }"
+        header = header%(self.dtype.str, row_num, self.ncols)
+        header = header.ljust(NPY_HEADER_LEN - 10 - 1) + '\n'
+        self.fid.seek(0)
+        self.fid.write('\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header)
+
+    def grow(self, row_num):
+        """
+        Extend the file so it can hold at least row_num rows.
+        """
+        if row_num <= self.capacity:
+            return
+        capacity = max(row_num, self.capacity + NPY_GROW_SCANS, 2*self.capacity)
+        if self.map is not None:
+            self.map.flush()
+        self.map = None
+        self.fid.truncate(NPY_HEADER_LEN + capacity*self.row_bytes)
+        self.map = numpy.memmap(self.fid, dtype=self.dtype, mode='r+',
+                                offset=NPY_HEADER_LEN, shape=(capacity, self.ncols))
+        self.capacity = capacity
+
+    def rows(self, start, stop):
+        """
+        Returns writable memmap view of rows start to stop.
+        """
+        self.grow(stop)
+        self.row_num = max(self.row_num, stop)
+        return self.map[start:stop]
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map = None
+        self.fid.truncate(NPY_HEADER_LEN + self.row_num*self.row_bytes)
+        self.write_header(self.row_num)
+        self.fid.close()
+
+
+class NpyWriter(Writer):
+    """
+    Writes samples in volts to a .npy file through a memmap, see
+    NpyAppender.
+    """
+
+    def __init__(self, filename, info, dtype=numpy.float64):
+        Writer.__init__(self, filename, info)
+        self.converter = None
+        if not info.get('physical'):
+            self.converter = converter_from_info(info)
+        self.npy = NpyAppender(filename, self.nchans, dtype, info.get('sample_num'))
+
+    def write(self, index, raw):
+        n = raw.shape[0]
+        if self.converter is None:
+            self.npy.rows(index, index + n)[:] = raw
+        else:
+            self.converter.convert(raw, out=self.npy.rows(index, index + n))
+        self.scan_num = max(self.scan_num, index + n)
+
+    def close(self):
+        self.npy.close()
+        write_sidecar(self.filename, self.info, self.scan_num)
+
+
+class ChunkedWriter(Writer):
+    """
+    Writes raw sample codes to a chunked, compressed container. Blocks are
+    collected into chunks of chunk_size scans, each of which is encoded
+    (see codec.encode_chunk) and appended to the file with a small header.
+    Chunks are encoded by threads worker threads, at most 2*threads at a
+    time, and written in order as they are done (threads=0 encodes in the
+    writing thread). A chunk index, the statistics of each chunk and a
+    footer are written on close. As chunks are only ever appended a file
+    which was not closed can still be read by scanning the chunk headers.
+
+    File layout:
+
+        'SDAQCHNK', uint32 version, uint32 header length, json header
+        chunk*:  'CHNK', uint64 index, uint32 nscans, uint32 nbytes, data
+        'INDX', uint32 chunk count, index array
+        'STA2', uint32 nchans, statistics array (one record per chunk)
+        uint64 index offset, 'SDAQEND!'
+    """
+
+    def __init__(self, filename, info, chunk_size=CHUNKED_DEFAULT_CHUNK_SIZE,
+                 level=CHUNKED_DEFAULT_LEVEL, compressor=CHUNKED_DEFAULT_COMPRESSOR,
+                 filters=CHUNKED_DEFAULT_FILTERS, threads=CHUNKED_DEFAULT_THREADS):
+        import codec
+        Writer.__init__(self, filename, info)
+        self.chunk_size = chunk_size
+        self.level = level
+        self.compressor = compressor
+        self.filters = codec.parse_filters(filters)
+        codec.get_compressor(compressor)
+        self.pool = None
+        if threads > 0:
+            self.pool = codec.CompressPool(threads)
+        self.max_pending = 2*max(threads, 1)
+        self.pending = collections.deque()
+        self.chunk = numpy.zeros((chunk_size, self.nchans), dtype='<u2')
+        self.chunk_index = 0
+        self.chunk_fill = 0
+        self.index_list = []
+        self.stats_list = []
+        self.converter = converter_from_info(info)
+        self.fid = open(filename, 'wb')
+        header = dict(info)
+        header['chunk_size'] = chunk_size
+        header['codec'] = compressor
+        header['filters'] = list(self.filters)
+        header['level'] = level
+        header = json.dumps(header, sort_keys=True)
+        self.fid.write(CHUNKED_MAGIC + struct.pack('<II', CHUNKED_VERSION, len(header)) + header)
+
+    def write(self, index, raw):
+        if index != self.chunk_index + self.chunk_fill:
+            raise ValueError, 'chunked writer requires consecutive blocks'
+        pos = 0
+        while pos < raw.shape[0]:
+            n = min(self.chunk_size - self.chunk_fill, raw.shape[0] - pos)
+            self.chunk[self.chunk_fill:self.chunk_fill + n] = raw[pos:pos + n]
+            self.chunk_fill += n
+            pos += n
+            if self.chunk_fill == self.chunk_size:
+                self.flush_chunk()
+        self.scan_num = index + raw.shape[0]
+
+    def flush_chunk(self):
+        """
+        Start encoding the current chunk and append the chunks which are
+        done.
+        """
+        import codec
+        if self.chunk_fill == 0:
+            return
+        chunk = self.chunk[:self.chunk_fill].copy()
+        if self.pool is None:
+            data = codec.encode_chunk(chunk, self.compressor, self.filters, self.level)
+        else:
+            data = self.pool.submit(chunk, self.compressor, self.filters, self.level)
+        self.pending.append((self.chunk_index, self.chunk_fill, data,
+                             get_chunk_stats(self.converter.convert(chunk))))
+        self.chunk_index += self.chunk_fill
+        self.chunk_fill = 0
+        self.write_chunks()
+
+    def write_chunks(self, wait=False):
+        """
+        Append encoded chunks in order. Waits for the oldest chunk when more
+        than max_pending chunks are being encoded, or for all if wait is
+        True.
+        """
+        while self.pending:
+            index, nscans, data, stats = self.pending[0]
+            if not isinstance(data, str):
+                if not (wait or data.done() or len(self.pending) > self.max_pending):
+                    break
+                data = data.result()
+            self.pending.popleft()
+            offset = self.fid.tell()
+            self.fid.write(struct.pack(CHUNKED_CHUNK_HEADER, CHUNKED_CHUNK_MAGIC,
+                                       index, nscans, len(data)))
+            self.fid.write(data)
+            self.index_list.append((index, nscans, offset, len(data)))
+            self.stats_list.append(stats)
+
+    def close(self):
+        self.flush_chunk()
+        try:
+            self.write_chunks(wait=True)
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+        index = numpy.array(self.index_list, dtype=CHUNKED_INDEX_DTYPE)
+        index_offset = self.fid.tell()
+        self.fid.write(CHUNKED_INDEX_MAGIC + struct.pack('<I', index.shape[0]))
+        self.fid.write(index.tostring())
+        stats = numpy.array(self.stats_list, dtype=get_stats_dtype(self.nchans))
+        self.fid.write(CHUNKED_STATS_MAGIC + struct.pack('<I', self.nchans))
+        self.fid.write(stats.tostring())
+        self.fid.write(struct.pack(CHUNKED_FOOTER, index_offset, CHUNKED_END_MAGIC))
+        self.fid.close()
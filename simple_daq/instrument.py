@@ -0,0 +1,255 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Timers and counters for the stages of an acquisition (device
+open, command test, read, convert, process and write) and a summary of
+them as text or json. The acquisition functions take an optional Metrics
+object and use NULL_METRICS, whose methods do nothing, when none is given
+so the cost when disabled is a method call per block. A stage is timed
+with
+
+    t0 = metrics.start()
+    ... stage ...
+    metrics.stop('read', t0)
+
+"""
+import sys
+import time
+
+STAGES = ('open', 'cmd_test', 'read', 'convert', 'process', 'write')
+METRICS_FORMATS = ('none', 'text', 'json')
+READ_HIST_BINS = 32              # power of two read size buckets
+
+
+class Metrics(object):
+    """
+    Stage timers and read/scan counters for an acquisition. When several
+    devices are acquired each has its own child Metrics (see child) which
+    are combined in the summary.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.t_start = time.time()
+        self.stage_time = {}
+        self.stage_count = {}
+        self.reads = 0
+        self.read_bytes = 0
+        self.read_hist = [0]*READ_HIST_BINS
+        self.last_read = None
+        self.max_gap = 0.0
+        self.scans = 0
+        self.samples = 0
+        self.children = []
+
+    def start(self):
+        """
+        Returns start time for stop.
+        """
+        return time.time()
+
+    def stop(self, stage, t0):
+        """
+        Add time since t0 (from start) to stage.
+        """
+        dt = time.time() - t0
+        self.stage_time[stage] = self.stage_time.get(stage, 0.0) + dt
+        self.stage_count[stage] = self.stage_count.get(stage, 0) + 1
+
+    def record_read(self, nbytes):
+        """
+        Count a read of nbytes bytes.
+        """
+        now = time.time()
+        nbytes = nbytes or 0
+        self.reads += 1
+        self.read_bytes += nbytes
+        self.read_hist[min(int(nbytes).bit_length(), READ_HIST_BINS - 1)] += 1
+        if self.last_read is not None:
+            self.max_gap = max(self.max_gap, now - self.last_read)
+        self.last_read = now
+
+    def record_scans(self, scans, nchans):
+        """
+        Count scans of nchans samples acquired.
+        """
+        self.scans += scans
+        self.samples += scans*nchans
+
+    def child(self):
+        """
+        Returns new Metrics whose counts are included in this one's summary.
+        """
+        metrics = Metrics()
+        self.children.append(metrics)
+        return metrics
+
+    def summary(self):
+        """
+        Returns dictionary summarizing the metrics.
+        """
+        elapsed = max(time.time() - self.t_start, 1.0e-9)
+        stage_time = dict(self.stage_time)
+        stage_count = dict(self.stage_count)
+        reads = self.reads
+        read_bytes = self.read_bytes
+        read_hist = list(self.read_hist)
+        max_gap = self.max_gap
+        samples = self.samples
+        for child in self.children:
+            for stage, value in child.stage_time.items():
+                stage_time[stage] = stage_time.get(stage, 0.0) + value
+                stage_count[stage] = stage_count.get(stage, 0) + child.stage_count[stage]
+            reads += child.reads
+            read_bytes += child.read_bytes
+            read_hist = [x + y for x, y in zip(read_hist, child.read_hist)]
+            max_gap = max(max_gap, child.max_gap)
+            samples += child.samples
+        hist = {}
+        for i, count in enumerate(read_hist):
+            if count:
+                # Bucket i holds reads of 2**(i-1) to 2**i - 1 bytes
+                hist[str(1 << i >> 1)] = count
+        return {
+            'elapsed' : elapsed,
+            'samples' : samples,
+            'samples_per_sec' : samples/elapsed,
+            'read_bytes' : read_bytes,
+            'mbytes_per_sec' : read_bytes/elapsed/1.0e6,
+            'reads' : reads,
+            'read_size_hist' : hist,
+            'max_read_gap' : max_gap,
+            'stage_time' : stage_time,
+            'stage_count' : stage_count,
+            }
+
+    def report(self, fmt='text'):
+        """
+        Returns summary as a human readable string (fmt='text') or a line of
+        json (fmt='json').
+        """
+        summary = self.summary()
+        if fmt == 'json':
+            import json
+            return json.dumps(summary, sort_keys=True) + '\n'
+        lines = [
+            'acquisition metrics',
+            '\telapsed: %.3f sec'%(summary['elapsed'],),
+            '\tsamples: %d (%.1f samples/sec)'%(summary['samples'], summary['samples_per_sec']),
+            '\tbytes read: %d (%.3f MB/sec)'%(summary['read_bytes'], summary['mbytes_per_sec']),
+            '\treads: %d, max time between reads: %.6f sec'%(summary['reads'], summary['max_read_gap']),
+            ]
+        lines.append('\tstage times')
+        stage_list = [x for x in STAGES if x in summary['stage_time']]
+        stage_list += sorted([x for x in summary['stage_time'] if not x in STAGES])
+        for stage in stage_list:
+            msg = '\t\t%-10s %.6f sec (%d calls)'
+            lines.append(msg%(stage, summary['stage_time'][stage], summary['stage_count'][stage]))
+        lines.append('\tread sizes (bytes)')
+        for size in sorted(summary['read_size_hist'], key=int):
+            lines.append('\t\t>= %-10s %d'%(size, summary['read_size_hist'][size]))
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics which record nothing - used when instrumentation is disabled.
+    """
+
+    enabled = False
+
+    def __init__(self):
+        pass
+
+    def start(self):
+        return None
+
+    def stop(self, stage, t0):
+        pass
+
+    def record_read(self, nbytes):
+        pass
+
+    def record_scans(self, scans, nchans):
+        pass
+
+    def child(self):
+        return self
+
+    def summary(self):
+        return {}
+
+    def report(self, fmt='text'):
+        return ''
+
+
+NULL_METRICS = NullMetrics()
+
+
+def get_metrics(metrics):
+    """
+    Returns metrics or NULL_METRICS if metrics is None.
+    """
+    if metrics is None:
+        return NULL_METRICS
+    return metrics
+
+
+class MetricsReporter(object):
+    """
+    Writes metrics reports to fid in format fmt ('text' or 'json'), every
+    period seconds when update is called, if period is given, and at the
+    end with close.
+    """
+
+    def __init__(self, metrics, fmt='text', fid=sys.stderr, period=None):
+        self.metrics = metrics
+        self.fmt = fmt
+        self.fid = fid
+        self.period = period
+        self.next_time = None
+        if period is not None:
+            self.next_time = time.time() + period
+
+    def update(self):
+        """
+        Write report if the reporting period has passed.
+        """
+        if self.next_time is None:
+            return
+        now = time.time()
+        if now >= self.next_time:
+            self.write()
+            self.next_time = now + self.period
+
+    def write(self):
+        self.fid.write(self.metrics.report(self.fmt))
+        self.fid.flush()
+
+    def close(self):
+        self.write()
+        if self.fid not in (sys.stdout, sys.stderr):
+            self.fid.close()
@@ -0,0 +1,552 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Lazy loading of data files written by daq-acquire. Opening a
+recording only reads its header/sidecar - the binary formats are memory
+mapped (or, for the chunked format, decompressed chunk by chunk) and only
+the slices requested with get_t and get_samples are read. Text files are
+parsed once, in chunks, into a binary cache file (<file>.cache.npy) which
+is memory mapped and reused until the text file changes.
+
+Recordings can be queried by time (get_scan_range) and summarized with
+get_stats, which returns the min, max and mean of each channel over a
+range of scans, leaving out the out of range samples so the result does
+not depend on the format. For the chunked format the statistics of whole chunks come
+from the chunk index, so only the chunks at the ends of the range are
+decompressed (or none, with index_only).
+
+"""
+import os
+import math
+import json
+import struct
+import tempfile
+import numpy
+import formats
+from convert import converter_from_info
+from timebase import TimeAxis
+
+TEXT_CACHE_EXT = '.cache.npy'
+TEXT_PARSE_BYTES = 1 << 22       # bytes of text parsed at a time
+STATS_READ_SCANS = 1 << 20       # scans read at a time for statistics
+
+
+def open_recording(filename, fmt=None):
+    """
+    Open recording written by daq-acquire. The format is determined from
+    the file extension if not given.
+    """
+    fmt = formats.get_format(filename, fmt)
+    if fmt == 'raw':
+        return RawRecording(filename)
+    elif fmt == 'npy':
+        return NpyRecording(filename)
+    elif fmt == 'chunked':
+        return ChunkedRecording(filename)
+    else:
+        return TextRecording(filename)
+
+
+def read_sidecar(filename):
+    """
+    Returns acquisition information from json sidecar file or None if
+    there is no sidecar.
+    """
+    sidecar_file = filename + formats.SIDECAR_EXT
+    if not os.path.exists(sidecar_file):
+        return None
+    fid = open(sidecar_file)
+    info = json.load(fid)
+    fid.close()
+    return info
+
+
+class Recording(object):
+    """
+    Base class for recordings. Sub-classes set scan_num and provide
+    read_samples.
+    """
+
+    def __init__(self, filename, info, nchans):
+        self.filename = filename
+        self.info = info or {}
+        self.nchans = nchans
+        self.channels = self.info.get('channels', range(nchans))
+        self.sample_period = self.info.get('sample_period') or 1.0
+        self.convert_period = self.info.get('convert_period') or 0.0
+        self.start_time = self.info.get('start_time')
+        self.t0 = self.info.get('t0', 0.0)
+        self.scan_num = 0
+
+    def __len__(self):
+        return self.scan_num
+
+    def get_range(self, start, stop):
+        """
+        Returns start, stop clipped to the recording.
+        """
+        if stop is None or stop > self.scan_num:
+            stop = self.scan_num
+        start = min(max(start, 0), stop)
+        return start, stop
+
+    def get_t(self, start=0, stop=None, channel=None):
+        """
+        Returns times (sec) of scans start to stop. If channel (a column
+        number) is given the times are those of that channel's samples,
+        offset by its position in the scan.
+        """
+        start, stop = self.get_range(start, stop)
+        return self.get_time_axis(channel).get(start, stop) + self.t0
+
+    def get_scan_range(self, t0=None, t1=None):
+        """
+        Returns start, stop of the scans with times (as given by get_t) from
+        t0 up to, but not including, t1. None is the start or end of the
+        recording.
+        """
+        start, stop = 0, self.scan_num
+        if t0 is not None:
+            start = self.time_to_index(t0)
+        if t1 is not None:
+            stop = self.time_to_index(t1)
+        return self.get_range(start, stop)
+
+    def time_to_index(self, t):
+        """
+        Returns index of the first scan at or after time t.
+        """
+        return int(math.ceil((t - self.t0)/self.sample_period - 1.0e-6))
+
+    def get_time_axis(self, channel=None):
+        """
+        Returns TimeAxis for the recording (relative to t0).
+        """
+        axis = TimeAxis(0, self.scan_num, self.sample_period, self.convert_period, self.start_time)
+        if channel is not None:
+            axis = axis.for_channel(channel)
+        return axis
+
+    def get_samples(self, start=0, stop=None, channels=None):
+        """
+        Returns (stop - start, nchans) array of samples in volts for scans
+        start to stop. channels is an optional list of column numbers.
+        """
+        start, stop = self.get_range(start, stop)
+        if channels is None:
+            channels = range(self.nchans)
+        return self.read_samples(start, stop, list(channels))
+
+    def read_samples(self, start, stop, channels):
+        raise NotImplementedError
+
+    def get_stats(self, start=0, stop=None, channels=None, index_only=False):
+        """
+        Returns dictionary with the min, max and mean (arrays with a value
+        per channel) of the samples of scans start to stop in physical
+        units, the count of samples they were computed from - out of range
+        samples are left out, and a channel with none has NaN statistics -
+        and the start and stop of the scans. channels is an
+        optional list of column numbers. If index_only is True and the
+        recording has a chunk index the statistics are those of the whole
+        chunks covering the range, read from the index alone.
+        """
+        start, stop = self.get_range(start, stop)
+        if stop <= start:
+            raise ValueError, 'no scans in range'
+        if channels is None:
+            channels = range(self.nchans)
+        return self.read_stats(start, stop, list(channels), index_only)
+
+    def read_stats(self, start, stop, channels, index_only):
+        stats = StatsAccumulator()
+        for i in xrange(start, stop, STATS_READ_SCANS):
+            stats.add(self.read_samples(i, min(i + STATS_READ_SCANS, stop), channels))
+        return stats.get(start, stop)
+
+
+class StatsAccumulator(object):
+    """
+    Running min, max and mean of each column of blocks of samples in
+    physical units. Out of range (NaN) samples are left out, as in the
+    chunk statistics (see formats.get_chunk_stats), so the statistics are
+    the same whatever format the samples were saved in.
+    """
+
+    def __init__(self):
+        self.min = None
+        self.max = None
+        self.sum = None
+        self.count = None
+
+    def add(self, samples):
+        """
+        Add (scan_num, ncols) block of samples.
+        """
+        low, high, mean, count = formats.get_chunk_stats(samples)
+        self.add_stats(low[None,:], high[None,:], mean[None,:], count[None,:])
+
+    def add_stats(self, low, high, mean, count):
+        """
+        Add statistics of blocks, (nblocks, ncols) arrays of the min, max,
+        mean and count of each column of each block.
+        """
+        valid = count > 0
+        low = numpy.where(valid, low, numpy.inf).min(axis=0)
+        high = numpy.where(valid, high, -numpy.inf).max(axis=0)
+        total = numpy.where(valid, mean*count, 0).sum(axis=0)
+        count = count.sum(axis=0, dtype=numpy.int64)
+        if self.count is None:
+            self.min, self.max, self.sum, self.count = low, high, total, count
+        else:
+            self.min = numpy.minimum(self.min, low)
+            self.max = numpy.maximum(self.max, high)
+            self.sum = self.sum + total
+            self.count = self.count + count
+
+    def get(self, start, stop):
+        """
+        Returns statistics dictionary (see Recording.get_stats).
+        """
+        empty = self.count == 0
+        stats = {
+            'start' : start,
+            'stop' : stop,
+            'min' : self.min.copy(),
+            'max' : self.max.copy(),
+            'mean' : self.sum/numpy.maximum(self.count, 1),
+            'count' : self.count,
+            }
+        for key in ('min', 'max', 'mean'):
+            stats[key][empty] = numpy.nan
+        return stats
+
+
+class CodeRecording(Recording):
+    """
+    Base class for recordings which store raw sample codes. Sub-classes
+    provide read_raw.
+    """
+
+    def __init__(self, filename, info):
+        Recording.__init__(self, filename, info, len(info['channels']))
+        self.converter = converter_from_info(info)
+
+    def get_raw(self, start=0, stop=None, channels=None):
+        """
+        Returns raw sample codes for scans start to stop.
+        """
+        start, stop = self.get_range(start, stop)
+        raw = self.read_raw(start, stop)
+        if channels is not None:
+            raw = raw[:,list(channels)]
+        return raw
+
+    def read_samples(self, start, stop, channels):
+        raw = self.read_raw(start, stop)[:,channels]
+        return self.converter.select(channels).convert(raw)
+
+    def read_raw(self, start, stop):
+        raise NotImplementedError
+
+
+class RawRecording(CodeRecording):
+    """
+    Raw uint16 sample codes with json sidecar.
+    """
+
+    def __init__(self, filename):
+        info = read_sidecar(filename)
+        if info is None:
+            raise IOError, 'sidecar file %s%s not found'%(filename, formats.SIDECAR_EXT)
+        CodeRecording.__init__(self, filename, info)
+        scan_bytes = 2*self.nchans
+        self.scan_num = os.path.getsize(filename)//scan_bytes
+        if self.scan_num > 0:
+            self.raw = numpy.memmap(filename, dtype='<u2', mode='r',
+                                    shape=(self.scan_num, self.nchans))
+        else:
+            self.raw = numpy.zeros((0, self.nchans), dtype='<u2')
+
+    def read_raw(self, start, stop):
+        return self.raw[start:stop]
+
+
+class ArrayRecording(Recording):
+    """
+    Samples in volts held in memory, e.g. from acquire_data. info is the
+    optional acquisition information (as in a sidecar), e.g. for the
+    devices of a multi device acquisition.
+    """
+
+    def __init__(self, samples, sample_period, channels=None, info=None):
+        info = dict(info or {})
+        info['sample_period'] = sample_period
+        if channels is not None:
+            info['channels'] = list(channels)
+        Recording.__init__(self, None, info, samples.shape[1])
+        self.data = samples
+        self.scan_num = samples.shape[0]
+
+    def read_samples(self, start, stop, channels):
+        return self.data[start:stop, channels]
+
+
+class NpyRecording(Recording):
+    """
+    Samples in volts in a .npy file, optionally with json sidecar.
+    """
+
+    def __init__(self, filename):
+        self.data = numpy.load(filename, mmap_mode='r')
+        if self.data.ndim == 1:
+            self.data = self.data.reshape((-1, 1))
+        Recording.__init__(self, filename, read_sidecar(filename), self.data.shape[1])
+        self.scan_num = self.data.shape[0]
+
+    def read_samples(self, start, stop, channels):
+        if channels == range(self.nchans):
+            return self.data[start:stop]
+        return self.data[start:stop, channels]
+
+
+class ChunkedRecording(CodeRecording):
+    """
+    Chunked, compressed container of sample codes. The chunk index is read
+    from the end of the file or, if the file was not closed, rebuilt by
+    scanning the chunk headers. The chunk statistics are read with the
+    index or, if the file has none, computed from the chunks when first
+    needed.
+    """
+
+    def __init__(self, filename):
+        self.fid = open(filename, 'rb')
+        magic = self.fid.read(len(formats.CHUNKED_MAGIC))
+        if magic != formats.CHUNKED_MAGIC:
+            raise IOError, '%s is not a chunked daq file'%(filename,)
+        version, header_len = struct.unpack('<II', self.fid.read(8))
+        self.header = json.loads(self.fid.read(header_len))
+        self.data_offset = self.fid.tell()
+        CodeRecording.__init__(self, filename, self.header)
+        self.stats = None
+        self.index = self.read_index()
+        if self.index.shape[0] > 0:
+            self.scan_num = int(self.index['index'][-1] + self.index['nscans'][-1])
+        self.cache_pos = None
+        self.cache_data = None
+
+    def read_index(self):
+        """
+        Returns chunk index array.
+        """
+        footer_size = struct.calcsize(formats.CHUNKED_FOOTER)
+        self.fid.seek(0, 2)
+        file_size = self.fid.tell()
+        if file_size >= self.data_offset + footer_size:
+            self.fid.seek(file_size - footer_size)
+            index_offset, end_magic = struct.unpack(formats.CHUNKED_FOOTER, self.fid.read(footer_size))
+            if end_magic == formats.CHUNKED_END_MAGIC:
+                self.fid.seek(index_offset)
+                magic = self.fid.read(4)
+                count, = struct.unpack('<I', self.fid.read(4))
+                if magic == formats.CHUNKED_INDEX_MAGIC:
+                    data = self.fid.read(count*formats.CHUNKED_INDEX_DTYPE.itemsize)
+                    self.read_stats_index(count)
+                    return numpy.frombuffer(data, dtype=formats.CHUNKED_INDEX_DTYPE)
+        return self.scan_index(file_size)
+
+    def read_stats_index(self, count):
+        """
+        Read the chunk statistics following the index, if there are any.
+        """
+        magic = self.fid.read(4)
+        if magic != formats.CHUNKED_STATS_MAGIC:
+            return
+        nchans, = struct.unpack('<I', self.fid.read(4))
+        dtype = formats.get_stats_dtype(nchans)
+        data = self.fid.read(count*dtype.itemsize)
+        if nchans == self.nchans and len(data) == count*dtype.itemsize:
+            self.stats = numpy.frombuffer(data, dtype=dtype)
+
+    def scan_index(self, file_size):
+        """
+        Rebuild chunk index by reading the chunk headers.
+        """
+        header_size = struct.calcsize(formats.CHUNKED_CHUNK_HEADER)
+        index_list = []
+        offset = self.data_offset
+        while offset + header_size <= file_size:
+            self.fid.seek(offset)
+            magic, index, nscans, nbytes = struct.unpack(formats.CHUNKED_CHUNK_HEADER,
+                                                         self.fid.read(header_size))
+            if magic != formats.CHUNKED_CHUNK_MAGIC or offset + header_size + nbytes > file_size:
+                break
+            index_list.append((index, nscans, offset, nbytes))
+            offset += header_size + nbytes
+        return numpy.array(index_list, dtype=formats.CHUNKED_INDEX_DTYPE)
+
+    def read_chunk(self, pos):
+        """
+        Returns (nscans, nchans) sample codes of chunk number pos.
+        """
+        if pos == self.cache_pos:
+            return self.cache_data
+        entry = self.index[pos]
+        header_size = struct.calcsize(formats.CHUNKED_CHUNK_HEADER)
+        self.fid.seek(int(entry['offset']) + header_size)
+        data = formats.decode_chunk(self.fid.read(int(entry['nbytes'])), self.header)
+        self.cache_pos = pos
+        self.cache_data = data
+        return data
+
+    def get_chunk_stats(self):
+        """
+        Returns array of the statistics of each chunk (see
+        formats.get_stats_dtype).
+        """
+        if self.stats is None:
+            stats = [formats.get_chunk_stats(self.converter.convert(self.read_chunk(pos)))
+                     for pos in range(self.index.shape[0])]
+            self.stats = numpy.array(stats, dtype=formats.get_stats_dtype(self.nchans))
+        return self.stats
+
+    def find_chunks(self, start, stop):
+        """
+        Returns first, last such that chunks first to last - 1 hold scans
+        start to stop.
+        """
+        starts = self.index['index']
+        first = numpy.searchsorted(starts, start, side='right') - 1
+        last = numpy.searchsorted(starts, stop, side='left')
+        return int(first), int(last)
+
+    def read_stats(self, start, stop, channels, index_only):
+        first, last = self.find_chunks(start, stop)
+        index = self.index[first:last]
+        chunk_stats = self.get_chunk_stats()[first:last]
+        ends = index['index'] + index['nscans']
+        if index_only:
+            start, stop = int(index['index'][0]), int(ends[-1])
+        whole = (index['index'] >= start) & (ends <= stop)
+        stats = StatsAccumulator()
+        if whole.any():
+            chunk_stats = chunk_stats[whole]
+            stats.add_stats(*[chunk_stats[key][:,channels] for key in ('min', 'max', 'mean', 'count')])
+        for pos in numpy.flatnonzero(~whole):
+            lo = max(start, int(index['index'][pos]))
+            hi = min(stop, int(ends[pos]))
+            stats.add(self.read_samples(lo, hi, channels))
+        return stats.get(start, stop)
+
+    def read_raw(self, start, stop):
+        if stop <= start:
+            return numpy.zeros((0, self.nchans), dtype='<u2')
+        starts = self.index['index']
+        first, last = self.find_chunks(start, stop)
+        raw = numpy.empty((stop - start, self.nchans), dtype='<u2')
+        for pos in range(first, last):
+            chunk = self.read_chunk(pos)
+            chunk_start = int(starts[pos])
+            lo = max(start, chunk_start)
+            hi = min(stop, chunk_start + chunk.shape[0])
+            raw[lo - start:hi - start] = chunk[lo - chunk_start:hi - chunk_start]
+        return raw
+
+
+class TextRecording(Recording):
+    """
+    Text file written by daq-acquire (time column plus one column per
+    channel). The file is parsed into a binary cache on first use.
+    """
+
+    def __init__(self, filename):
+        cache_file = get_text_cache(filename)
+        self.data = numpy.load(cache_file, mmap_mode='r')
+        nchans = max(self.data.shape[1] - 1, 0)
+        info = None
+        if self.data.shape[0] > 1:
+            info = {'sample_period' : float(self.data[1,0] - self.data[0,0])}
+        Recording.__init__(self, filename, info, nchans)
+        self.scan_num = self.data.shape[0]
+        if self.scan_num > 0:
+            self.t0 = float(self.data[0,0])
+
+    def get_t(self, start=0, stop=None, channel=None):
+        start, stop = self.get_range(start, stop)
+        return self.data[start:stop, 0]
+
+    def time_to_index(self, t):
+        return int(numpy.searchsorted(self.data[:,0], t, side='left'))
+
+    def read_samples(self, start, stop, channels):
+        return self.data[start:stop, [c + 1 for c in channels]]
+
+
+def get_text_cache(filename):
+    """
+    Returns name of binary cache for text file, creating it if it does not
+    exist or is older than the text file. The cache is written next to
+    the text file or in the temporary directory if that is not possible.
+    """
+    cache_file = filename + TEXT_CACHE_EXT
+    if not os.access(os.path.dirname(os.path.abspath(filename)), os.W_OK):
+        name = os.path.abspath(filename).replace(os.sep, '_')
+        cache_file = os.path.join(tempfile.gettempdir(), name + TEXT_CACHE_EXT)
+    if os.path.exists(cache_file):
+        if os.path.getmtime(cache_file) >= os.path.getmtime(filename):
+            return cache_file
+    parse_text(filename, cache_file)
+    return cache_file
+
+
+def parse_text(filename, cache_file):
+    """
+    Parse text file into .npy file, TEXT_PARSE_BYTES at a time.
+    """
+    fid = open(filename)
+    first_line = fid.readline()
+    ncols = len(first_line.split())
+    npy = formats.NpyAppender(cache_file, ncols)
+    row = 0
+    rest = first_line
+    eof = False
+    while not eof:
+        text = fid.read(TEXT_PARSE_BYTES)
+        if text:
+            text = rest + text
+            end = text.rfind('\n') + 1
+        else:
+            # Parse whatever is left including a last line without newline
+            eof = True
+            text = rest
+            end = len(text)
+        rest = text[end:]
+        values = numpy.fromstring(text[:end], sep=' ')
+        if ncols > 0 and values.shape[0] > 0:
+            values = values.reshape((-1, ncols))
+            npy.rows(row, row + values.shape[0])[:] = values
+            row += values.shape[0]
+    fid.close()
+    npy.close()
@@ -0,0 +1,189 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Parallel acquisition from several devices. Each device is read
+by its own DeviceThread - the reads block in the kernel without holding
+the interpreter lock so the devices are read concurrently - and the
+blocks are passed through a queue to the coordinating thread. A
+ScanMerger places the devices on a common time base using the start
+time of each device's command and combines the scans acquired at the same
+time into single rows, so the devices can be written together as one set
+of channels.
+
+Note, the alignment is only as good as the start times measured in
+software (typically well under a scan period at moderate rates). Devices
+which must be aligned exactly should share an external start trigger.
+
+"""
+import sys
+import threading
+import Queue
+import numpy
+from reader import OverrunError
+
+DEFAULT_MERGE_QUEUE_SIZE = 64    # blocks
+
+
+class DeviceThread(threading.Thread):
+    """
+    Thread which iterates over blocks, a generator of (index, t, raw) from
+    one device, and puts (num, index, raw copy) on queue. When the blocks
+    are done (num, None, None) is put on the queue, or (num, None,
+    exc_info) if there was an error. Setting stop_event stops the thread
+    after the current block.
+    """
+
+    def __init__(self, num, blocks, queue, stop_event):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.num = num
+        self.blocks = blocks
+        self.queue = queue
+        self.stop_event = stop_event
+
+    def run(self):
+        error = None
+        try:
+            try:
+                for index, t, raw in self.blocks:
+                    self.queue.put((self.num, index, raw.copy()))
+                    if self.stop_event.isSet():
+                        break
+            finally:
+                self.blocks.close()
+        except BaseException:
+            error = sys.exc_info()
+        self.queue.put((self.num, None, error))
+
+
+class ScanMerger(object):
+    """
+    Merges blocks of scans from several devices with the same scan period
+    into rows of all channels on a common time base. The start time of
+    each device is given with start() and, once all devices have started,
+    each device's leading scans are dropped so that scan 0 of every
+    device is at the same time - the start of the last device to start.
+    At most max_pending scans (None for no limit) of a device are held
+    waiting for the other devices - more raise OverrunError, as when a
+    device stalls or starts late.
+    """
+
+    def __init__(self, nchans_list, sample_period, dtype=numpy.uint16, max_pending=None):
+        self.nchans_list = list(nchans_list)
+        self.nchans = sum(self.nchans_list)
+        self.sample_period = sample_period
+        self.dtype = dtype
+        self.max_pending = max_pending
+        self.start_times = [None]*len(self.nchans_list)
+        self.skip = None
+        self.pending = [[] for n in self.nchans_list]
+        self.pending_num = [0]*len(self.nchans_list)
+        self.index = 0
+
+    def start(self, num, start_time):
+        """
+        Set start time of device num.
+        """
+        self.start_times[num] = start_time
+        if None in self.start_times:
+            return
+        t_ref = max(self.start_times)
+        self.start_time = t_ref
+        self.skip = [int(round((t_ref - t)/self.sample_period)) for t in self.start_times]
+        self.offset_list = list(self.skip)
+        for num in range(len(self.pending)):
+            self.drop(num)
+
+    def offsets(self):
+        """
+        Returns list of the number of leading scans dropped from each device
+        or None if not all devices have started.
+        """
+        if self.skip is None:
+            return None
+        return self.offset_list
+
+    def add(self, num, raw):
+        """
+        Add (scan_num, nchans) block of device num. Raises OverrunError if
+        the device has more than max_pending scans waiting.
+        """
+        self.pending[num].append(raw)
+        self.pending_num[num] += raw.shape[0]
+        if self.skip is not None:
+            self.drop(num)
+        if self.max_pending is not None and self.pending_num[num] > self.max_pending:
+            waiting = [n for n, t in enumerate(self.start_times) if t is None]
+            if waiting:
+                reason = 'device %s not started'%(' '.join([str(n) for n in waiting]),)
+            else:
+                reason = 'device %d ahead of the others'%(num,)
+            raise OverrunError, 'more than %d scans waiting to be merged - %s'%(self.max_pending, reason)
+
+    def drop(self, num):
+        """
+        Drop leading scans of device num which precede the common start.
+        """
+        pending = self.pending[num]
+        while self.skip[num] > 0 and pending:
+            n = min(self.skip[num], pending[0].shape[0])
+            pending[0] = pending[0][n:]
+            self.skip[num] -= n
+            self.pending_num[num] -= n
+            if pending[0].shape[0] == 0:
+                pending.pop(0)
+
+    def pop(self, max_scans=None, partial=True):
+        """
+        Returns (index, raw) for the rows which all devices have acquired,
+        at most max_scans of them, or None if there are none yet. If partial
+        is False None is also returned when there are fewer than max_scans.
+        """
+        if self.skip is None or sum(self.skip) > 0:
+            return None
+        n = min(self.pending_num)
+        if max_scans is not None:
+            if not partial and n < max_scans:
+                return None
+            n = min(n, max_scans)
+        if n == 0:
+            return None
+        raw = numpy.empty((n, self.nchans), dtype=self.dtype)
+        col = 0
+        for num, nchans in enumerate(self.nchans_list):
+            pending = self.pending[num]
+            pos = 0
+            while pos < n:
+                k = min(n - pos, pending[0].shape[0])
+                raw[pos:pos + k, col:col + nchans] = pending[0][:k]
+                pending[0] = pending[0][k:]
+                if pending[0].shape[0] == 0:
+                    pending.pop(0)
+                pos += k
+            self.pending_num[num] -= n
+            col += nchans
+        index = self.index
+        self.index += n
+        return index, raw
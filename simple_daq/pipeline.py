@@ -0,0 +1,152 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Producer/consumer pipeline which moves output writing off the
+acquisition thread. The acquisition loop puts scan aligned blocks into a
+bounded queue and a writer thread drains the queue to an output writer,
+so reading the device never waits on disk I/O unless the queue is full.
+When the queue is full the acquisition loop blocks (backpressure) and the
+time spent blocked is recorded.
+
+"""
+import sys
+import time
+import threading
+import Queue
+from instrument import get_metrics
+
+DEFAULT_QUEUE_SIZE = 64          # blocks
+DEFAULT_HIGH_WATER = 0.75        # queue fill fraction for falling behind warning
+WARN_PERIOD = 5.0                # sec, minimum time between warnings
+
+
+class WriterThread(threading.Thread):
+    """
+    Thread which writes blocks from a bounded queue using writer, an
+    output writer from the formats module. Blocks are copied when they are
+    put on the queue so ring buffer views may be passed in. Write times are
+    added to the 'write' stage of metrics if given.
+    """
+
+    def __init__(self, writer, queue_size=DEFAULT_QUEUE_SIZE,
+                 high_water=DEFAULT_HIGH_WATER, warn_fid=sys.stderr, metrics=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.writer = writer
+        self.metrics = get_metrics(metrics)
+        self.queue = Queue.Queue(queue_size)
+        self.queue_size = queue_size
+        self.high_water = max(int(high_water*queue_size), 1)
+        self.warn_fid = warn_fid
+        self.error = None
+        self.behind = False
+        self.last_warn = None
+        self.stats = {
+            'blocks' : 0,
+            'scans' : 0,
+            'bytes' : 0,
+            'max_queue' : 0,
+            'put_wait' : 0.0,
+            'max_put_wait' : 0.0,
+            'write_time' : 0.0,
+            'behind_count' : 0,
+            }
+
+    def put(self, index, raw):
+        """
+        Queue block of raw samples starting at scan index for writing.
+        Blocks when the queue is full. Raises any exception raised by the
+        writer.
+        """
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        item = (index, raw.copy())
+        t0 = time.time()
+        self.queue.put(item)
+        wait = time.time() - t0
+        stats = self.stats
+        stats['put_wait'] += wait
+        stats['max_put_wait'] = max(stats['max_put_wait'], wait)
+        depth = self.queue.qsize()
+        stats['max_queue'] = max(stats['max_queue'], depth)
+        if depth >= self.high_water:
+            if not self.behind:
+                self.behind = True
+                stats['behind_count'] += 1
+                now = time.time()
+                if self.warn_fid is not None and (self.last_warn is None or now - self.last_warn > WARN_PERIOD):
+                    self.last_warn = now
+                    msg = 'warning: writer falling behind - queue %d of %d blocks\n'
+                    self.warn_fid.write(msg%(depth, self.queue_size))
+        elif depth < self.high_water//2:
+            self.behind = False
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                # Keep draining so put never blocks forever
+                continue
+            index, raw = item
+            t0 = time.time()
+            try:
+                self.writer.write(index, raw)
+            except Exception:
+                self.error = sys.exc_info()
+                continue
+            self.metrics.stop('write', t0)
+            stats = self.stats
+            stats['write_time'] += time.time() - t0
+            stats['blocks'] += 1
+            stats['scans'] += raw.shape[0]
+            stats['bytes'] += raw.nbytes
+
+    def close(self):
+        """
+        Write remaining blocks, stop the thread and close the writer.
+        """
+        self.queue.put(None)
+        self.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def report(self):
+        """
+        Returns string summarizing writer statistics.
+        """
+        stats = self.stats
+        lines = [
+            'writer statistics',
+            '\tblocks written: %d'%(stats['blocks'],),
+            '\tscans written: %d'%(stats['scans'],),
+            '\twrite time: %.3f sec'%(stats['write_time'],),
+            '\tmax queue depth: %d of %d'%(stats['max_queue'], self.queue_size),
+            '\tacquisition blocked: %.3f sec (max %.3f sec)'%(stats['put_wait'], stats['max_put_wait']),
+            '\tfalling behind: %d times'%(stats['behind_count'],),
+            ]
+        return '\n'.join(lines) + '\n'
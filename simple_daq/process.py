@@ -0,0 +1,285 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Processing of acquired blocks before they are written, to reduce
+the data rate on the fly. The stages are
+
+    BlockAverage  - mean of each group of n scans
+    FirDecimator  - anti-alias low pass FIR filter keeping every n'th
+                    output
+    Summary       - min, max and rms of each channel over groups of n scans
+
+Each stage works on (scan_num, ncols) blocks of samples in physical units
+and keeps the samples it needs from one block to the next (partial groups,
+filter history), so a stream processed block by block gives the same
+result as processing the whole recording at once. A Processor converts
+raw blocks and runs them through the configured stages.
+
+"""
+import numpy
+
+DEFAULT_FIR_TAPS_PER_FACTOR = 8  # taps = 8*factor + 1 when not given
+FIR_CUTOFF = 0.9                 # cutoff as fraction of output Nyquist
+SUMMARY_STATS = ('min', 'max', 'rms')
+
+
+class BlockAverage(object):
+    """
+    Averages groups of n scans. Output scan m is the mean of input scans
+    m*n to m*n + n - 1, so its time is (n - 1)/2 input periods after the
+    time of input scan m*n.
+    """
+
+    def __init__(self, n, ncols):
+        self.n = n
+        self.ncols = ncols
+        self.factor = n
+        self.time_offset = 0.5*(n - 1)
+        self.partial = numpy.zeros((0, ncols))
+
+    def process(self, x):
+        if self.partial.shape[0] > 0:
+            x = numpy.concatenate((self.partial, x))
+        whole = x.shape[0]//self.n
+        self.partial = x[whole*self.n:].copy()
+        return x[:whole*self.n].reshape((whole, self.n, self.ncols)).mean(axis=1)
+
+    def flush(self):
+        """
+        Returns mean of the remaining partial group.
+        """
+        if self.partial.shape[0] == 0:
+            return numpy.zeros((0, self.ncols))
+        y = self.partial.mean(axis=0)[None,:]
+        self.partial = numpy.zeros((0, self.ncols))
+        return y
+
+    def columns(self, names):
+        return list(names)
+
+
+def lowpass_taps(numtaps, cutoff):
+    """
+    Returns Hamming windowed sinc low pass filter with numtaps (odd) taps
+    and cutoff as a fraction of the sample rate, normalized to unit DC
+    gain.
+    """
+    k = numpy.arange(numtaps) - 0.5*(numtaps - 1)
+    h = 2*cutoff*numpy.sinc(2*cutoff*k)*numpy.hamming(numtaps)
+    return h/h.sum()
+
+
+class FirDecimator(object):
+    """
+    Low pass FIR filter followed by keeping every n'th sample. Only the
+    kept outputs are computed - output m is the sum over taps k of
+    h[k]*x[m*n - half + k] with each tap applied to a stride n slice of the
+    input, the polyphase form of a decimating filter. The filter is
+    centered (half = (numtaps - 1)/2) so output m is at the time of input
+    scan m*n. The stream is zero padded at the start and, by flush, at the
+    end.
+    """
+
+    def __init__(self, n, ncols, numtaps=None):
+        if numtaps is None:
+            numtaps = DEFAULT_FIR_TAPS_PER_FACTOR*n + 1
+        if numtaps % 2 == 0:
+            numtaps += 1
+        self.n = n
+        self.ncols = ncols
+        self.factor = n
+        self.time_offset = 0.0
+        self.numtaps = numtaps
+        self.half = (numtaps - 1)//2
+        self.taps = lowpass_taps(numtaps, 0.5*FIR_CUTOFF/n)
+        self.history = numpy.zeros((self.half, ncols))
+        self.history_start = -self.half   # input index of history[0]
+        self.next_out = 0
+        self.input_num = 0
+
+    def process(self, x):
+        self.input_num += x.shape[0]
+        return self.filter(x)
+
+    def filter(self, x):
+        buf = numpy.concatenate((self.history, x))
+        last = self.history_start + buf.shape[0] - 1
+        end = (last - self.half)//self.n + 1
+        nout = max(end - self.next_out, 0)
+        y = numpy.zeros((nout, self.ncols))
+        if nout > 0:
+            start = self.next_out*self.n - self.half - self.history_start
+            span = (nout - 1)*self.n + 1
+            for k in range(self.numtaps):
+                y += self.taps[k]*buf[start + k:start + k + span:self.n]
+            self.next_out = end
+        keep = self.next_out*self.n - self.half - self.history_start
+        self.history = buf[keep:].copy()
+        self.history_start += keep
+        return y
+
+    def flush(self):
+        """
+        Returns the outputs which need input past the end of the stream,
+        up to the output of the last input scan.
+        """
+        last_out = (self.input_num - 1)//self.n
+        if self.input_num == 0 or self.next_out > last_out:
+            return numpy.zeros((0, self.ncols))
+        y = self.filter(numpy.zeros((self.half, self.ncols)))
+        return y[:last_out + 1 - (self.next_out - y.shape[0])]
+
+    def columns(self, names):
+        return list(names)
+
+
+class Summary(object):
+    """
+    Min, max and rms of each column over groups of n scans. The output has
+    three columns (min, max, rms) per input column.
+    """
+
+    def __init__(self, n, ncols):
+        self.n = n
+        self.ncols = ncols
+        self.factor = n
+        self.time_offset = 0.0
+        self.partial = numpy.zeros((0, ncols))
+
+    def summarize(self, groups):
+        y = numpy.empty((groups.shape[0], self.ncols, 3))
+        y[:,:,0] = groups.min(axis=1)
+        y[:,:,1] = groups.max(axis=1)
+        y[:,:,2] = numpy.sqrt((groups*groups).mean(axis=1))
+        return y.reshape((groups.shape[0], 3*self.ncols))
+
+    def process(self, x):
+        if self.partial.shape[0] > 0:
+            x = numpy.concatenate((self.partial, x))
+        whole = x.shape[0]//self.n
+        self.partial = x[whole*self.n:].copy()
+        return self.summarize(x[:whole*self.n].reshape((whole, self.n, self.ncols)))
+
+    def flush(self):
+        if self.partial.shape[0] == 0:
+            return numpy.zeros((0, 3*self.ncols))
+        y = self.summarize(self.partial[None,:,:])
+        self.partial = numpy.zeros((0, self.ncols))
+        return y
+
+    def columns(self, names):
+        return ['%s_%s'%(name, stat) for name in names for stat in SUMMARY_STATS]
+
+
+class Processor(object):
+    """
+    Converts blocks of raw sample codes with converter and runs them
+    through block averaging over average scans, FIR decimation by
+    decimate (with fir_taps taps) and summaries over summary scans, each
+    stage only if set, in that order. process returns (index, samples) for
+    each processed block, where index counts output scans.
+    """
+
+    def __init__(self, converter, average=None, decimate=None, fir_taps=None, summary=None):
+        self.converter = converter
+        ncols = converter.nchans
+        self.stages = []
+        if average is not None and average > 1:
+            self.stages.append(BlockAverage(average, ncols))
+        if decimate is not None and decimate > 1:
+            self.stages.append(FirDecimator(decimate, ncols, fir_taps))
+        if summary is not None:
+            self.stages.append(Summary(summary, ncols))
+            ncols *= 3
+        self.ncols = ncols
+        self.index = 0
+
+    def active(self):
+        return len(self.stages) > 0
+
+    def run(self, x, stages):
+        for stage in stages:
+            x = stage.process(x)
+        return x
+
+    def process(self, raw):
+        """
+        Process block of raw sample codes. Returns (index, samples) or None
+        if the block did not complete an output scan.
+        """
+        return self.output(self.run(self.converter.convert(raw), self.stages))
+
+    def flush(self):
+        """
+        Returns (index, samples) of the remaining output at the end of the
+        stream or None.
+        """
+        parts = []
+        for i, stage in enumerate(self.stages):
+            parts.append(self.run(stage.flush(), self.stages[i + 1:]))
+        # Each stage's remainder has passed through the later stages before
+        # those are flushed, so the parts are in time order
+        y = parts[0]
+        for part in parts[1:]:
+            y = numpy.concatenate((y, part))
+        return self.output(y)
+
+    def output(self, y):
+        if y.shape[0] == 0:
+            return None
+        index = self.index
+        self.index += y.shape[0]
+        return index, y
+
+    def get_info(self, info):
+        """
+        Returns acquisition information for the processed output.
+        """
+        info = dict(info)
+        factor = 1
+        time_offset = 0.0
+        names = ['ch%d'%(c,) for c in info['channels']]
+        description = []
+        for stage in self.stages:
+            time_offset += stage.time_offset*factor
+            factor *= stage.factor
+            description.append({'stage' : stage.__class__.__name__, 'n' : stage.n})
+            names = stage.columns(names)
+            if isinstance(stage, Summary):
+                # Per channel values repeated for each statistic's column
+                for key in ('channels', 'gains', 'ranges', 'maxdata', 'units'):
+                    if key in info:
+                        info[key] = [x for x in info[key] for stat in SUMMARY_STATS]
+                info['convert_period'] = 0.0
+        period = info['sample_period']
+        info['t0'] = time_offset*period
+        info['sample_period'] = period*factor
+        info['sample_freq'] = info['sample_freq']/float(factor)
+        if info.get('sample_num') is not None:
+            info['sample_num'] = -(-info['sample_num']//factor)
+        info['columns'] = names
+        info['processing'] = description
+        info['physical'] = True
+        return info
@@ -0,0 +1,269 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Multi-resolution min/max envelopes for plotting long recordings.
+Level 0 holds the min and max of each channel over bins of PYRAMID_BASE
+scans and each following level combines PYRAMID_FACTOR bins of the level
+below. When plotting, the coarsest level which still gives at least one
+bin per screen pixel is drawn as a min/max envelope, and the raw samples
+are drawn once the view is narrow enough. The pyramid for a data file is
+stored next to it (<file>.pyramid.npy and <file>.pyramid.json) and memory
+mapped when the file is reopened.
+
+"""
+import os
+import json
+import numpy
+
+PYRAMID_BASE = 64                # scans per level 0 bin
+PYRAMID_FACTOR = 8               # bins combined per level
+PYRAMID_MIN_BINS = 1024          # stop adding levels below this many bins
+PYRAMID_READ_SCANS = 1 << 20     # scans read at a time when building
+PYRAMID_EXT = '.pyramid'
+DEFAULT_NPOINTS = 2000           # envelope points when axes size unknown
+
+
+class Pyramid(object):
+    """
+    Min/max pyramid for a recording. data is a (bin_num, nchans, 2) array
+    holding all levels one after the other and levels is a list of
+    (offset, bin_num, bin_size) for each level.
+    """
+
+    def __init__(self, recording, data, levels):
+        self.recording = recording
+        self.data = data
+        self.levels = levels
+
+    def level(self, i):
+        """
+        Returns (bin_num, nchans, 2) array of min/max for level i.
+        """
+        offset, bin_num, bin_size = self.levels[i]
+        return self.data[offset:offset + bin_num]
+
+    def index_to_time(self, index):
+        rec = self.recording
+        return rec.t0 + index*rec.sample_period
+
+    def time_to_index(self, t):
+        rec = self.recording
+        return int(numpy.floor((t - rec.t0)/rec.sample_period))
+
+    def envelope(self, start, stop, channel, npoints=DEFAULT_NPOINTS):
+        """
+        Returns (t, y) for plotting column channel between scans start and
+        stop with about npoints points or more. When even level 0 would give
+        fewer than npoints bins the samples are returned, otherwise the min
+        and max of each bin of the chosen level are interleaved so they can
+        be drawn as a single line.
+        """
+        rec = self.recording
+        start, stop = rec.get_range(start, stop)
+        span = stop - start
+        if len(self.levels) == 0 or span//self.levels[0][2] < npoints:
+            t = self.index_to_time(numpy.arange(start, stop))
+            y = rec.get_samples(start, stop, [channel])[:,0]
+            return t, y
+        level = 0
+        for i, (offset, bin_num, bin_size) in enumerate(self.levels):
+            if span//bin_size >= npoints:
+                level = i
+        offset, bin_num, bin_size = self.levels[level]
+        b0 = start//bin_size
+        b1 = min(-(-stop//bin_size), bin_num)
+        minmax = self.level(level)[b0:b1, channel]
+        t = self.index_to_time((numpy.arange(b0, b1) + 0.5)*bin_size)
+        return numpy.repeat(t, 2), numpy.asarray(minmax, dtype=numpy.float64).ravel()
+
+
+def reduce_bins(data, factor):
+    """
+    Combine groups of factor bins of (bin_num, nchans, 2) min/max array,
+    or of (scan_num, nchans) samples. NaN values are ignored.
+    """
+    if data.ndim == 2:
+        data = numpy.concatenate((data[:,:,None], data[:,:,None]), 2)
+    n = data.shape[0]
+    whole = n//factor
+    parts = []
+    if whole > 0:
+        block = data[:whole*factor].reshape((whole, factor) + data.shape[1:])
+        part = numpy.empty((whole,) + data.shape[1:], dtype=numpy.float32)
+        part[:,:,0] = numpy.fmin.reduce(block[:,:,:,0], axis=1)
+        part[:,:,1] = numpy.fmax.reduce(block[:,:,:,1], axis=1)
+        parts.append(part)
+    if n > whole*factor:
+        block = data[whole*factor:]
+        part = numpy.empty((1,) + data.shape[1:], dtype=numpy.float32)
+        part[0,:,0] = numpy.fmin.reduce(block[:,:,0], axis=0)
+        part[0,:,1] = numpy.fmax.reduce(block[:,:,1], axis=0)
+        parts.append(part)
+    if not parts:
+        return numpy.zeros((0,) + data.shape[1:], dtype=numpy.float32)
+    return numpy.concatenate(parts)
+
+
+def build_pyramid(recording):
+    """
+    Build min/max pyramid for recording. Returns (data, levels), see
+    Pyramid.
+    """
+    # Level 0 from the samples - read in whole numbers of bins
+    read_scans = (PYRAMID_READ_SCANS//PYRAMID_BASE)*PYRAMID_BASE
+    part_list = []
+    for start in xrange(0, len(recording), read_scans):
+        samples = recording.get_samples(start, start + read_scans)
+        part_list.append(reduce_bins(samples, PYRAMID_BASE))
+    if part_list:
+        level_list = [numpy.concatenate(part_list)]
+    else:
+        level_list = []
+
+    # Higher levels from the level below
+    while level_list and level_list[-1].shape[0] > PYRAMID_MIN_BINS:
+        level_list.append(reduce_bins(level_list[-1], PYRAMID_FACTOR))
+
+    levels = []
+    offset = 0
+    bin_size = PYRAMID_BASE
+    for level in level_list:
+        levels.append((offset, level.shape[0], bin_size))
+        offset += level.shape[0]
+        bin_size *= PYRAMID_FACTOR
+    if level_list:
+        data = numpy.concatenate(level_list)
+    else:
+        data = numpy.zeros((0, recording.nchans, 2), dtype=numpy.float32)
+    return data, levels
+
+
+def load_pyramid(recording, cache=True):
+    """
+    Returns Pyramid for recording. If the recording has a file and cache
+    is True the pyramid is read from (memory mapped) or saved to the
+    pyramid files next to the data file.
+    """
+    filename = getattr(recording, 'filename', None)
+    if not cache or filename is None:
+        data, levels = build_pyramid(recording)
+        return Pyramid(recording, data, levels)
+
+    base = filename + PYRAMID_EXT
+    source = {
+        'size' : os.path.getsize(filename),
+        'mtime' : os.path.getmtime(filename),
+        }
+    if os.path.exists(base + '.json') and os.path.exists(base + '.npy'):
+        fid = open(base + '.json')
+        try:
+            desc = json.load(fid)
+        except ValueError:
+            desc = None
+        fid.close()
+        if desc is not None and desc.get('source') == source:
+            data = numpy.load(base + '.npy', mmap_mode='r')
+            levels = [tuple(x) for x in desc['levels']]
+            return Pyramid(recording, data, levels)
+
+    data, levels = build_pyramid(recording)
+    try:
+        numpy.save(base + '.npy', data)
+        fid = open(base + '.json', 'w')
+        json.dump({'source' : source, 'levels' : levels, 'base' : PYRAMID_BASE,
+                   'factor' : PYRAMID_FACTOR}, fid)
+        fid.close()
+    except IOError:
+        pass
+    return Pyramid(recording, data, levels)
+
+
+def get_column_titles(info, channels):
+    """
+    Returns plot title for each column of a recording - the channel, and
+    the device as well for a recording of several devices.
+    """
+    devices = info.get('devices')
+    if not devices or len(devices) < 2:
+        return ['channel %d'%(channel,) for channel in channels]
+    titles = []
+    for device in devices:
+        for channel in device['channels']:
+            titles.append('%s channel %d'%(device['device'], channel))
+    return titles
+
+
+class PyramidPlot(object):
+    """
+    Plots each channel of a recording in its own figure using the min/max
+    pyramid. The plotted data is refetched at the matching resolution when
+    the view is zoomed or panned.
+    """
+
+    def __init__(self, pyramid):
+        import matplotlib.pylab as pylab
+        self.pyramid = pyramid
+        recording = pyramid.recording
+        self.lines = {}
+        # Figures are numbered by column as channel numbers repeat in
+        # recordings of several devices
+        for i, title in enumerate(get_column_titles(recording.info, recording.channels)):
+            fig = pylab.figure(i)
+            ax = fig.add_subplot(111)
+            t, y = pyramid.envelope(0, len(recording), i, self.get_npoints(ax))
+            line, = ax.plot(t, y)
+            ax.set_xlabel('t (sec)')
+            ax.set_ylabel('(V)')
+            ax.set_title(title)
+            self.lines[ax] = (i, line)
+            ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+
+    def get_npoints(self, ax):
+        """
+        Returns number of points to plot - the axes width in pixels.
+        """
+        try:
+            return max(int(ax.bbox.width), 1)
+        except (AttributeError, TypeError):
+            return DEFAULT_NPOINTS
+
+    def on_xlim_changed(self, ax):
+        i, line = self.lines[ax]
+        t0, t1 = ax.get_xlim()
+        start = max(self.pyramid.time_to_index(t0), 0)
+        stop = self.pyramid.time_to_index(t1) + 2
+        t, y = self.pyramid.envelope(start, stop, i, self.get_npoints(ax))
+        line.set_data(t, y)
+        ax.figure.canvas.draw_idle()
+
+
+def plot_recording(recording, cache=True):
+    """
+    Plot recording using min/max pyramid.
+    """
+    import matplotlib.pylab as pylab
+    plot = PyramidPlot(load_pyramid(recording, cache))
+    pylab.show()
+    return plot
@@ -0,0 +1,372 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Read engines for pulling raw samples from the comedi device
+file-descriptor. Data is read directly into preallocated numpy arrays
+through the buffer interface so no intermediate strings are created.
+FdReader uses read on the file-descriptor, PollReader waits for data
+with poll before each read so reads can time out and records latency and
+kernel buffer fill statistics, and MmapReader consumes the comedi kernel
+buffer directly through mmap.
+
+"""
+import io
+import time
+import mmap
+import errno
+import select
+import numpy
+
+# Sleep between buffer polls when select does not block (e.g. plain files)
+MMAP_POLL_PERIOD = 0.0005
+
+
+class ReadError(IOError):
+    """
+    Base class for errors raised by the read engines.
+    """
+    pass
+
+
+class ReadTimeout(ReadError):
+    """
+    No data arrived within the read timeout.
+    """
+    pass
+
+
+class OverrunError(ReadError):
+    """
+    The comedi kernel buffer overflowed and samples were lost. Comedi
+    reports this by failing the read with EPIPE, or the buffer contents
+    call for MmapReader.
+    """
+    pass
+
+
+class Reader(object):
+    """
+    Base class for read engines. Sub-classes provide readinto.
+    """
+
+    def readinto(self, buf):
+        raise NotImplementedError
+
+    def fill(self, array, callback=None):
+        """
+        Read until array is full or the end of the acquisition is reached.
+        Reads may return any number of bytes including part of a sample.
+        Returns the number of bytes read. If given, callback is called with
+        the total number of bytes read after each read.
+        """
+        buf = as_bytes(array)
+        nbytes = buf.shape[0]
+        bytes_read = 0
+        while bytes_read < nbytes:
+            n = self.readinto(buf[bytes_read:])
+            if not n:
+                break
+            bytes_read += n
+            if callback is not None:
+                callback(bytes_read)
+        return bytes_read
+
+    def report(self):
+        """
+        Returns string summarizing read statistics or None if the engine
+        does not keep statistics.
+        """
+        return None
+
+    def close(self):
+        pass
+
+
+class FdReader(Reader):
+    """
+    Reads from a file-descriptor directly into writable buffers such as
+    numpy arrays. The file-descriptor is not closed by the reader.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.fid = io.FileIO(fd, 'r', closefd=False)
+
+    def readinto(self, buf):
+        """
+        Read from the file-descriptor into buf. Returns the number of bytes
+        read which is 0 at the end of the acquisition. Reads interrupted
+        by signals are retried.
+        """
+        while True:
+            try:
+                return self.fid.readinto(buf)
+            except (IOError, OSError), err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+
+    def close(self):
+        self.fid.close()
+
+
+class PollReader(FdReader):
+    """
+    Reads from a file-descriptor like FdReader but waits for data with poll
+    first, raising ReadTimeout if none arrives within timeout seconds
+    (None waits forever). A failed read with EPIPE, which is how comedi
+    reports a kernel buffer overrun, raises OverrunError. If buffer (see
+    MmapReader) is given the number of bytes waiting in the kernel buffer
+    is recorded before each read.
+
+    The statistics in stats are
+
+        reads           - number of reads
+        bytes           - bytes read
+        wait_time       - total time waiting for data (sec)
+        max_latency     - longest time from starting to wait to the end of
+                          a read (sec)
+        max_gap         - longest time between the end of one read and the
+                          end of the next (sec)
+        fill            - kernel buffer bytes waiting before the last read
+        max_fill        - largest fill seen
+        timeouts        - number of reads which timed out
+        overruns        - number of buffer overruns
+    """
+
+    def __init__(self, fd, buffer=None, timeout=None):
+        FdReader.__init__(self, fd)
+        self.buffer = buffer
+        self.timeout = timeout
+        self.buffer_size = None
+        if buffer is not None:
+            self.buffer_size = buffer.size()
+        self.poller = select.poll()
+        self.poller.register(fd, select.POLLIN | select.POLLPRI)
+        self.last_read = None
+        self.stats = {
+            'reads' : 0,
+            'bytes' : 0,
+            'wait_time' : 0.0,
+            'max_latency' : 0.0,
+            'max_gap' : 0.0,
+            'fill' : 0,
+            'max_fill' : 0,
+            'timeouts' : 0,
+            'overruns' : 0,
+            }
+
+    def wait(self):
+        """
+        Wait until the file-descriptor is readable (or at end of file).
+        Raises ReadTimeout if the timeout expires first.
+        """
+        if self.timeout is None:
+            timeout_ms = None
+        else:
+            timeout_ms = max(int(1000*self.timeout), 0)
+        while True:
+            try:
+                events = self.poller.poll(timeout_ms)
+            except select.error, err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not events:
+                self.stats['timeouts'] += 1
+                raise ReadTimeout, 'no data received for %.3f sec'%(self.timeout,)
+            return events
+
+    def readinto(self, buf):
+        """
+        Wait for data and read it into buf. Returns the number of bytes read
+        which is 0 at the end of the acquisition.
+        """
+        stats = self.stats
+        t_start = time.time()
+        self.wait()
+        t_ready = time.time()
+        if self.buffer is not None:
+            fill = self.buffer.contents()
+            if fill >= 0:
+                stats['fill'] = fill
+                stats['max_fill'] = max(stats['max_fill'], fill)
+        try:
+            nbytes = FdReader.readinto(self, buf)
+        except (IOError, OSError), err:
+            if err.args[0] == errno.EPIPE:
+                stats['overruns'] += 1
+                raise OverrunError, 'comedi buffer overrun - samples lost'
+            raise
+        t_end = time.time()
+        stats['reads'] += 1
+        stats['bytes'] += nbytes or 0
+        stats['wait_time'] += t_ready - t_start
+        stats['max_latency'] = max(stats['max_latency'], t_end - t_start)
+        if self.last_read is not None:
+            stats['max_gap'] = max(stats['max_gap'], t_end - self.last_read)
+        self.last_read = t_end
+        return nbytes
+
+    def report(self):
+        stats = self.stats
+        reads = max(stats['reads'], 1)
+        lines = [
+            'read statistics',
+            '\treads: %d'%(stats['reads'],),
+            '\tbytes read: %d (mean %.1f per read)'%(stats['bytes'], stats['bytes']/float(reads)),
+            '\twait time: %.3f sec'%(stats['wait_time'],),
+            '\tmax read latency: %.6f sec'%(stats['max_latency'],),
+            '\tmax time between reads: %.6f sec'%(stats['max_gap'],),
+            ]
+        if self.buffer_size:
+            max_fill = stats['max_fill']
+            msg = '\tmax buffer fill: %d of %d bytes (%.1f%%)'
+            lines.append(msg%(max_fill, self.buffer_size, 100.0*max_fill/self.buffer_size))
+        lines.append('\ttimeouts: %d, overruns: %d'%(stats['timeouts'], stats['overruns']))
+        return '\n'.join(lines) + '\n'
+
+
+class MmapReader(Reader):
+    """
+    Reads from the comedi kernel buffer through mmap on the device
+    file-descriptor. buffer is an object providing the comedi buffer
+    operations for the subdevice:
+
+        size()          - comedi_get_buffer_size
+        contents()      - comedi_get_buffer_contents
+        offset()        - comedi_get_buffer_offset
+        mark_read(n)    - comedi_mark_buffer_read
+        running()       - True while the command is running (SDF_RUNNING)
+
+    Raises EnvironmentError if the buffer cannot be mapped. If no data
+    arrives within timeout seconds (None waits forever) reads raise
+    ReadTimeout, and on a buffer overrun they raise OverrunError.
+
+    stream_data reads through readinto, which copies the data out of the
+    kernel buffer into its ring buffer. The copy is kept because the blocks
+    it yields must be whole scans in one contiguous array, which the kernel
+    buffer does not give where the data wraps, and because the kernel buffer
+    has to be released with mark_read straight away rather than when the
+    consumer is done with a block, or the driver overruns.
+    """
+
+    def __init__(self, fd, buffer, timeout=None):
+        self.fd = fd
+        self.buffer = buffer
+        self.timeout = timeout
+        self.size = buffer.size()
+        if self.size <= 0:
+            raise EnvironmentError, 'comedi buffer size is %d'%(self.size,)
+        self.map = mmap.mmap(fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ)
+        self.data = numpy.frombuffer(self.map, dtype=numpy.uint8)
+
+    def wait(self, timeout=None):
+        """
+        Wait until there is data in the buffer or the acquisition is done.
+        Returns number of bytes available which is 0 at the end of the
+        acquisition. Raises ReadTimeout if timeout expires first, and
+        OverrunError if the buffer contents can not be had, which is how
+        comedi reports an overrun (the command is stopped too).
+        """
+        t_start = time.time()
+        while True:
+            nbytes = self.contents()
+            if nbytes > 0:
+                return nbytes
+            if not self.buffer.running():
+                # Command finished - check once more for data which arrived
+                return self.contents()
+            if timeout is not None and time.time() - t_start > timeout:
+                raise ReadTimeout, 'no data received for %.3f sec'%(timeout,)
+            try:
+                select.select([self.fd], [], [], MMAP_POLL_PERIOD)
+            except select.error, err:
+                if err.args[0] != errno.EINTR:
+                    raise
+            if self.buffer.contents() == 0:
+                time.sleep(MMAP_POLL_PERIOD)
+
+    def contents(self):
+        """
+        Returns number of bytes in the buffer.
+        """
+        nbytes = self.buffer.contents()
+        if nbytes < 0:
+            raise OverrunError, 'comedi buffer overrun - samples lost'
+        return nbytes
+
+    def views(self, nbytes=None):
+        """
+        Wait for data and return a list of one or two (if the data wraps
+        around the end of the buffer) read-only uint8 views into the kernel
+        buffer holding at most nbytes. The views are valid until mark_read
+        is called. An empty list is returned at the end of the acquisition.
+        """
+        avail = self.wait(self.timeout)
+        if nbytes is not None:
+            avail = min(avail, nbytes)
+        if avail == 0:
+            return []
+        offset = self.buffer.offset()
+        first = min(avail, self.size - offset)
+        view_list = [self.data[offset:offset + first]]
+        if avail > first:
+            view_list.append(self.data[:avail - first])
+        return view_list
+
+    def mark_read(self, nbytes):
+        """
+        Release nbytes of the kernel buffer back to the driver.
+        """
+        self.buffer.mark_read(nbytes)
+
+    def readinto(self, buf):
+        """
+        Copy available data from the kernel buffer into buf, a writable
+        numpy array. Returns number of bytes read which is 0 at the end of
+        the acquisition.
+        """
+        buf = buf.reshape(-1).view(numpy.uint8)
+        pos = 0
+        for view in self.views(buf.shape[0]):
+            buf[pos:pos + view.shape[0]] = view
+            pos += view.shape[0]
+        if pos > 0:
+            self.mark_read(pos)
+        return pos
+
+    def close(self):
+        self.data = None
+        self.map.close()
+
+
+def as_bytes(array):
+    """
+    Returns a flat uint8 view of a contiguous numpy array.
+    """
+    if not array.flags['C_CONTIGUOUS']:
+        raise ValueError, 'array must be contiguous'
+    return array.reshape(-1).view(numpy.uint8)
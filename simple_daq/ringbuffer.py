@@ -0,0 +1,127 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: A preallocated ring buffer for raw samples read from a comedi
+device. Bytes are written in whatever sized pieces the device returns
+them and are read back out as fixed size, scan aligned (block_size,
+nchans) numpy blocks. The buffer size is fixed so memory use does not
+grow with the length of an acquisition.
+
+"""
+import numpy
+
+
+class RingBuffer(object):
+    """
+    Ring buffer holding block_num blocks of block_size scans of nchans
+    samples each. Blocks never straddle the end of the buffer so every
+    block returned by read_block is a contiguous view into the buffer.
+    """
+
+    def __init__(self, nchans, block_size, block_num, dtype=numpy.uint16):
+        if nchans <= 0 or block_size <= 0 or block_num <= 0:
+            raise ValueError, 'nchans, block_size and block_num must be > 0'
+        self.nchans = nchans
+        self.block_size = block_size
+        self.block_num = block_num
+        self.dtype = numpy.dtype(dtype)
+        self.data = numpy.zeros((block_num*block_size, nchans), dtype=self.dtype)
+        self.bytes = self.data.reshape(-1).view(numpy.uint8)
+        self.scan_bytes = nchans*self.dtype.itemsize
+        self.block_bytes = block_size*self.scan_bytes
+        self.capacity = self.bytes.shape[0]
+        self.write_pos = 0
+        self.read_pos = 0
+
+    def used(self):
+        """
+        Returns number of bytes written but not yet read.
+        """
+        return self.write_pos - self.read_pos
+
+    def free(self):
+        """
+        Returns number of bytes which can be written contiguously at the
+        current write position.
+        """
+        offset = self.write_pos % self.capacity
+        return min(self.capacity - self.used(), self.capacity - offset)
+
+    def write_view(self):
+        """
+        Returns a writable uint8 view of the free contiguous space at the
+        write position. Call commit with the number of bytes filled.
+        """
+        offset = self.write_pos % self.capacity
+        return self.bytes[offset:offset + self.free()]
+
+    def commit(self, nbytes):
+        """
+        Mark nbytes as written at the write position.
+        """
+        if nbytes > self.free():
+            raise ValueError, 'ring buffer overflow'
+        self.write_pos += nbytes
+
+    def write(self, buf):
+        """
+        Copy a string of raw bytes into the buffer. The string may end
+        part way through a sample or scan.
+        """
+        buf = numpy.frombuffer(buf, dtype=numpy.uint8)
+        if buf.shape[0] > self.capacity - self.used():
+            raise ValueError, 'ring buffer overflow'
+        pos = 0
+        while pos < buf.shape[0]:
+            view = self.write_view()
+            n = min(view.shape[0], buf.shape[0] - pos)
+            view[:n] = buf[pos:pos + n]
+            self.commit(n)
+            pos += n
+
+    def read_block(self, partial=False):
+        """
+        Returns (index, block) for the next complete block, where index is
+        the scan index of the first scan in the block and block is a
+        (block_size, nchans) view into the buffer, or None if no complete
+        block is available. If partial is True the complete scans of an
+        unfinished block are returned instead - this is intended for the end
+        of an acquisition as subsequent blocks are no longer aligned.
+
+        The block is only valid until the buffer space is reused so it
+        should be copied if it needs to be kept.
+        """
+        nbytes = self.used()
+        if nbytes < self.block_bytes:
+            if not partial or nbytes < self.scan_bytes:
+                return None
+            nscans = nbytes//self.scan_bytes
+        else:
+            nscans = self.block_size
+        index = self.read_pos//self.scan_bytes
+        start = index % (self.block_num*self.block_size)
+        block = self.data[start:start + nscans]
+        self.read_pos += nscans*self.scan_bytes
+        return index, block
@@ -0,0 +1,206 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Live scope view for daq-acquire. The acquisition thread pushes
+each block into a ScopeBuffer which keeps the min/max of the raw sample
+codes over bins of several scans for the last window seconds. The buffer
+has a single writer and is read without locks - as in shmring the writer
+advances a claim counter, fills the bins and then advances a commit
+counter, and readers discard any bins the writer may have been
+overwriting while they were copying. The Scope redraws the
+buffer contents at a fixed frame rate from the main thread, reducing the
+frame rate when drawing would use more than its cpu budget.
+
+"""
+import time
+import numpy
+
+SCOPE_POINTS = 2000              # bins kept for the scope window
+DEFAULT_WINDOW = 5.0             # sec
+DEFAULT_FRAME_RATE = 10.0        # frames per sec
+DEFAULT_CPU_BUDGET = 0.25        # fraction of one cpu used for drawing
+
+
+class ScopeBuffer(object):
+    """
+    Ring buffer of min/max raw sample codes over bins of decimate scans
+    covering the last window seconds. Written by one thread (push) and read
+    by others (snapshot) without locking.
+    """
+
+    def __init__(self, nchans, sample_period, window=DEFAULT_WINDOW, points=SCOPE_POINTS):
+        window_scans = max(int(window/sample_period), 1)
+        self.nchans = nchans
+        self.sample_period = sample_period
+        self.window = window
+        self.decimate = max(-(-window_scans//points), 1)
+        self.size = max(-(-window_scans//self.decimate), 1)
+        self.min = numpy.zeros((self.size, nchans), dtype=numpy.uint16)
+        self.max = numpy.zeros((self.size, nchans), dtype=numpy.uint16)
+        self.partial = numpy.zeros((self.decimate, nchans), dtype=numpy.uint16)
+        self.partial_fill = 0
+        self.claimed = 0                 # bins being written, or written
+        self.count = 0                   # bins written
+        self.scans = 0
+
+    def push(self, raw):
+        """
+        Add (scan_num, nchans) block of raw sample codes.
+        """
+        pos = 0
+        n = raw.shape[0]
+        if self.partial_fill > 0:
+            # Finish bin started in previous block
+            k = min(self.decimate - self.partial_fill, n)
+            self.partial[self.partial_fill:self.partial_fill + k] = raw[:k]
+            self.partial_fill += k
+            pos = k
+            if self.partial_fill == self.decimate:
+                self.store(self.partial.min(axis=0)[None,:], self.partial.max(axis=0)[None,:])
+                self.partial_fill = 0
+        whole = (n - pos)//self.decimate
+        if whole > 0:
+            block = raw[pos:pos + whole*self.decimate].reshape((whole, self.decimate, self.nchans))
+            self.store(block.min(axis=1), block.max(axis=1))
+            pos += whole*self.decimate
+        if pos < n:
+            self.partial[:n - pos] = raw[pos:]
+            self.partial_fill = n - pos
+        self.scans += n
+
+    def store(self, mins, maxs):
+        """
+        Claim the bins, write them to the ring and then publish them by
+        advancing count.
+        """
+        claimed = self.count + mins.shape[0]
+        if mins.shape[0] > self.size:
+            mins, maxs = mins[-self.size:], maxs[-self.size:]
+        n = mins.shape[0]
+        self.claimed = claimed
+        start = (claimed - n) % self.size
+        first = min(n, self.size - start)
+        self.min[start:start + first] = mins[:first]
+        self.max[start:start + first] = maxs[:first]
+        if n > first:
+            self.min[:n - first] = mins[first:]
+            self.max[:n - first] = maxs[first:]
+        self.count = claimed
+
+    def snapshot(self):
+        """
+        Returns (count, mins, maxs) where mins and maxs are copies of the
+        most recent bins, oldest first, and count is the total number of
+        bins written up to the last one returned.
+        """
+        count = self.count
+        n = min(count, self.size)
+        index = numpy.arange(count - n, count) % self.size
+        mins = self.min[index]
+        maxs = self.max[index]
+        # Drop bins the writer may have been writing while copying - those
+        # before the ring slots of the bins claimed by now
+        overwritten = self.claimed - self.size - (count - n)
+        if overwritten > 0:
+            mins, maxs = mins[overwritten:], maxs[overwritten:]
+        return count, mins, maxs
+
+
+class Scope(object):
+    """
+    Live view of a ScopeBuffer with one axes per channel. status is an
+    optional function returning a string shown in the figure title, and
+    stop_event is a threading.Event which is set when the acquisition is
+    done (the view stops updating) or when the figure is closed.
+    """
+
+    def __init__(self, buffer, converter, channels, stop_event, status=None,
+                 frame_rate=DEFAULT_FRAME_RATE, cpu_budget=DEFAULT_CPU_BUDGET):
+        import matplotlib.pylab as pylab
+        self.buffer = buffer
+        self.converter = converter
+        self.stop_event = stop_event
+        self.status = status
+        self.frame_period = 1.0/frame_rate
+        self.cpu_budget = cpu_budget
+        self.last_time = time.time()
+        self.last_scans = 0
+        self.fig = pylab.figure()
+        self.lines = []
+        nchans = len(channels)
+        ax = None
+        for i, channel in enumerate(channels):
+            ax = self.fig.add_subplot(nchans, 1, i + 1, sharex=ax)
+            line, = ax.plot([], [])
+            ax.set_xlim(-buffer.window, 0)
+            range_min, range_max = converter.ranges[i][:2]
+            ax.set_ylim(range_min, range_max)
+            ax.set_ylabel('ch %d (V)'%(channel,))
+            self.lines.append(line)
+        ax.set_xlabel('t (sec)')
+        self.title = self.fig.suptitle('')
+        self.fig.canvas.mpl_connect('close_event', self.on_close)
+        self.timer = self.fig.canvas.new_timer(interval=int(1000*self.frame_period))
+        self.timer.add_callback(self.update)
+        self.timer.start()
+
+    def on_close(self, event):
+        self.stop_event.set()
+
+    def update(self):
+        t_start = time.time()
+        buffer = self.buffer
+        count, mins, maxs = buffer.snapshot()
+        if mins.shape[0] > 0:
+            mins = self.converter.convert(mins)
+            maxs = self.converter.convert(maxs)
+            n = mins.shape[0]
+            t = (numpy.arange(count - n, count) - count + 1)*buffer.decimate*buffer.sample_period
+            t = numpy.repeat(t, 2)
+            for i, line in enumerate(self.lines):
+                y = numpy.empty(2*n)
+                y[0::2] = mins[:,i]
+                y[1::2] = maxs[:,i]
+                line.set_data(t, y)
+
+        # Throughput and status
+        dt = t_start - self.last_time
+        scans = buffer.scans
+        rate = (scans - self.last_scans)/dt if dt > 0 else 0.0
+        self.last_time = t_start
+        self.last_scans = scans
+        msg = '%.1f kscans/sec'%(rate*1.0e-3,)
+        if self.status is not None:
+            msg += ', ' + self.status()
+        if self.stop_event.isSet():
+            msg += ', done'
+            self.timer.stop()
+        self.title.set_text(msg)
+        self.fig.canvas.draw()
+
+        # Slow down if drawing uses more than the cpu budget
+        render_time = time.time() - t_start
+        period = max(self.frame_period, render_time/self.cpu_budget)
+        self.timer.interval = int(1000*period)
@@ -0,0 +1,574 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Serving one live acquisition to several clients over a unix or
+tcp socket, so only one process opens the device. The acquisition loop
+publishes each block to a StreamServer whose thread multiplexes all
+client sockets with select. Each client has its own bounded queue of
+frames so a slow client can not hold up the acquisition or the other
+clients - when its queue is full data frames are dropped (see
+DROP_POLICIES). The info and error frames are queued separately and are
+never dropped.
+
+Protocol. A client connects and sends one line of json with its request,
+
+    {"channels": [0, 3], "queue_size": 16}
+
+(both keys optional - all channels and the server's queue size by
+default). The server then sends frames, each a FRAME_HEADER
+
+    magic 'SDQF', frame type, dtype char, nchans, start index,
+    scan_num, payload bytes
+
+followed by the payload. The first frame is FRAME_INFO whose payload is
+the json acquisition information for the requested channels. It is
+followed by FRAME_DATA frames of (scan_num, nchans) little-endian raw
+sample codes starting at scan index start index - dropped frames show up
+as a gap in the indices - and, when the acquisition ends, FRAME_END.
+FRAME_ERROR (payload an error message) is sent if the request is
+invalid. StreamClient implements the client side.
+
+"""
+import os
+import time
+import json
+import errno
+import fcntl
+import socket
+import select
+import struct
+import threading
+import collections
+import numpy
+
+FRAME_MAGIC = 'SDQF'
+FRAME_HEADER = '<4sBcHQII'       # magic, type, dtype, nchans, index, scan_num, nbytes
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_HEADER)
+FRAME_INFO = 1
+FRAME_DATA = 2
+FRAME_END = 3
+FRAME_ERROR = 4
+
+DEFAULT_ADDRESS = '/tmp/simple_daq.sock'
+DEFAULT_CLIENT_QUEUE = 64        # frames
+DROP_POLICIES = ('oldest', 'newest', 'disconnect')
+DEFAULT_DROP_POLICY = 'oldest'
+MAX_REQUEST_LEN = 1 << 16        # bytes
+SELECT_TIMEOUT = 0.5             # sec
+LINGER_TIME = 5.0                # sec, time to send queued frames at the end
+SEND_SIZE = 1 << 18              # bytes, maximum per send call
+
+
+class ServerError(IOError):
+    """
+    Error reported by the server to a client.
+    """
+    pass
+
+
+def parse_address(address):
+    """
+    Returns (family, address) for a socket address string - host:port
+    (or :port for all interfaces) for tcp, otherwise the path of a unix
+    socket. A path may be given as unix:path.
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and not '/' in host:
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def pack_frame(frame_type, payload='', dtype='H', nchans=0, index=0, scan_num=0):
+    """
+    Returns frame string with header and payload.
+    """
+    header = struct.pack(FRAME_HEADER, FRAME_MAGIC, frame_type, dtype, nchans,
+                         index, scan_num, len(payload))
+    return header + payload
+
+
+def get_client_info(info, columns):
+    """
+    Returns acquisition information for the given columns.
+    """
+    client_info = dict(info)
+    for key in ('channels', 'gains', 'ranges', 'maxdata', 'units', 'polynomials'):
+        if client_info.get(key) is not None:
+            client_info[key] = [info[key][c] for c in columns]
+    client_info.pop('devices', None)
+    client_info['columns'] = list(columns)
+    return client_info
+
+
+class Client(object):
+    """
+    Server side state of a connected client.
+    """
+
+    def __init__(self, sock, address, queue_size):
+        self.sock = sock
+        self.address = address
+        self.queue_size = queue_size
+        self.request = ''
+        self.has_request = False
+        self.requested = None            # requested channels, None for all
+        self.columns = None              # set when streaming starts
+        self.streaming = False
+        self.closing = False
+        self.queue = collections.deque()
+        self.control = collections.deque()    # info/error frames, never dropped
+        self.out = ''
+        self.out_pos = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def pending(self):
+        return self.out_pos < len(self.out) or len(self.control) > 0 or len(self.queue) > 0
+
+
+class StreamServer(threading.Thread):
+    """
+    Thread which accepts clients on address (see parse_address) and sends
+    each one the blocks given to publish. Frames are queued per client,
+    at most queue_size of them, and when a client's queue is full the
+    drop policy decides what happens - 'oldest' drops the oldest queued
+    frame, 'newest' the new one and 'disconnect' closes the client.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, queue_size=DEFAULT_CLIENT_QUEUE,
+                 drop_policy=DEFAULT_DROP_POLICY, log_fid=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        if not drop_policy in DROP_POLICIES:
+            raise ValueError, "unknown drop policy '%s'"%(drop_policy,)
+        self.address = address
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.log_fid = log_fid
+        self.lock = threading.Lock()
+        self.clients = []
+        self.info = None
+        self.done = False
+        self.finish_time = None
+        # Pipe written by publish to wake the select loop
+        self.wake_r, self.wake_w = os.pipe()
+        fcntl.fcntl(self.wake_w, fcntl.F_SETFL, fcntl.fcntl(self.wake_w, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.family, self.sock_address = parse_address(address)
+        self.listener = self.listen()
+        self.stats = {'clients' : 0, 'blocks' : 0, 'dropped' : 0, 'disconnected' : 0}
+
+    def listen(self):
+        """
+        Returns listening socket. A stale unix socket file is removed.
+        """
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.sock_address):
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    try:
+                        probe.connect(self.sock_address)
+                    except socket.error:
+                        os.unlink(self.sock_address)
+                    else:
+                        raise socket.error(errno.EADDRINUSE, 'server already running on %s'%(self.address,))
+                finally:
+                    probe.close()
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.sock_address)
+        sock.listen(16)
+        sock.setblocking(0)
+        return sock
+
+    def log(self, msg):
+        if self.log_fid is not None:
+            self.log_fid.write('%s\n'%(msg,))
+
+    def wake(self):
+        try:
+            os.write(self.wake_w, 'x')
+        except OSError:
+            pass
+
+    def set_info(self, info):
+        """
+        Set acquisition information. Clients waiting for it are sent their
+        info frame.
+        """
+        self.lock.acquire()
+        try:
+            self.info = dict(info)
+            for client in self.clients:
+                if client.has_request and not client.streaming and not client.closing:
+                    self.select_columns(client)
+        finally:
+            self.lock.release()
+        self.wake()
+
+    def publish(self, index, raw):
+        """
+        Queue (scan_num, nchans) block of raw sample codes starting at scan
+        index for all streaming clients. The block is encoded once for each
+        distinct channel selection.
+        """
+        frames = {}
+        raw = numpy.asarray(raw)
+        dtype = raw.dtype.newbyteorder('<')
+        self.lock.acquire()
+        try:
+            for client in list(self.clients):
+                if not client.streaming or client.closing:
+                    continue
+                key = tuple(client.columns)
+                frame = frames.get(key)
+                if frame is None:
+                    data = numpy.ascontiguousarray(raw[:, client.columns], dtype=dtype)
+                    frame = pack_frame(FRAME_DATA, data.tostring(), dtype.char,
+                                       len(client.columns), index, raw.shape[0])
+                    frames[key] = frame
+                self.put(client, frame)
+            self.stats['blocks'] += 1
+        finally:
+            self.lock.release()
+        self.wake()
+
+    def put(self, client, frame):
+        """
+        Add frame to client's queue, applying the drop policy if it is full
+        (call with lock held).
+        """
+        if len(client.queue) >= client.queue_size:
+            self.stats['dropped'] += 1
+            client.dropped += 1
+            if self.drop_policy == 'oldest':
+                client.queue.popleft()
+            elif self.drop_policy == 'newest':
+                return
+            else:
+                self.log('client %s disconnected - too slow'%(client.address,))
+                self.stats['disconnected'] += 1
+                client.queue.clear()
+                client.closing = True
+                return
+        client.queue.append(frame)
+
+    def finish(self, msg=''):
+        """
+        Send end frame to all clients and stop the server once their queues
+        are sent or after LINGER_TIME.
+        """
+        self.lock.acquire()
+        try:
+            self.done = True
+            self.finish_time = time.time()
+            for client in self.clients:
+                if client.streaming and not client.closing:
+                    client.queue.append(pack_frame(FRAME_END, msg))
+                client.closing = True
+        finally:
+            self.lock.release()
+        self.wake()
+
+    def close(self):
+        """
+        Stop server thread and close all sockets.
+        """
+        if self.isAlive():
+            if not self.done:
+                self.finish()
+            self.join()
+        for client in self.clients:
+            client.sock.close()
+        self.clients = []
+        self.listener.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.sock_address):
+            os.unlink(self.sock_address)
+        os.close(self.wake_r)
+        os.close(self.wake_w)
+
+    def start_client(self, client):
+        """
+        Queue info frame and start streaming to client (call with lock
+        held). The info frame goes ahead of the data frames and is not
+        subject to the drop policy, as the client needs it to read them.
+        """
+        client_info = get_client_info(self.info, client.columns)
+        client.control.append(pack_frame(FRAME_INFO, json.dumps(client_info), nchans=len(client.columns)))
+        client.streaming = True
+
+    def reject(self, client, msg):
+        """
+        Send error frame and close client (call with lock held).
+        """
+        client.control.append(pack_frame(FRAME_ERROR, msg))
+        client.closing = True
+
+    def handle_request(self, client, line):
+        """
+        Parse client's request line (call with lock held).
+        """
+        try:
+            request = json.loads(line or '{}')
+            channels = request.get('channels')
+            queue_size = int(request.get('queue_size', self.queue_size))
+        except (ValueError, TypeError, AttributeError):
+            self.reject(client, 'invalid request')
+            return
+        client.queue_size = max(queue_size, 1)
+        client.requested = channels
+        client.has_request = True
+        self.log('client %s request %s'%(client.address, line))
+        # Otherwise the client is started when the info is set
+        if self.info is not None:
+            self.select_columns(client)
+
+    def select_columns(self, client):
+        """
+        Convert the client's requested channels to columns and start it
+        (call with lock held).
+        """
+        channels = list(self.info['channels'])
+        if client.requested is None:
+            client.columns = range(len(channels))
+        else:
+            try:
+                client.columns = [channels.index(int(c)) for c in client.requested]
+            except (ValueError, TypeError):
+                self.reject(client, 'requested channels %s are not all acquired'%(client.requested,))
+                return
+        self.start_client(client)
+
+    def accept(self):
+        try:
+            sock, address = self.listener.accept()
+        except socket.error:
+            return
+        sock.setblocking(0)
+        address = address or 'unix'
+        self.lock.acquire()
+        try:
+            self.clients.append(Client(sock, address, self.queue_size))
+            self.stats['clients'] += 1
+        finally:
+            self.lock.release()
+        self.log('client %s connected'%(address,))
+
+    def receive(self, client):
+        """
+        Read from client - the request line, or end of connection.
+        """
+        try:
+            data = client.sock.recv(4096)
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EINTR):
+                return
+            data = ''
+        if not data:
+            self.remove(client)
+            return
+        if client.has_request or client.closing:
+            return
+        client.request += data
+        if '\n' in client.request:
+            line = client.request.split('\n', 1)[0]
+            self.lock.acquire()
+            try:
+                self.handle_request(client, line.strip())
+            finally:
+                self.lock.release()
+        elif len(client.request) > MAX_REQUEST_LEN:
+            self.lock.acquire()
+            try:
+                self.reject(client, 'request too long')
+            finally:
+                self.lock.release()
+
+    def send(self, client):
+        """
+        Send as much of the client's queued frames as the socket accepts,
+        info and error frames first.
+        """
+        if client.out_pos >= len(client.out):
+            self.lock.acquire()
+            try:
+                if client.control:
+                    client.out = client.control.popleft()
+                elif client.queue:
+                    client.out = client.queue.popleft()
+                else:
+                    return
+                client.out_pos = 0
+            finally:
+                self.lock.release()
+        try:
+            n = client.sock.send(buffer(client.out, client.out_pos, SEND_SIZE))
+        except socket.error, err:
+            if err.args[0] in (errno.EAGAIN, errno.EINTR):
+                return
+            self.remove(client)
+            return
+        client.out_pos += n
+        client.sent += n
+
+    def remove(self, client):
+        self.lock.acquire()
+        try:
+            if client in self.clients:
+                self.clients.remove(client)
+        finally:
+            self.lock.release()
+        client.sock.close()
+        self.log('client %s disconnected (%d frames dropped)'%(client.address, client.dropped))
+
+    def run(self):
+        while True:
+            self.lock.acquire()
+            try:
+                clients = list(self.clients)
+                for client in clients:
+                    if client.closing and not client.pending():
+                        self.clients.remove(client)
+                        client.sock.close()
+                clients = list(self.clients)
+                done = self.done
+            finally:
+                self.lock.release()
+            if done:
+                busy = [c for c in clients if c.pending()]
+                if not busy or time.time() - self.finish_time > LINGER_TIME:
+                    break
+            rlist = [self.listener, self.wake_r] + [c.sock for c in clients]
+            wlist = [c.sock for c in clients if c.pending()]
+            try:
+                readable, writable, errors = select.select(rlist, wlist, [], SELECT_TIMEOUT)
+            except select.error, err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            by_sock = dict([(c.sock, c) for c in clients])
+            for sock in readable:
+                if sock is self.listener:
+                    self.accept()
+                elif sock == self.wake_r:
+                    os.read(self.wake_r, 4096)
+                elif sock in by_sock:
+                    self.receive(by_sock[sock])
+            for sock in writable:
+                client = by_sock[sock]
+                if client in self.clients:
+                    self.send(client)
+
+    def report(self):
+        """
+        Returns string summarizing server statistics.
+        """
+        stats = self.stats
+        lines = [
+            'server statistics',
+            '\tclients: %d'%(stats['clients'],),
+            '\tblocks published: %d'%(stats['blocks'],),
+            '\tframes dropped: %d'%(stats['dropped'],),
+            '\tclients disconnected for being too slow: %d'%(stats['disconnected'],),
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+class StreamClient(object):
+    """
+    Client of a StreamServer. Connects to address, requests channels (all
+    if None) and reads the info frame into info. Blocks are read with read
+    or by iterating over the client.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, channels=None, queue_size=None, timeout=None):
+        family, sock_address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(sock_address)
+        request = {}
+        if channels is not None:
+            request['channels'] = list(channels)
+        if queue_size is not None:
+            request['queue_size'] = queue_size
+        self.sock.sendall(json.dumps(request) + '\n')
+        self.info = None
+        self.dropped = 0
+        self.next_index = None
+        frame_type, header, payload = self.read_frame()
+        if frame_type != FRAME_INFO:
+            self.close()
+            raise ServerError, 'server error: %s'%(payload,)
+        self.info = json.loads(payload)
+
+    def recv_exact(self, n):
+        chunks = []
+        while n > 0:
+            data = self.sock.recv(min(n, 1 << 20))
+            if not data:
+                raise ServerError, 'connection closed by server'
+            chunks.append(data)
+            n -= len(data)
+        return ''.join(chunks)
+
+    def read_frame(self):
+        """
+        Returns (frame type, header tuple, payload string) of next frame.
+        """
+        header = struct.unpack(FRAME_HEADER, self.recv_exact(FRAME_HEADER_SIZE))
+        if header[0] != FRAME_MAGIC:
+            raise ServerError, 'invalid frame'
+        return header[1], header, self.recv_exact(header[6])
+
+    def read(self):
+        """
+        Returns (index, raw) for the next block or None when the acquisition
+        has ended. Frames dropped by the server are counted in dropped (in
+        scans).
+        """
+        frame_type, header, payload = self.read_frame()
+        if frame_type == FRAME_END:
+            return None
+        if frame_type == FRAME_ERROR:
+            raise ServerError, 'server error: %s'%(payload,)
+        magic, frame_type, dtype, nchans, index, scan_num, nbytes = header
+        raw = numpy.frombuffer(payload, dtype=numpy.dtype(dtype).newbyteorder('<'))
+        raw = raw.reshape((scan_num, nchans))
+        if self.next_index is not None and index > self.next_index:
+            self.dropped += index - self.next_index
+        self.next_index = index + scan_num
+        return index, raw
+
+    def __iter__(self):
+        while True:
+            block = self.read()
+            if block is None:
+                break
+            yield block
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,311 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Shared memory ring of raw scans for several consumer processes
+on the same host. The acquisition copies each block into the ring once
+and any number of consumers map the ring and read the scans in place as
+numpy views - adding a consumer does not add a copy. The ring is a file
+in SHM_DIR (memory backed on linux) named after the ring, laid out as
+
+    0       header: magic, version, nchans, capacity (scans), dtype
+    64      counters (uint64): claim, commit, closed, info length
+    128     MAX_CONSUMERS consumer slots (uint64): pid, cursor
+    1024    acquisition information as json
+    DATA_OFFSET
+            (capacity, nchans) scans, scan i at row i % capacity
+
+The producer never waits for consumers. Before writing scans up to index
+n it sets claim to n, and after writing sets commit to n, so a consumer
+holding scans from index i knows they may have been overwritten once
+claim - capacity > i (see ShmConsumer.valid).
+
+"""
+import os
+import json
+import errno
+import time
+import mmap
+import fcntl
+import struct
+import tempfile
+import numpy
+
+SHM_DIR = '/dev/shm'
+SHM_PREFIX = 'simple_daq.'
+SHM_MAGIC = 'SDAQSHMR'
+SHM_VERSION = 1
+SHM_HEADER = '<8sIIQc'           # magic, version, nchans, capacity, dtype char
+COUNTER_OFFSET = 64
+CONSUMER_OFFSET = 128
+INFO_OFFSET = 1024
+DATA_OFFSET = 1 << 16
+MAX_CONSUMERS = 28
+DEFAULT_CAPACITY = 1 << 18       # scans
+
+# counter positions
+CLAIM = 0
+COMMIT = 1
+CLOSED = 2
+INFO_LEN = 3
+
+
+class ShmOverrun(IOError):
+    """
+    Scans were overwritten before the consumer read them.
+    """
+    pass
+
+
+def get_ring_path(name):
+    """
+    Returns path of the file of ring name.
+    """
+    shm_dir = SHM_DIR
+    if not os.path.isdir(shm_dir):
+        shm_dir = tempfile.gettempdir()
+    return os.path.join(shm_dir, SHM_PREFIX + name)
+
+
+class ShmRing(object):
+    """
+    Mapping of the ring file. Use ShmProducer or ShmConsumer.
+    """
+
+    def __init__(self, path, fid):
+        self.path = path
+        self.fid = fid
+        self.map = mmap.mmap(fid.fileno(), 0)
+        magic, version, nchans, capacity, dtype = struct.unpack_from(SHM_HEADER, self.map, 0)
+        if magic != SHM_MAGIC or version != SHM_VERSION:
+            self.map.close()
+            raise ValueError, '%s is not a shared memory ring'%(path,)
+        self.nchans = nchans
+        self.capacity = capacity
+        self.dtype = numpy.dtype(dtype)
+        self.counters = numpy.frombuffer(self.map, dtype=numpy.uint64, count=4, offset=COUNTER_OFFSET)
+        self.slots = numpy.frombuffer(self.map, dtype=numpy.uint64, count=2*MAX_CONSUMERS,
+                                      offset=CONSUMER_OFFSET).reshape((MAX_CONSUMERS, 2))
+        self.data = numpy.frombuffer(self.map, dtype=self.dtype, count=capacity*nchans,
+                                     offset=DATA_OFFSET).reshape((capacity, nchans))
+
+    def get_info(self):
+        """
+        Returns acquisition information of the ring's stream.
+        """
+        n = int(self.counters[INFO_LEN])
+        return json.loads(self.map[INFO_OFFSET:INFO_OFFSET + n] or '{}')
+
+    def closed(self):
+        return bool(self.counters[CLOSED])
+
+    def consumers(self):
+        """
+        Returns list of (pid, cursor) of the attached consumers.
+        """
+        return [(int(pid), int(cursor)) for pid, cursor in self.slots if pid]
+
+    def close(self):
+        self.counters = self.slots = self.data = None
+        self.map.close()
+        self.fid.close()
+
+
+class ShmProducer(ShmRing):
+    """
+    Creates ring name for (capacity, nchans) scans of dtype with the given
+    acquisition information and publishes blocks to it.
+    """
+
+    def __init__(self, name, nchans, capacity=DEFAULT_CAPACITY, info=None, dtype=numpy.uint16):
+        dtype = numpy.dtype(dtype)
+        info = json.dumps(info or {})
+        if len(info) > DATA_OFFSET - INFO_OFFSET:
+            raise ValueError, 'acquisition information too large for ring header'
+        path = get_ring_path(name)
+        # Create under a temporary name so consumers never see a partial
+        # header, then rename into place
+        fd, tmp_path = tempfile.mkstemp(prefix=SHM_PREFIX, dir=os.path.dirname(path))
+        fid = os.fdopen(fd, 'w+b')
+        fid.truncate(DATA_OFFSET + capacity*nchans*dtype.itemsize)
+        fid.seek(0)
+        fid.write(struct.pack(SHM_HEADER, SHM_MAGIC, SHM_VERSION, nchans, capacity, dtype.char))
+        fid.seek(INFO_OFFSET)
+        fid.write(info)
+        fid.seek(COUNTER_OFFSET + 8*INFO_LEN)
+        fid.write(struct.pack('<Q', len(info)))
+        fid.flush()
+        os.rename(tmp_path, path)
+        ShmRing.__init__(self, path, fid)
+        self.index = 0
+
+    def publish(self, index, raw):
+        """
+        Copy (scan_num, nchans) block of scans starting at scan index into
+        the ring. Scans are expected in order - a gap is left as it is.
+        """
+        n = raw.shape[0]
+        stop = index + n
+        if n > self.capacity:
+            raw = raw[n - self.capacity:]
+            index = stop - self.capacity
+            n = self.capacity
+        self.counters[CLAIM] = stop
+        pos = index % self.capacity
+        k = min(n, self.capacity - pos)
+        self.data[pos:pos + k] = raw[:k]
+        if k < n:
+            self.data[:n - k] = raw[k:]
+        self.counters[COMMIT] = stop
+        self.index = stop
+
+    def lag(self):
+        """
+        Returns number of scans the slowest consumer is behind.
+        """
+        cursors = [cursor for pid, cursor in self.consumers()]
+        if not cursors:
+            return 0
+        return self.index - min(cursors)
+
+    def close(self, unlink=True):
+        """
+        Mark the stream as ended and, if unlink is True, remove the ring
+        file (consumers keep their mapping).
+        """
+        self.counters[CLOSED] = 1
+        if unlink and os.path.exists(self.path):
+            os.unlink(self.path)
+        ShmRing.close(self)
+
+
+class ShmConsumer(ShmRing):
+    """
+    Attaches to ring name, waiting up to timeout seconds for it to be
+    created, and reads scans from the ring starting at the oldest scan
+    still in it (or the newest if latest is True). Takes one of the
+    ring's consumer slots so the producer can see its cursor.
+    """
+
+    def __init__(self, name, timeout=0.0, latest=False):
+        path = get_ring_path(name)
+        t_end = time.time() + timeout
+        while not os.path.exists(path) and time.time() < t_end:
+            time.sleep(0.01)
+        ShmRing.__init__(self, path, open(path, 'r+b'))
+        self.info = self.get_info()
+        self.slot = self.take_slot()
+        self.lost = 0
+        commit = int(self.counters[COMMIT])
+        if latest:
+            self.cursor = commit
+        else:
+            self.cursor = max(int(self.counters[CLAIM]) - self.capacity, 0)
+        self.slots[self.slot, 1] = self.cursor
+
+    def take_slot(self):
+        """
+        Returns number of a free consumer slot, claimed under a file lock.
+        """
+        fcntl.lockf(self.fid, fcntl.LOCK_EX)
+        try:
+            for slot in range(MAX_CONSUMERS):
+                pid = int(self.slots[slot, 0])
+                if pid == 0 or not pid_exists(pid):
+                    self.slots[slot] = (os.getpid(), 0)
+                    return slot
+        finally:
+            fcntl.lockf(self.fid, fcntl.LOCK_UN)
+        raise ValueError, 'no free consumer slot in %s'%(self.path,)
+
+    def available(self):
+        """
+        Returns number of scans committed but not yet read.
+        """
+        return int(self.counters[COMMIT]) - self.cursor
+
+    def read(self, max_scans=None, timeout=None):
+        """
+        Returns (index, view) of the next scans - a read only (scan_num,
+        nchans) view into the ring of at most max_scans scans, which does
+        not wrap around the end of the ring - or None if there are none
+        within timeout seconds (None waits until the stream is closed).
+        Check the view with valid once it has been used. If scans were
+        overwritten before they were read they are skipped and counted in
+        lost.
+        """
+        t_end = None
+        if timeout is not None:
+            t_end = time.time() + timeout
+        while self.available() <= 0:
+            if self.closed() or (t_end is not None and time.time() >= t_end):
+                return None
+            time.sleep(0.001)
+        oldest = int(self.counters[CLAIM]) - self.capacity
+        if self.cursor < oldest:
+            self.lost += oldest - self.cursor
+            self.cursor = oldest
+        index = self.cursor
+        n = self.available()
+        if max_scans is not None:
+            n = min(n, max_scans)
+        pos = index % self.capacity
+        n = min(n, self.capacity - pos)
+        view = self.data[pos:pos + n]
+        view.flags.writeable = False
+        self.cursor = index + n
+        self.slots[self.slot, 1] = self.cursor
+        return index, view
+
+    def valid(self, index):
+        """
+        Returns True if the scans from index on have not been overwritten.
+        """
+        return int(self.counters[CLAIM]) - self.capacity <= index
+
+    def check(self, index):
+        """
+        Raises ShmOverrun if scans from index on have been overwritten.
+        """
+        if not self.valid(index):
+            raise ShmOverrun, 'scans from %d overwritten while being read'%(index,)
+
+    def __iter__(self):
+        while True:
+            block = self.read()
+            if block is None:
+                break
+            yield block
+
+    def close(self):
+        self.slots[self.slot] = (0, 0)
+        ShmRing.close(self)
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, err:
+        return err.errno == errno.EPERM
+    return True
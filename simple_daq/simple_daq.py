@@ -38,9 +38,20 @@ import sys
 import os
 import os.path
 import time
+import threading
+import Queue
 import numpy 
-import comedi as c
 import optparse
+from convert import RawConverter, converter_from_info
+from ringbuffer import RingBuffer
+from timebase import TimeAxis
+from reader import FdReader, PollReader, MmapReader, ReadError
+import backend
+import formats
+import pipeline
+from instrument import get_metrics, METRICS_FORMATS
+from config import Config, ConfigSource, resolve_config, parse_config_file
+from formats import write_samples
 
 PROG_NAME = os.path.basename(sys.argv[0])
 
@@ -60,6 +71,41 @@ DEFAULT_CONFIG_FILE = None
 DEFAULT_VERBOSE = False
 DEFAULT_PLOT = False
 DEFAULT_AREF = 'ground'
+DEFAULT_STREAM = False
+DEFAULT_DURATION = None
+DEFAULT_BLOCK_SIZE = 1000
+DEFAULT_READ_ENGINE = 'read'
+DEFAULT_READ_TIMEOUT = None
+DEFAULT_CALIBRATION = 'auto'
+DEFAULT_METRICS = 'none'
+DEFAULT_METRICS_FILE = None
+DEFAULT_METRICS_PERIOD = None
+DEFAULT_FORMAT = None
+DEFAULT_PRECISION = formats.TEXT_DEFAULT_PRECISION
+DEFAULT_COMPRESSOR = formats.CHUNKED_DEFAULT_COMPRESSOR
+DEFAULT_FILTERS = formats.CHUNKED_DEFAULT_FILTERS
+DEFAULT_LEVEL = formats.CHUNKED_DEFAULT_LEVEL
+DEFAULT_COMPRESS_THREADS = formats.CHUNKED_DEFAULT_THREADS
+DEFAULT_QUEUE_SIZE = pipeline.DEFAULT_QUEUE_SIZE
+DEFAULT_SCOPE = False
+DEFAULT_SCOPE_WINDOW = 5.0       # scope.DEFAULT_WINDOW
+DEFAULT_FRAME_RATE = 10.0        # scope.DEFAULT_FRAME_RATE
+DEFAULT_SCOPE_CPU = 0.25         # scope.DEFAULT_CPU_BUDGET
+DEFAULT_AVERAGE = None
+DEFAULT_DECIMATE = None
+DEFAULT_FIR_TAPS = None
+DEFAULT_SUMMARY = None
+DEFAULT_TRIGGER_CHANNEL = None
+DEFAULT_TRIGGER_LEVEL = 0.0
+DEFAULT_TRIGGER_EDGE = 'rising'
+DEFAULT_PRE_TRIGGER = 1000
+DEFAULT_POST_TRIGGER = 1000
+DEFAULT_HOLDOFF = None
+DEFAULT_SERVER_ADDRESS = '/tmp/simple_daq.sock'   # server.DEFAULT_ADDRESS
+DEFAULT_CLIENT_QUEUE = 64        # server.DEFAULT_CLIENT_QUEUE
+DEFAULT_DROP_POLICY = 'oldest'   # server.DEFAULT_DROP_POLICY
+DEFAULT_SHM_RING = None
+DEFAULT_SHM_SCANS = 1 << 18      # shmring.DEFAULT_CAPACITY
 
 # Comedi command Defaults
 DEFAULT_CMD_FLAGS = 0
@@ -67,6 +113,13 @@ DEFAULT_CMD_SART_ARG = 0
 DEFAULT_CMD_CONVERT_ARG = 5000
 DEFAULT_CMD_TEST_NUM = 4
 
+# Number of blocks in streaming ring buffer
+DEFAULT_RING_BLOCKS = 8
+
+# Ring buffers of scans one device may get ahead of the others when
+# several devices are merged
+MERGE_PENDING_RINGS = 4
+
 # Configuration files
 CURR_DIR_CONFIG = 'daq-config'
 HOME_DIR_CONFIG = '.daq-acquire'
@@ -82,23 +135,6 @@ CMD_TEST_MSG = [
     ]
 NANO_SEC = 1.0e9
 
-def parse_config_file(filename):
-    """
-    Parse configuration file
-    """
-    config = {}
-    fid = open(filename)
-    for line in fid.readlines():
-        line = line.split()
-        if len(line) == 0:
-            continue
-        if line[0] == '#':
-            continue
-        config[line[0].lower()] = reduce(lambda x,y:x+' '+y, line[1:])
-    fid.close()
-    return config
-
-
 def process_options():
     """
     Process command line options using options parser. Returns a dictionary
@@ -141,7 +177,7 @@ def process_options():
     parser.add_option('-d', '--device',
                       type='string',
                       dest='device',
-                      help='select comedi device (e.g. /dev/comedi0)',
+                      help='select comedi device (e.g. /dev/comedi0) or simulated device (sim), several devices separated by spaces are acquired together',
                       default=None
                       )
 
@@ -197,6 +233,251 @@ def process_options():
                       default=None
                       )
 
+    parser.add_option('--stream',
+                      action='store_true',
+                      dest='stream',
+                      help='stream data to output until interrupted or duration reached',
+                      default=None
+                      )
+
+    parser.add_option('-t', '--duration',
+                      type='float',
+                      dest='duration',
+                      help='duration (sec) of streaming acquisition',
+                      default=None
+                      )
+
+    parser.add_option('-b', '--block_size',
+                      type='int',
+                      dest='block_size',
+                      help='number of samples per block in streaming acquisition',
+                      default=None
+                      )
+
+    parser.add_option('--format',
+                      type='string',
+                      dest='format',
+                      help='select output format (text,raw,npy,chunked) - default from output file extension',
+                      default=None
+                      )
+
+    parser.add_option('--precision',
+                      type='int',
+                      dest='precision',
+                      help='number of digits after the decimal point in text output',
+                      default=None
+                      )
+
+    parser.add_option('--average',
+                      type='int',
+                      dest='average',
+                      help='write the mean of each group of AVERAGE samples',
+                      default=None
+                      )
+
+    parser.add_option('--decimate',
+                      type='int',
+                      dest='decimate',
+                      help='low pass filter and write every DECIMATE\'th sample',
+                      default=None
+                      )
+
+    parser.add_option('--fir_taps',
+                      type='int',
+                      dest='fir_taps',
+                      help='number of taps of the decimation filter (default 8*decimate+1)',
+                      default=None
+                      )
+
+    parser.add_option('--summary',
+                      type='int',
+                      dest='summary',
+                      help='write min, max and rms of each channel over SUMMARY samples',
+                      default=None
+                      )
+
+    parser.add_option('--trigger_channel',
+                      type='int',
+                      dest='trigger_channel',
+                      help='write only events triggered by this channel crossing the trigger level',
+                      default=None
+                      )
+
+    parser.add_option('--trigger_level',
+                      type='float',
+                      dest='trigger_level',
+                      help='trigger level (V)',
+                      default=None
+                      )
+
+    parser.add_option('--trigger_edge',
+                      type='string',
+                      dest='trigger_edge',
+                      help='trigger on level crossing (rising,falling,both)',
+                      default=None
+                      )
+
+    parser.add_option('--pre_trigger',
+                      type='int',
+                      dest='pre_trigger',
+                      help='number of samples written before each trigger',
+                      default=None
+                      )
+
+    parser.add_option('--post_trigger',
+                      type='int',
+                      dest='post_trigger',
+                      help='number of samples written from each trigger on',
+                      default=None
+                      )
+
+    parser.add_option('--holdoff',
+                      type='int',
+                      dest='holdoff',
+                      help='number of samples after a trigger during which triggers are ignored (default post_trigger)',
+                      default=None
+                      )
+
+    parser.add_option('--server_address',
+                      type='string',
+                      dest='server_address',
+                      help='daq-server socket - unix socket path or host:port (default %s)'%(DEFAULT_SERVER_ADDRESS,),
+                      default=None
+                      )
+
+    parser.add_option('--client_queue',
+                      type='int',
+                      dest='client_queue',
+                      help='number of blocks queued for each daq-server client',
+                      default=None
+                      )
+
+    parser.add_option('--drop_policy',
+                      type='string',
+                      dest='drop_policy',
+                      help='daq-server blocks dropped when a client falls behind (oldest,newest,disconnect)',
+                      default=None
+                      )
+
+    parser.add_option('--shm_ring',
+                      type='string',
+                      dest='shm_ring',
+                      help='also publish raw scans to the shared memory ring with this name',
+                      default=None
+                      )
+
+    parser.add_option('--shm_scans',
+                      type='int',
+                      dest='shm_scans',
+                      help='number of scans held by the shared memory ring',
+                      default=None
+                      )
+
+    parser.add_option('--compressor',
+                      type='string',
+                      dest='compressor',
+                      help='compressor of chunked output (zlib,bz2,lzma,none)',
+                      default=None
+                      )
+
+    parser.add_option('--filters',
+                      type='string',
+                      dest='filters',
+                      help='filters applied before compressing chunked output, e.g. delta+shuffle or none',
+                      default=None
+                      )
+
+    parser.add_option('--level',
+                      type='int',
+                      dest='level',
+                      help='compression level of chunked output',
+                      default=None
+                      )
+
+    parser.add_option('--compress_threads',
+                      type='int',
+                      dest='compress_threads',
+                      help='number of threads compressing chunked output (0 = writer thread)',
+                      default=None
+                      )
+
+    parser.add_option('--queue_size',
+                      type='int',
+                      dest='queue_size',
+                      help='number of blocks queued for the writer thread',
+                      default=None
+                      )
+
+    parser.add_option('-e', '--read_engine',
+                      type='string',
+                      dest='read_engine',
+                      help='select read engine (read,poll,mmap)',
+                      default=None
+                      )
+
+    parser.add_option('--read_timeout',
+                      type='float',
+                      dest='read_timeout',
+                      help='time (sec) to wait for data before giving up (poll and mmap read engines)',
+                      default=None
+                      )
+
+    parser.add_option('--scope',
+                      action='store_true',
+                      dest='scope',
+                      help='show live scope view of the last scope_window seconds during acquisition',
+                      default=None
+                      )
+
+    parser.add_option('--scope_window',
+                      type='float',
+                      dest='scope_window',
+                      help='length (sec) of data shown in scope view',
+                      default=None
+                      )
+
+    parser.add_option('--frame_rate',
+                      type='float',
+                      dest='frame_rate',
+                      help='scope view frames per second',
+                      default=None
+                      )
+
+    parser.add_option('--scope_cpu',
+                      type='float',
+                      dest='scope_cpu',
+                      help='maximum fraction of one cpu used for drawing scope view (0-1)',
+                      default=None
+                      )
+
+    parser.add_option('--calibration',
+                      type='string',
+                      dest='calibration',
+                      help='use device calibration polynomials when available (auto,none)',
+                      default=None
+                      )
+
+    parser.add_option('--metrics',
+                      type='string',
+                      dest='metrics',
+                      help='report acquisition metrics (none,text,json)',
+                      default=None
+                      )
+
+    parser.add_option('--metrics_file',
+                      type='string',
+                      dest='metrics_file',
+                      help='file for metrics reports (default = stderr)',
+                      default=None
+                      )
+
+    parser.add_option('--metrics_period',
+                      type='float',
+                      dest='metrics_period',
+                      help='time (sec) between metrics reports while streaming',
+                      default=None
+                      )
+
     # Parse input options 
     options, args = parser.parse_args()
 
@@ -216,23 +497,28 @@ def process_config(config, src_str):
     is checked for possible problems.
 
     This function is used when initial configuration dictionary is read from 
-    a text based configuration file. 
+    a text based configuration file. src_str, used in error messages, is
+    the name of the source of the configuration or a ConfigSource giving
+    the source of each option.
 
     Note: the error checking here is really poor. In a better world I would
     query the daq card and check the options versus what I find there.
 
     """
+    source = src_str
+    if isinstance(source, basestring):
+        source = ConfigSource(src_str)
     
     if 'sample_num' in config:
         # Convert and check sample_num
         try:
             config['sample_num'] = int(config['sample_num'])
         except ValueError:
-            err_msg = '%s: error: %s: invalid sample number value\n'%(PROG_NAME,src_str)
+            err_msg = '%s: error: %s: invalid sample number value\n'%(PROG_NAME,source['sample_num'])
             sys.stderr.write(err_msg)
             sys.exit(1)
         if config['sample_num'] <= 0:
-            err_msg = '%s: error: %s: number of sample must be > 0\n'%(PROG_NAME,src_str)
+            err_msg = '%s: error: %s: number of sample must be > 0\n'%(PROG_NAME,source['sample_num'])
             sys.stderr.write(err_msg)
             sys.exit(1)
     
@@ -241,11 +527,11 @@ def process_config(config, src_str):
         try:
             config['sample_freq'] = int(config['sample_freq'])
         except ValueError:
-            err_msg = '%s: error: %s: invalid sample frequency value\n'%(PROG_NAME,src_str)
+            err_msg = '%s: error: %s: invalid sample frequency value\n'%(PROG_NAME,source['sample_freq'])
             sys.stderr.write(err_msg)
             sys.exit(1)
         if config['sample_freq'] <= 0:
-            err_msg = '%s: error: %s: sample frequency must be > 0\n'%(PROG_NAME,src_str)
+            err_msg = '%s: error: %s: sample frequency must be > 0\n'%(PROG_NAME,source['sample_freq'])
             sys.stderr.write(err_msg)
             sys.exit(1)
     
@@ -255,7 +541,7 @@ def process_config(config, src_str):
             try:
                 config['channels'] = [int(x) for x in config['channels'].split()]
             except ValueError:
-                err_msg = '%s: error: %s: invalid channel values\n'%(PROG_NAME,src_str)
+                err_msg = '%s: error: %s: invalid channel values\n'%(PROG_NAME,source['channels'])
                 sys.stderr.write(err_msg)
                 sys.exit(1)
     
@@ -265,7 +551,7 @@ def process_config(config, src_str):
             if x < 0:
                 fail = True
         if fail:
-            err_msg = '%s: error: %s: channel values must be >= 0\n'%(PROG_NAME,src_str)
+            err_msg = '%s: error: %s: channel values must be >= 0\n'%(PROG_NAME,source['channels'])
             sys.stderr.write(err_msg)
             sys.exit(1)
 
@@ -275,7 +561,7 @@ def process_config(config, src_str):
                 # Convert and check gains 
                 config['gains'] = [int(x) for x in config['gains'].split()]
             except ValueError:
-                err_msg = '%s: error: %s: invalid gain values %s\n'%(PROG_NAME,src_str,config['gains'])
+                err_msg = '%s: error: %s: invalid gain values %s\n'%(PROG_NAME,source['gains'],config['gains'])
                 sys.stderr.write(err_msg)
                 sys.exit(1)
         fail = False
@@ -283,7 +569,7 @@ def process_config(config, src_str):
             if x < MIN_GAIN or x > MAX_GAIN:
                 fail = True
         if fail:
-            err_msg = '%s: error: %s: gains must be between 0 and 3\n'%(PROG_NAME,src_str)
+            err_msg = '%s: error: %s: gains must be between 0 and 3\n'%(PROG_NAME,source['gains'])
             sys.stderr.write(err_msg)
             sys.exit(1)
 
@@ -295,7 +581,7 @@ def process_config(config, src_str):
         if not (ngains == nchans or ngains == 1):
             err_msg = '\n \tchannels: %s\n'%(config['channels'],)
             err_msg += '\tgains: %s\n\n'%(config['gains'],)
-            err_msg += '%s: error: %s: the number of gain values be equal '%(PROG_NAME,src_str)
+            err_msg += '%s: error: %s: the number of gain values be equal '%(PROG_NAME,source['gains'])
             err_msg += 'to 1 or to the number of channels\n'
             sys.stderr.write(err_msg)
             sys.exit(1)
@@ -308,13 +594,385 @@ def process_config(config, src_str):
         try:
             config['subdev'] = int(config['subdev'])
         except ValueError:
-            err_msg = "%s: error: %s: invalid subdevice value '%s'"%(PROG_NAME,src_str,config['subdev'])
+            err_msg = "%s: error: %s: invalid subdevice value '%s'"%(PROG_NAME,source['subdev'],config['subdev'])
             sys.stderr.write(err_msg)
             sys.exit(1)
 
     if 'aref' in config:
         if not config['aref'] in ('diff', 'ground', 'common'):
-            err_msg = "%s: error: %s: invalid reference mode '%s'"%(PROG_NAME,src_str,config['aref'])
+            err_msg = "%s: error: %s: invalid reference mode '%s'"%(PROG_NAME,source['aref'],config['aref'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'read_engine' in config:
+        if not config['read_engine'] in ('read', 'poll', 'mmap'):
+            err_msg = "%s: error: %s: invalid read engine '%s'"%(PROG_NAME,source['read_engine'],config['read_engine'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'read_timeout' in config and config['read_timeout'] is not None:
+        # Convert and check read timeout
+        try:
+            config['read_timeout'] = float(config['read_timeout'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid read timeout value\n'%(PROG_NAME,source['read_timeout'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['read_timeout'] <= 0:
+            err_msg = '%s: error: %s: read timeout must be > 0\n'%(PROG_NAME,source['read_timeout'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'calibration' in config:
+        if not config['calibration'] in ('auto', 'none'):
+            err_msg = "%s: error: %s: invalid calibration '%s'"%(PROG_NAME,source['calibration'],config['calibration'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'metrics' in config:
+        if not config['metrics'] in METRICS_FORMATS:
+            err_msg = "%s: error: %s: invalid metrics format '%s'"%(PROG_NAME,source['metrics'],config['metrics'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'metrics_period' in config and config['metrics_period'] is not None:
+        # Convert and check metrics reporting period
+        try:
+            config['metrics_period'] = float(config['metrics_period'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid metrics period value\n'%(PROG_NAME,source['metrics_period'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['metrics_period'] <= 0:
+            err_msg = '%s: error: %s: metrics period must be > 0\n'%(PROG_NAME,source['metrics_period'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'format' in config and config['format'] is not None:
+        if not config['format'] in formats.FORMATS:
+            err_msg = "%s: error: %s: invalid output format '%s'"%(PROG_NAME,source['format'],config['format'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'precision' in config:
+        # Convert and check text output precision
+        try:
+            config['precision'] = int(config['precision'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid precision value\n'%(PROG_NAME,source['precision'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['precision'] < 0:
+            err_msg = '%s: error: %s: precision must be >= 0\n'%(PROG_NAME,source['precision'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'compressor' in config and config['compressor'] != DEFAULT_COMPRESSOR:
+        # Check chunked output compressor - the defaults are valid so
+        # codec.py, like the other optional modules, is only loaded here
+        # for other values
+        import codec
+        if not config['compressor'] in codec.COMPRESSORS:
+            err_msg = "%s: error: %s: unknown compressor '%s'\n"%(PROG_NAME,source['compressor'],config['compressor'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'filters' in config and config['filters'] != DEFAULT_FILTERS:
+        # Check chunked output filters
+        import codec
+        try:
+            codec.parse_filters(config['filters'])
+        except ValueError, err:
+            err_msg = '%s: error: %s: %s\n'%(PROG_NAME,source['filters'],err)
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'level' in config:
+        # Convert and check compression level
+        try:
+            config['level'] = int(config['level'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid level value\n'%(PROG_NAME,source['level'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['level'] < 0 or config['level'] > 9:
+            err_msg = '%s: error: %s: level must be between 0 and 9\n'%(PROG_NAME,source['level'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'compress_threads' in config:
+        # Convert and check number of compression threads
+        try:
+            config['compress_threads'] = int(config['compress_threads'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid compress threads value\n'%(PROG_NAME,source['compress_threads'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['compress_threads'] < 0:
+            err_msg = '%s: error: %s: compress threads must be >= 0\n'%(PROG_NAME,source['compress_threads'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'queue_size' in config:
+        # Convert and check writer queue size
+        try:
+            config['queue_size'] = int(config['queue_size'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid queue size value\n'%(PROG_NAME,source['queue_size'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['queue_size'] <= 0:
+            err_msg = '%s: error: %s: queue size must be > 0\n'%(PROG_NAME,source['queue_size'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'stream' in config:
+        # Convert and check stream flag
+        if not type(config['stream']) == bool:
+            value = str(config['stream']).lower()
+            if value in ('true', 'yes', 'on', '1'):
+                config['stream'] = True
+            elif value in ('false', 'no', 'off', '0'):
+                config['stream'] = False
+            else:
+                err_msg = "%s: error: %s: invalid stream value '%s'"%(PROG_NAME,source['stream'],config['stream'])
+                sys.stderr.write(err_msg)
+                sys.exit(1)
+
+    if 'duration' in config and config['duration'] is not None:
+        # Convert and check streaming duration
+        try:
+            config['duration'] = float(config['duration'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid duration value\n'%(PROG_NAME,source['duration'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['duration'] <= 0:
+            err_msg = '%s: error: %s: duration must be > 0\n'%(PROG_NAME,source['duration'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'block_size' in config:
+        # Convert and check streaming block size
+        try:
+            config['block_size'] = int(config['block_size'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid block size value\n'%(PROG_NAME,source['block_size'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['block_size'] <= 0:
+            err_msg = '%s: error: %s: block size must be > 0\n'%(PROG_NAME,source['block_size'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'average' in config and config['average'] is not None:
+        # Convert and check block averaging length
+        try:
+            config['average'] = int(config['average'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid average value\n'%(PROG_NAME,source['average'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['average'] <= 0:
+            err_msg = '%s: error: %s: average must be > 0\n'%(PROG_NAME,source['average'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'decimate' in config and config['decimate'] is not None:
+        # Convert and check decimation factor
+        try:
+            config['decimate'] = int(config['decimate'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid decimate value\n'%(PROG_NAME,source['decimate'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['decimate'] <= 0:
+            err_msg = '%s: error: %s: decimate must be > 0\n'%(PROG_NAME,source['decimate'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'fir_taps' in config and config['fir_taps'] is not None:
+        # Convert and check number of decimation filter taps
+        try:
+            config['fir_taps'] = int(config['fir_taps'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid fir taps value\n'%(PROG_NAME,source['fir_taps'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['fir_taps'] <= 0:
+            err_msg = '%s: error: %s: fir taps must be > 0\n'%(PROG_NAME,source['fir_taps'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'summary' in config and config['summary'] is not None:
+        # Convert and check summary length
+        try:
+            config['summary'] = int(config['summary'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid summary value\n'%(PROG_NAME,source['summary'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['summary'] <= 0:
+            err_msg = '%s: error: %s: summary must be > 0\n'%(PROG_NAME,source['summary'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'trigger_channel' in config and config['trigger_channel'] is not None:
+        # Convert and check trigger channel
+        try:
+            config['trigger_channel'] = int(config['trigger_channel'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid trigger channel value\n'%(PROG_NAME,source['trigger_channel'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['trigger_channel'] < 0:
+            err_msg = '%s: error: %s: trigger channel must be >= 0\n'%(PROG_NAME,source['trigger_channel'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'trigger_level' in config:
+        # Convert and check trigger level
+        try:
+            config['trigger_level'] = float(config['trigger_level'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid trigger level value\n'%(PROG_NAME,source['trigger_level'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'trigger_edge' in config:
+        # Check trigger edge
+        config['trigger_edge'] = str(config['trigger_edge']).lower()
+        if config['trigger_edge'] != DEFAULT_TRIGGER_EDGE:
+            import trigger
+            if not config['trigger_edge'] in trigger.TRIGGER_EDGES:
+                err_msg = "%s: error: %s: unknown trigger edge '%s'\n"%(PROG_NAME,source['trigger_edge'],config['trigger_edge'])
+                sys.stderr.write(err_msg)
+                sys.exit(1)
+
+    if 'pre_trigger' in config:
+        # Convert and check number of pre-trigger samples
+        try:
+            config['pre_trigger'] = int(config['pre_trigger'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid pre trigger value\n'%(PROG_NAME,source['pre_trigger'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['pre_trigger'] < 0:
+            err_msg = '%s: error: %s: pre trigger must be >= 0\n'%(PROG_NAME,source['pre_trigger'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'post_trigger' in config:
+        # Convert and check number of post-trigger samples
+        try:
+            config['post_trigger'] = int(config['post_trigger'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid post trigger value\n'%(PROG_NAME,source['post_trigger'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['post_trigger'] <= 0:
+            err_msg = '%s: error: %s: post trigger must be > 0\n'%(PROG_NAME,source['post_trigger'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'holdoff' in config and config['holdoff'] is not None:
+        # Convert and check trigger hold-off
+        try:
+            config['holdoff'] = int(config['holdoff'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid holdoff value\n'%(PROG_NAME,source['holdoff'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['holdoff'] < 0:
+            err_msg = '%s: error: %s: holdoff must be >= 0\n'%(PROG_NAME,source['holdoff'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'client_queue' in config:
+        # Convert and check daq-server client queue size
+        try:
+            config['client_queue'] = int(config['client_queue'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid client queue value\n'%(PROG_NAME,source['client_queue'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['client_queue'] <= 0:
+            err_msg = '%s: error: %s: client queue must be > 0\n'%(PROG_NAME,source['client_queue'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'drop_policy' in config:
+        # Check daq-server drop policy
+        config['drop_policy'] = str(config['drop_policy']).lower()
+        if config['drop_policy'] != DEFAULT_DROP_POLICY:
+            import server
+            if not config['drop_policy'] in server.DROP_POLICIES:
+                err_msg = "%s: error: %s: unknown drop policy '%s'\n"%(PROG_NAME,source['drop_policy'],config['drop_policy'])
+                sys.stderr.write(err_msg)
+                sys.exit(1)
+
+    if 'shm_scans' in config:
+        # Convert and check shared memory ring size
+        try:
+            config['shm_scans'] = int(config['shm_scans'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid shm scans value\n'%(PROG_NAME,source['shm_scans'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['shm_scans'] <= 0:
+            err_msg = '%s: error: %s: shm scans must be > 0\n'%(PROG_NAME,source['shm_scans'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'scope' in config:
+        # Convert and check scope flag
+        if not type(config['scope']) == bool:
+            value = str(config['scope']).lower()
+            if value in ('true', 'yes', 'on', '1'):
+                config['scope'] = True
+            elif value in ('false', 'no', 'off', '0'):
+                config['scope'] = False
+            else:
+                err_msg = "%s: error: %s: invalid scope value '%s'"%(PROG_NAME,source['scope'],config['scope'])
+                sys.stderr.write(err_msg)
+                sys.exit(1)
+
+    if 'scope_window' in config:
+        # Convert and check scope window length
+        try:
+            config['scope_window'] = float(config['scope_window'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid scope window value\n'%(PROG_NAME,source['scope_window'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['scope_window'] <= 0:
+            err_msg = '%s: error: %s: scope window must be > 0\n'%(PROG_NAME,source['scope_window'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'frame_rate' in config:
+        # Convert and check scope frame rate
+        try:
+            config['frame_rate'] = float(config['frame_rate'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid frame rate value\n'%(PROG_NAME,source['frame_rate'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['frame_rate'] <= 0:
+            err_msg = '%s: error: %s: frame rate must be > 0\n'%(PROG_NAME,source['frame_rate'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+
+    if 'scope_cpu' in config:
+        # Convert and check scope cpu budget
+        try:
+            config['scope_cpu'] = float(config['scope_cpu'])
+        except ValueError:
+            err_msg = '%s: error: %s: invalid scope cpu value\n'%(PROG_NAME,source['scope_cpu'])
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+        if config['scope_cpu'] <= 0 or config['scope_cpu'] > 1:
+            err_msg = '%s: error: %s: scope cpu must be > 0 and <= 1\n'%(PROG_NAME,source['scope_cpu'])
             sys.stderr.write(err_msg)
             sys.exit(1)
     
@@ -328,11 +986,12 @@ def set_config():
 
     The order a precedence is command line options, command line configuration
     file, current directory configuration file, home directory configuration
-    file. 
+    file. Returns a read only Config - the layers are merged first and
+    process_config is run once on the result.
     """
 
     # Set confguration to default values
-    config = {
+    defaults = {
         'device': DEFAULT_DEVICE,
         'sample_num' : DEFAULT_SAMPLE_NUM,
         'sample_freq' : DEFAULT_SAMPLE_FREQ,
@@ -343,15 +1002,47 @@ def set_config():
         'config_file' : DEFAULT_CONFIG_FILE,
         'verbose': DEFAULT_VERBOSE,
         'plot' : DEFAULT_PLOT, 
-        'aref' : DEFAULT_AREF
+        'aref' : DEFAULT_AREF,
+        'stream' : DEFAULT_STREAM,
+        'duration' : DEFAULT_DURATION,
+        'block_size' : DEFAULT_BLOCK_SIZE,
+        'read_engine' : DEFAULT_READ_ENGINE,
+        'read_timeout' : DEFAULT_READ_TIMEOUT,
+        'calibration' : DEFAULT_CALIBRATION,
+        'metrics' : DEFAULT_METRICS,
+        'metrics_file' : DEFAULT_METRICS_FILE,
+        'metrics_period' : DEFAULT_METRICS_PERIOD,
+        'format' : DEFAULT_FORMAT,
+        'precision' : DEFAULT_PRECISION,
+        'compressor' : DEFAULT_COMPRESSOR,
+        'filters' : DEFAULT_FILTERS,
+        'level' : DEFAULT_LEVEL,
+        'compress_threads' : DEFAULT_COMPRESS_THREADS,
+        'queue_size' : DEFAULT_QUEUE_SIZE,
+        'scope' : DEFAULT_SCOPE,
+        'scope_window' : DEFAULT_SCOPE_WINDOW,
+        'frame_rate' : DEFAULT_FRAME_RATE,
+        'scope_cpu' : DEFAULT_SCOPE_CPU,
+        'average' : DEFAULT_AVERAGE,
+        'decimate' : DEFAULT_DECIMATE,
+        'fir_taps' : DEFAULT_FIR_TAPS,
+        'summary' : DEFAULT_SUMMARY,
+        'trigger_channel' : DEFAULT_TRIGGER_CHANNEL,
+        'trigger_level' : DEFAULT_TRIGGER_LEVEL,
+        'trigger_edge' : DEFAULT_TRIGGER_EDGE,
+        'pre_trigger' : DEFAULT_PRE_TRIGGER,
+        'post_trigger' : DEFAULT_POST_TRIGGER,
+        'holdoff' : DEFAULT_HOLDOFF,
+        'server_address' : DEFAULT_SERVER_ADDRESS,
+        'client_queue' : DEFAULT_CLIENT_QUEUE,
+        'drop_policy' : DEFAULT_DROP_POLICY,
+        'shm_ring' : DEFAULT_SHM_RING,
+        'shm_scans' : DEFAULT_SHM_SCANS,
         }
-    process_config(config, 'default config')
 
     # Get configuration information from command line options
     options_config = process_options()
-    process_config(options_config, 'command line config')
-    config.update(options_config)
-    used_config_keys = options_config.keys()
+    layers = [('command line config', options_config)]
 
     # Look for configuration files 
     curr_dir = os.getcwd()
@@ -361,36 +1052,33 @@ def set_config():
     curr_config_exists =  os.path.exists(curr_dir_config_file)
     home_config_exists =  os.path.exists(home_dir_config_file)
 
-
     # If there is a configuration file specified on the command line 
     if  'config_file' in options_config:
         config_file_exists = os.path.exists(options_config['config_file']) 
         if config_file_exists: 
             try:
-                # Read custom config file and update config 
-                file_config = parse_config_file(options_config['config_file'])
-
+                # Read custom config file
+                layers.append(('file config option -i', parse_config_file(options_config['config_file'])))
             except IOError:
                 msg_data = (PROG_NAME, options_config['config_file'],)
                 err_msg = "%s: error: option -i: unable to parse configuration file '%s'"%msg_data
                 sys.stderr.write(err_msg)
                 sys.exit(1)
-
-            # Remove items from file config which are already in options config 
-            for key in used_config_keys:
-                try:
-                    del file_config[key]
-                except:
-                    pass
-            process_config(file_config, 'file config option -i')
-            config.update(file_config)
-            used_config_keys+=file_config.keys()
         else:
             msg_data = (PROG_NAME, options_config['config_file'],)
             err_msg = "%s: error: option -i: configuration file '%s' not found"%msg_data
             sys.stderr.write(err_msg)
             sys.exit(1)
-            
+
+    if curr_config_exists:
+        layers.append(('daq_config', parse_config_file(curr_dir_config_file)))
+    if home_config_exists:
+        layers.append(('.daq_acquire', parse_config_file(home_dir_config_file)))
+    layers.append(('default config', defaults))
+
+    # Merge the layers and process the combined configuration once
+    config = resolve_config(layers, process_config)
+
     if config['verbose']:
         print 
         print 'configuration files'
@@ -404,91 +1092,62 @@ def set_config():
         print '\thome_dir_config: %s, exists: %s'%(home_dir_config_file,home_config_exists)
         print
 
-
-    # If there are unused configuration options try loading daq_config
-    if (not len(used_config_keys)==len(config.keys())) and curr_config_exists:
-        curr_dir_config = parse_config_file(curr_dir_config_file)
-
-        # Remove item from config which have already been used
-        for key in used_config_keys:
-            try:
-                del curr_dir_config[key]
-            except:
-                pass
-        process_config(curr_dir_config, 'daq_config')
-        config.update(curr_dir_config)
-        used_config_keys+=curr_dir_config.keys()
-
-
-    # If there are still unused configuration options try loading $HOME/.daq_acquire
-    if (not len(used_config_keys)==len(config.keys())) and home_config_exists:
-        home_dir_config = parse_config_file(home_dir_config_file)
-
-        # Remove item from config which have already been used
-        for key in used_config_keys:
-            try:
-                del home_dir_config[key]
-            except:
-                pass
-        process_config(home_dir_config, '.daq_acquire')
-        config.update(home_dir_config)
-        used_config_keys+=home_dir_config.keys()
-
-    # Process combined configuration to check for errors
-    process_config(config, 'combined config')
     return config
 
-def acquire_data(config):
+def open_device(config, metrics=None):
     """
-    Acquire data from data acquisition device. 
+    Open the device given in the configuration. Returns the device backend.
     """
-    
-    #Open a comedi device
-    dev=c.comedi_open(config['device'])
-    if not dev:
-        err_msg = "%s: error: unable to open openning Comedi device"%(PROG_NAME,)
+    metrics = get_metrics(metrics)
+    t0 = metrics.start()
+    try:
+        device = backend.get_device(config['device'])
+        device.open()
+    except (IOError, ImportError, ValueError), err:
+        err_msg = "%s: error: unable to open device '%s' - %s\n"%(PROG_NAME,config['device'],err)
         sys.stderr.write(err_msg)
         sys.exit(1)
+    metrics.stop('open', t0)
+    return device
 
-    # Get a file-descriptor to access data
-    fd = c.comedi_fileno(dev)
-
+def get_cmd(device, config, stop_src, stop_arg, metrics=None):
+    """
+    Construct and test a comedi command for the configured channels with
+    the given stop source and argument.
+    """
+    metrics = get_metrics(metrics)
     # Setup channels
     nchans = len(config['channels'])
     aref_str = config['aref'].lower()
     if aref_str == 'diff':
-        aref =[c.AREF_DIFF]*nchans
+        aref =[backend.AREF_DIFF]*nchans
     elif aref_str == 'common':
-        aref =[c.AREF_COMMON]*nchans
+        aref =[backend.AREF_COMMON]*nchans
     elif aref_str == 'ground':
-        aref =[c.AREF_GROUND]*nchans
+        aref =[backend.AREF_GROUND]*nchans
     else:
         raise ValueError, 'unknown aref'
 
-    #nchans = len(config['channels'])
-    #aref =[c.AREF_GROUND]*nchans
-
-    # Pack the channel, gain and reference information into the chanlist object
-    channel_list = c.chanlist(nchans)
+    # Pack the channel, gain and reference information for the chanlist
+    chanspecs = []
     for i in range(nchans):
-	channel_list[i]=c.cr_pack(config['channels'][i], config['gains'][i], aref[i])
+        chanspecs.append(backend.cr_pack(config['channels'][i], config['gains'][i], aref[i]))
 
     # Construct a comedi command 
-    cmd = c.comedi_cmd_struct()
+    cmd = device.cmd_struct(chanspecs)
+
     cmd.subdev = config['subdev']
     cmd.flags = DEFAULT_CMD_FLAGS
-    cmd.start_src = c.TRIG_NOW
+    cmd.start_src = backend.TRIG_NOW
     cmd.sart_arg = DEFAULT_CMD_SART_ARG
-    cmd.scan_begin_src = c.TRIG_TIMER
+    cmd.scan_begin_src = backend.TRIG_TIMER
     cmd.scan_begin_arg = int(NANO_SEC/config['sample_freq'])
-    cmd.convert_src = c.TRIG_TIMER
+    cmd.convert_src = backend.TRIG_TIMER
     cmd.convert_arg = DEFAULT_CMD_CONVERT_ARG
-    cmd.scan_end_src = c.TRIG_COUNT
+    cmd.scan_end_src = backend.TRIG_COUNT
     cmd.scan_end_arg = nchans
-    cmd.stop_src = c.TRIG_COUNT
-    cmd.stop_arg = config['sample_num']
-    cmd.chanlist = channel_list
-    cmd.chanlist_len = nchans
+    cmd.stop_src = stop_src
+    cmd.stop_arg = stop_arg
 
     # Test comedi command
     if config['verbose']:
@@ -497,7 +1156,9 @@ def acquire_data(config):
     for i in range(0,DEFAULT_CMD_TEST_NUM):
         if config['verbose']:
             print_cmd(cmd)
-        ret = c.comedi_command_test(dev,cmd)
+        t0 = metrics.start()
+        ret = device.command_test(cmd)
+        metrics.stop('cmd_test', t0)
         if config['verbose']:
             print 
             print '\t*** test %d returns %s'%(i, CMD_TEST_MSG[ret])
@@ -506,82 +1167,474 @@ def acquire_data(config):
         msg_data = (PROG_NAME, CMD_TEST_MSG[ret])
         err_msg = '%s: error: unable to configure daq device - %s'%msg_data
         sys.stderr.write(err_msg)
+    return cmd
 
-    # Acquire data
+def start_cmd(device, cmd, config):
+    """
+    Start execution of comedi command.
+    """
     if config['verbose']:
         print 'acquiring data'
         print 
         sys.stdout.flush()
-    ret = c.comedi_command(dev,cmd) # non blocking
+    ret = device.command(cmd) # non blocking
     if not ret == 0:
         err_msg = '%s: error: unable to execute comedi command'%(PROG_NAME,)
         sys.stderr.write(err_msg)
         sys.exit(1)
 
-    # Read data from buffer - may want to add a timeout here
-    read_done = False
-    bytes_total = 2*config['sample_num']*nchans
-    bytes_read = 0
-    datastr = ''
-    while not read_done:
+def get_reader(device, config):
+    """
+    Get the read engine selected in the configuration. The mmap engine
+    falls back to the poll engine if the comedi buffer cannot be mapped.
+    The poll engine records the kernel buffer fill when the buffer is
+    available. Devices which can only be read through the kernel buffer
+    always use the mmap engine.
+    """
+    timeout = config.get('read_timeout')
+    if not device.fd_readable:
+        return MmapReader(device.fileno(), device.buffer(config['subdev']), timeout)
+    if config['read_engine'] == 'mmap':
         try:
-            buffstr = os.read(fd,bytes_total)
-        except OSError, err:
-            if err.args[0]==4:
-                continue
-            raise                
-        datastr += buffstr
-        bytes_read += len(buffstr)
+            return MmapReader(device.fileno(), device.buffer(config['subdev']), timeout)
+        except EnvironmentError, err:
+            if config['verbose']:
+                print 'mmap read engine not available (%s), using poll'%(err,)
+    if config['read_engine'] in ('poll', 'mmap'):
+        try:
+            buffer = device.buffer(config['subdev'])
+        except EnvironmentError:
+            buffer = None
+        return PollReader(device.fileno(), buffer, timeout)
+    return FdReader(device.fileno())
+
+def print_sample_freq(config, sample_t_true):
+    """
+    Display desired and actual sample frequencies
+    """
+    sample_t = (1.0/float(config['sample_freq']))
+    print
+    print 'sample frequencies'
+    print 
+    print '\tdesired sample freq: ', 1.0/sample_t
+    print '\tactual sample freq: ', 1.0/sample_t_true
+    print 
+
+class DaqSession(object):
+    """
+    Acquisition session which keeps the data acquisition device open
+    between acquisitions. The comedi command is built and tested, and the
+    range and maxdata of each channel looked up, once when the session is
+    opened so each acquisition only re-arms the command and reads the
+    samples. Can be used as a context manager e.g.
+
+        with DaqSession(config) as session:
+            for i in range(burst_num):
+                t, samples = session.acquire()
+    """
+
+    def __init__(self, config, metrics=None):
+        self.config = config
+        self.metrics = get_metrics(metrics)
+        self.device = None
+        self.reader = None
+
+    def open(self):
+        """
+        Open the device and prepare the command for acquisitions of
+        config['sample_num'] samples.
+        """
+        config = self.config
+        self.device = open_device(config, self.metrics)
+        self.nchans = len(config['channels'])
+        self.cmd = get_cmd(self.device, config, backend.TRIG_COUNT, config['sample_num'], self.metrics)
+        self.converter = get_converter(self.device, config)
+        self.sample_t_true = self.cmd.scan_begin_arg/NANO_SEC
+        self.convert_t_true = self.cmd.convert_arg/NANO_SEC
+        self.start_time = None
+        self.reader = get_reader(self.device, config)
+        self.raw = numpy.empty((self.cmd.stop_arg, self.nchans), dtype=numpy.uint16)
+        self.armed = False
         if config['verbose']:
-            print '\tread:', bytes_read, 'of', 2*config['sample_num']*nchans, 'bytes'
-        if bytes_read == bytes_total:
-            read_done = True
-        
-    # Convert from string to integers
-    dataarray = numpy.fromstring(datastr, numpy.uint16)
-
-    # Unpack data from long array and convert to volts
-    array_list = []
-    for i in range(0,nchans):
-
-        # Get channel information
-        channel = config['channels'][i]
-        gain = config['gains'][i]
-        subdev = config['subdev']
-        maxdata = c.comedi_get_maxdata(dev,subdev, channel)
-        cr = c.comedi_get_range(dev,subdev,channel,gain)
-
-        # Convert to voltages
-        temp_array = dataarray[i::nchans]
-        temp_array = numpy.array([c.comedi_to_phys(int(x),cr,maxdata)for x in temp_array])
-        temp_array = numpy.reshape(temp_array,(temp_array.shape[0],1))
-        array_list.append(temp_array)
-
-    # Form sample_num x nchans array
-    samples = numpy.concatenate(tuple(array_list),1)
-    n,m = samples.shape
+            print_sample_freq(config, self.sample_t_true)
+        return self
+
+    def acquire(self, sample_num=None):
+        """
+        Acquire sample_num samples (default config['sample_num']). Returns
+        t, samples where samples is a sample_num x nchans array in physical
+        units and t is the TimeAxis of the scans - t.for_channel(k) gives
+        the times of the samples in column k and t.start_time is the wall
+        clock time of the start of the acquisition.
+        """
+        if self.device is None:
+            self.open()
+        config = self.config
+        cmd = self.cmd
+        if sample_num is None:
+            sample_num = config['sample_num']
+        if sample_num != cmd.stop_arg:
+            cmd.stop_arg = sample_num
+            ret = self.device.command_test(cmd)
+            if not ret == 0:
+                msg_data = (PROG_NAME, CMD_TEST_MSG[ret])
+                err_msg = '%s: error: unable to configure daq device - %s'%msg_data
+                sys.stderr.write(err_msg)
+            self.raw = numpy.empty((cmd.stop_arg, self.nchans), dtype=numpy.uint16)
+
+        # Acquire data - make sure the previous command has finished first
+        if self.armed:
+            self.device.cancel(config['subdev'])
+        start_cmd(self.device, cmd, config)
+        self.start_time = time.time()
+        self.armed = True
+
+        # Read data directly into sample_num x nchans array - see read_timeout
+        raw = self.raw
+        bytes_total = raw.nbytes
+        metrics = self.metrics
+        if metrics.enabled:
+            # Each read is timed from the end of the previous one
+            last = {'bytes' : 0, 't' : metrics.start()}
+            def record_read(bytes_read):
+                metrics.stop('read', last['t'])
+                metrics.record_read(bytes_read - last['bytes'])
+                last['bytes'] = bytes_read
+                last['t'] = metrics.start()
+        else:
+            record_read = None
+        try:
+            bytes_read = self.reader.fill(raw, record_read)
+        except:
+            self.device.cancel(config['subdev'])
+            raise
+        if bytes_read < bytes_total:
+            # Acquisition ended early - keep whole scans only
+            raw = raw[:bytes_read//(2*self.nchans)]
+        metrics.record_scans(raw.shape[0], self.nchans)
+
+        # Convert to volts and form sample_num x nchans array
+        t0 = metrics.start()
+        samples = self.converter.convert(raw)
+        metrics.stop('convert', t0)
+        n,m = samples.shape
 
-    if config['verbose']:
-        print 
-        print 'acquired data array w/ size: %dx%d'%(n,m)
+        if config['verbose']:
+            print 
+            print 'read: %d of %d bytes'%(bytes_read, bytes_total)
+            print 'acquired data array w/ size: %dx%d'%(n,m)
+
+        # Time axis - scan i at i*sample_t_true, created when used
+        t = TimeAxis(0, n, self.sample_t_true, self.convert_t_true, self.start_time)
+        return t,samples
+
+    def close(self):
+        """
+        Close the acquisition device.
+        """
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    def __enter__(self):
+        if self.device is None:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def acquire_data(config, metrics=None):
+    """
+    Acquire data from data acquisition device. 
+    """
+    session = DaqSession(config, metrics)
+    try:
+        return session.acquire()
+    finally:
+        session.close()
 
-    # Create time array
-    sample_t = (1.0/float(config['sample_freq']))
+def get_stop(config):
+    """
+    Returns comedi command stop source and argument for a streaming
+    acquisition. If config['duration'] is set the acquisition stops after
+    that many seconds, if config['stream'] is set it runs until cancelled
+    and otherwise it stops after config['sample_num'] samples.
+    """
+    if config['duration'] is not None:
+        stop_arg = max(int(round(config['duration']*config['sample_freq'])), 1)
+        return backend.TRIG_COUNT, stop_arg
+    if config['stream']:
+        return backend.TRIG_NONE, 0
+    return backend.TRIG_COUNT, config['sample_num']
+
+def get_info(cmd, config, converter):
+    """
+    Returns dictionary of acquisition information used by output writers.
+    """
+    if cmd.stop_src == backend.TRIG_COUNT:
+        sample_num = cmd.stop_arg
+    else:
+        sample_num = None
+    return {
+        'device' : config['device'],
+        'subdev' : config['subdev'],
+        'channels' : list(config['channels']),
+        'gains' : list(config['gains']),
+        'aref' : config['aref'],
+        'ranges' : [list(r) for r in converter.ranges],
+        'maxdata' : [int(x) for x in converter.maxdata],
+        'units' : converter.unit_names(),
+        'polynomials' : converter.polynomials,
+        'sample_freq' : config['sample_freq'],
+        'sample_period' : cmd.scan_begin_arg/NANO_SEC,
+        'convert_period' : cmd.convert_arg/NANO_SEC,
+        'sample_num' : sample_num,
+        'start_time' : None,
+        }
+
+def stream_data(config, convert=True, info=None, metrics=None):
+    """
+    Continuously acquire data from data acquisition device. This is a
+    generator which yields (index, t, samples) for each block of
+    config['block_size'] scans, where index is the absolute scan index of
+    the first scan in the block and t is the TimeAxis of the block's scans.
+    See get_stop for when the acquisition stops - if it
+    runs until cancelled the generator should be closed when done.
+
+    Data is read into a fixed size ring buffer so memory use is constant
+    for the length of the acquisition. If convert is False the samples are
+    raw sample codes which are a view into the ring buffer and are only
+    valid until the next block is requested. If info is a dictionary it is
+    updated with the acquisition information (see get_info) before the
+    first block is yielded. Stage times and reads are recorded in metrics
+    if given.
+    """
+    metrics = get_metrics(metrics)
+    device = open_device(config, metrics)
+    nchans = len(config['channels'])
+    stop_src, stop_arg = get_stop(config)
+    cmd = get_cmd(device, config, stop_src, stop_arg, metrics)
+    converter = get_converter(device, config)
+    if info is not None:
+        info.update(get_info(cmd, config, converter))
     sample_t_true = cmd.scan_begin_arg/NANO_SEC
+    convert_t_true = cmd.convert_arg/NANO_SEC
     if config['verbose']:
-        print
-        print 'sample frequencies'
-        print 
-        print '\tdesired sample freq: ', 1.0/sample_t
-        print '\tactual sample freq: ', 1.0/sample_t_true
-        print 
-    
-    t = numpy.linspace(0,n*sample_t_true, n)
+        print_sample_freq(config, sample_t_true)
+    ring = RingBuffer(nchans, config['block_size'], DEFAULT_RING_BLOCKS)
+
+    reader = None
+    try:
+        start_cmd(device, cmd, config)
+        start_time = time.time()
+        if info is not None:
+            info['start_time'] = start_time
+        reader = get_reader(device, config)
+        read_done = False
+        while not read_done:
+            t0 = metrics.start()
+            nbytes = reader.readinto(ring.write_view())
+            metrics.stop('read', t0)
+            metrics.record_read(nbytes)
+            if not nbytes:
+                # End of acquisition 
+                read_done = True
+            else:
+                ring.commit(nbytes)
+            block = ring.read_block(partial=read_done)
+            while block is not None:
+                index, raw = block
+                metrics.record_scans(raw.shape[0], nchans)
+                t = TimeAxis(index, raw.shape[0], sample_t_true, convert_t_true, start_time)
+                if convert:
+                    t0 = metrics.start()
+                    samples = converter.convert(raw)
+                    metrics.stop('convert', t0)
+                    yield index, t, samples
+                else:
+                    yield index, t, raw
+                block = ring.read_block(partial=read_done)
+    finally:
+        if reader is not None:
+            reader.close()
+            if config['verbose'] and reader.report() is not None:
+                sys.stderr.write(reader.report())
+        device.cancel(config['subdev'])
+        device.close()
+
+def get_device_configs(config):
+    """
+    Returns list of configurations, one for each of the space separated
+    devices in config['device']. All devices use the same channels, gains,
+    subdevice and sample frequency.
+    """
+    config_list = []
+    for device in config['device'].split():
+        device_config = dict(config)
+        device_config['device'] = device
+        config_list.append(device_config)
+    return config_list
+
+def get_stream(config, info=None, metrics=None):
+    """
+    Returns generator of blocks of raw sample codes for the devices in the
+    configuration, see stream_data and multi_stream_data.
+    """
+    if len(config['device'].split()) > 1:
+        return multi_stream_data(config, convert=False, info=info, metrics=metrics)
+    return stream_data(config, convert=False, info=info, metrics=metrics)
+
+def multi_stream_data(config, convert=True, info=None, metrics=None):
+    """
+    Continuously acquire data from several data acquisition devices in
+    parallel. Like stream_data but the devices in config['device'] are
+    each read in their own thread and the scans acquired at the same time
+    are merged into rows holding the channels of all devices, in device
+    order. The leading scans of devices which started before the last
+    device to start are dropped so all devices share scan index 0.
+
+    If info is a dictionary it is updated with the combined acquisition
+    information, with the information for each device in info['devices'].
+    The time of the sample in column k is t.for_channel(k % nchans) as
+    each device converts its channels in the same order. If one device
+    stalls or starts late the others' scans are held for at most
+    MERGE_PENDING_RINGS ring buffers, then OverrunError is raised.
+    Each device records its stages and reads in a child of metrics.
+    """
+    import multi
+    metrics = get_metrics(metrics)
+    config_list = get_device_configs(config)
+    nchans = len(config['channels'])
+    info_list = [{} for c in config_list]
+    queue = Queue.Queue(multi.DEFAULT_MERGE_QUEUE_SIZE)
+    stop_event = threading.Event()
+    thread_list = []
+    for num, device_config in enumerate(config_list):
+        blocks = stream_data(device_config, convert=False, info=info_list[num], metrics=metrics.child())
+        thread_list.append(multi.DeviceThread(num, blocks, queue, stop_event))
+
+    merger = None
+    converter = None
+    running = len(thread_list)
+    try:
+        for thread in thread_list:
+            thread.start()
+        while running > 0:
+            num, index, raw = queue.get()
+            if index is None:
+                running -= 1
+                if raw is not None:
+                    raise raw[0], raw[1], raw[2]
+                continue
+            if merger is None:
+                max_pending = MERGE_PENDING_RINGS*DEFAULT_RING_BLOCKS*config['block_size']
+                merger = multi.ScanMerger([nchans]*len(config_list), info_list[num]['sample_period'],
+                                          max_pending=max_pending)
+            if merger.start_times[num] is None:
+                if abs(info_list[num]['sample_period'] - merger.sample_period) > 0.5/NANO_SEC:
+                    err_msg = '%s: error: devices have different sample periods\n'%(PROG_NAME,)
+                    sys.stderr.write(err_msg)
+                    sys.exit(1)
+                merger.start(num, info_list[num]['start_time'])
+                convert_t_true = info_list[num]['convert_period']
+                if merger.offsets() is not None:
+                    merged_info = get_multi_info(info_list, merger)
+                    converter = converter_from_info(merged_info)
+                    if info is not None:
+                        info.update(merged_info)
+            merger.add(num, raw)
+            block = merger.pop(config['block_size'], partial=False)
+            while block is not None:
+                index, raw = block
+                t = TimeAxis(index, raw.shape[0], merger.sample_period, convert_t_true, merger.start_time)
+                if convert:
+                    yield index, t, converter.convert(raw)
+                else:
+                    yield index, t, raw
+                block = merger.pop(config['block_size'], partial=False)
+
+        # Rows left over when the acquisitions end
+        block = None
+        if merger is not None:
+            block = merger.pop(config['block_size'])
+        while block is not None:
+            index, raw = block
+            t = TimeAxis(index, raw.shape[0], merger.sample_period, convert_t_true, merger.start_time)
+            if convert:
+                yield index, t, converter.convert(raw)
+            else:
+                yield index, t, raw
+            block = merger.pop(config['block_size'])
+    finally:
+        # Stop the device threads, emptying the queue so they can finish
+        stop_event.set()
+        for thread in thread_list:
+            while thread.isAlive():
+                try:
+                    queue.get(True, 0.1)
+                except Queue.Empty:
+                    pass
 
-    # Close acquisition device
-    ret = c.comedi_close(dev)
-        
-    return t,samples
+def get_multi_info(info_list, merger):
+    """
+    Returns combined acquisition information for a multi device
+    acquisition from the information for each device.
+    """
+    offsets = merger.offsets()
+    info = dict(info_list[0])
+    for key in ('channels', 'gains', 'ranges', 'maxdata', 'units'):
+        info[key] = []
+        for device_info in info_list:
+            info[key].extend(device_info[key])
+    info['polynomials'] = []
+    for device_info in info_list:
+        info['polynomials'].extend(device_info['polynomials'] or [None]*len(device_info['channels']))
+    if not [p for p in info['polynomials'] if p]:
+        info['polynomials'] = None
+    info['device'] = ' '.join([x['device'] for x in info_list])
+    info['start_time'] = merger.start_time
+    if None in [x['sample_num'] for x in info_list]:
+        info['sample_num'] = None
+    else:
+        info['sample_num'] = min([x['sample_num'] - n for x, n in zip(info_list, offsets)])
+    info['devices'] = []
+    for device_info, offset in zip(info_list, offsets):
+        info['devices'].append({
+            'device' : device_info['device'],
+            'subdev' : device_info['subdev'],
+            'channels' : device_info['channels'],
+            'start_time' : device_info['start_time'],
+            'offset' : offset,
+            })
+    return info
+
+def get_converter(device, config):
+    """
+    Get raw to physical units converter for the configured channels. The
+    range, maxdata and, unless config['calibration'] is 'none', the
+    calibration polynomial for each channel are looked up once.
+    """
+    ranges = []
+    maxdata = []
+    polynomials = []
+    subdev = config['subdev']
+    calibrate = config.get('calibration', DEFAULT_CALIBRATION) != 'none'
+    for channel, gain in zip(config['channels'], config['gains']):
+        ranges.append(device.get_range(subdev, channel, gain))
+        maxdata.append(device.get_maxdata(subdev, channel))
+        if calibrate:
+            polynomials.append(device.get_polynomial(subdev, channel, gain))
+    if not [p for p in polynomials if p]:
+        polynomials = None
+    if config['verbose'] and polynomials is not None:
+        print 'using calibration polynomials'
+        print
+    return RawConverter(ranges, maxdata, polynomials=polynomials)
 
 def print_cmd(cmd):
     """
@@ -602,17 +1655,6 @@ def print_cmd(cmd):
     print '\tchanlist_len:',cmd.chanlist_len 
 
 
-def write_samples(fid, t, samples):
-    """
-    Write time and samples to output file.
-    """
-    for i in xrange(0,t.shape[0]):
-        fid.write('%f '%(t[i],))
-        for j in range(0,samples.shape[1]):
-            fid.write('%f '%(samples[i,j],))
-        fid.write('\n') 
-
-
 # Functions for console scripts --------------------------------------------
 def daq_acquire_main():
     """
@@ -631,66 +1673,452 @@ def daq_acquire_main():
             print '\t%s'%(key,),  config[key]
         print
     
-    # Acquire data
-    t, samples = acquire_data(config)    
-
-    # Save data to output file or write to stdout
-    if config['output_file'] == None:
-        # Print data to stdout
-        outfile_fid = sys.stdout
-        write_samples(sys.stdout, t, samples)
+    # Acquire and write data 
+    stream_main(config)
+
+
+def daq_server_main():
+    """
+    main function for daq-server command-line program. Acquires from the
+    configured device(s), until interrupted unless a duration is given,
+    and serves the blocks to daq-server clients (see server.py).
+    """
+    config = set_config()
+    if config['duration'] is None:
+        config = config.replace(stream=True)
+    server_main(config)
+
+
+def server_main(config):
+    """
+    Acquire data block by block and publish the blocks to the clients of
+    a StreamServer on config['server_address'].
+    """
+    import socket
+    import server
+    log_fid = None
+    if config['verbose']:
+        log_fid = sys.stderr
+    try:
+        stream_server = server.StreamServer(config['server_address'], config['client_queue'],
+                                            config['drop_policy'], log_fid)
+    except socket.error, err:
+        err_msg = '%s: error: unable to serve on %s - %s\n'%(PROG_NAME,config['server_address'],err)
+        sys.stderr.write(err_msg)
+        sys.exit(1)
+    stream_server.start()
+
+    info = {}
+    read_error = None
+    blocks = get_stream(config, info)
+    try:
+        try:
+            for index, t, raw in blocks:
+                if stream_server.info is None:
+                    stream_server.set_info(info)
+                stream_server.publish(index, raw)
+        except ReadError, err:
+            read_error = err
+        except KeyboardInterrupt:
+            pass
+    finally:
+        blocks.close()
+        msg = ''
+        if read_error is not None:
+            msg = 'acquisition stopped - %s'%(read_error,)
+        stream_server.finish(msg)
+        stream_server.close()
+    if config['verbose']:
+        sys.stderr.write(stream_server.report())
+    if read_error is not None:
+        err_msg = '%s: error: acquisition stopped - %s\n'%(PROG_NAME,read_error)
+        sys.stderr.write(err_msg)
+        sys.exit(1)
+
+
+def stream_main(config):
+    """
+    Acquire data block by block and pass the blocks to a writer thread
+    which writes them to the output file, or stdout, in the selected
+    output format. Blocks are collected for plotting when --plot is given
+    and the acquisition has a fixed length.
+
+    With --scope the acquisition runs in its own thread and the main
+    thread shows a live scope view of the blocks until the acquisition
+    ends or the scope window is closed. With --metrics a summary of the
+    acquisition metrics is written at the end, and every metrics_period
+    seconds if set. With --average, --decimate or --summary the blocks are
+    processed (see process.py) before they are written - the scope view and
+    plot show the unprocessed samples. With --trigger_channel only the
+    triggered events are written, each to its own file (see trigger.py).
+    With --shm_ring the raw blocks are also published to a shared memory
+    ring for other processes on the host (see shmring.py).
+    """
+    stop_src, stop_arg = get_stop(config)
+    plot = config['plot']
+    if plot and stop_src != backend.TRIG_COUNT:
+        sys.stderr.write('%s: warning: --plot is ignored when streaming without a duration\n'%(PROG_NAME,))
+        plot = False
+
+    info = {}
+    state = {'writer_thread' : None, 'processor' : None, 'scope_buffer' : None, 'shm' : None,
+             'error' : None, 'read_error' : None}
+    block_list = []
+    stop_event = threading.Event()
+    metrics = None
+    reporter = None
+    if config['metrics'] != 'none':
+        import instrument
+        metrics = instrument.Metrics()
+        reporter = open_metrics_reporter(config, metrics)
+
+    def acquire():
+        blocks = get_stream(config, info, metrics)
+        try:
+            for index, t, raw in blocks:
+                if state['writer_thread'] is None:
+                    state['processor'] = get_processor(config, info)
+                    writer_info = info
+                    if state['processor'] is not None:
+                        writer_info = state['processor'].get_info(info)
+                    writer = open_output(config, writer_info)
+                    state['writer_thread'] = pipeline.WriterThread(writer, config['queue_size'], metrics=metrics)
+                    state['writer_thread'].start()
+                    if config['scope']:
+                        import scope
+                        state['scope_buffer'] = scope.ScopeBuffer(len(info['channels']),
+                                                                  info['sample_period'],
+                                                                  config['scope_window'])
+                    if config['shm_ring'] is not None:
+                        state['shm'] = open_shm_ring(config, info)
+                if state['shm'] is not None:
+                    state['shm'].publish(index, raw)
+                if state['processor'] is None:
+                    state['writer_thread'].put(index, raw)
+                else:
+                    put_processed(state, metrics, raw)
+                if state['scope_buffer'] is not None:
+                    state['scope_buffer'].push(raw)
+                if plot:
+                    block_list.append(raw.copy())
+                if reporter is not None:
+                    reporter.update()
+                if stop_event.isSet():
+                    break
+        except ReadError, err:
+            # Keep the data acquired so far
+            state['read_error'] = err
+        finally:
+            blocks.close()
+            stop_event.set()
+            if state['shm'] is not None:
+                state['shm'].close()
+
+    if config['scope']:
+        def acquire_thread():
+            try:
+                acquire()
+            except BaseException:
+                state['error'] = sys.exc_info()
+        thread = threading.Thread(target=acquire_thread)
+        thread.setDaemon(True)
+        thread.start()
+        try:
+            run_scope(config, info, state, stop_event)
+            while thread.isAlive():
+                thread.join(0.1)
+        except KeyboardInterrupt:
+            stop_event.set()
+            thread.join()
+        if state['error'] is not None:
+            error = state['error']
+            raise error[0], error[1], error[2]
     else:
-        # Write data to output file
-        outfile_fid = open(config['output_file'],'w')
-        write_samples(outfile_fid, t, samples)
-        outfile_fid.close()
+        try:
+            acquire()
+        except KeyboardInterrupt:
+            pass
+
+    writer_thread = state['writer_thread']
+    if writer_thread is not None:
+        if state['processor'] is not None:
+            put_processed(state, metrics)
+        writer_thread.close()
+        if config['verbose']:
+            sys.stderr.write(writer_thread.report())
+            if config['trigger_channel'] is not None:
+                sys.stderr.write(writer_thread.writer.report())
+    if reporter is not None:
+        reporter.close()
+    if state['read_error'] is not None:
+        err_msg = '%s: error: acquisition stopped - %s\n'%(PROG_NAME,state['read_error'])
+        sys.stderr.write(err_msg)
+        sys.exit(1)
+    if writer_thread is None:
+        return
 
     # Plot data
-    if config['plot']:
-    
-        import matplotlib.pylab as pylab
+    if plot and block_list:
+        import loader
+        import pyramid
+        converter = converter_from_info(info)
+        samples = converter.convert(numpy.concatenate(block_list))
+        recording = loader.ArrayRecording(samples, info['sample_period'], info['channels'], info)
+        pyramid.plot_recording(recording)
 
-        n,m = samples.shape
-        for i in range(0,m):
-            pylab.figure(config['channels'][i])
-            pylab.plot(t,samples[:,i])
-            pylab.xlabel('t (sec)')
-            pylab.ylabel('(V)')
-            pylab.title('channel %d'%(config['channels'][i],))
-        pylab.show()
 
+def daq_query_main():
+    """
+    main function for daq-query command-line program. Writes the samples
+    of a time range of a recording as text, or with --stats the min, max
+    and mean of each channel over the range.
+    """
+    import loader
+    usage = """%prog [OPTION]... FILE
+
+    %prog writes the samples of the given channels between times t0 and
+     t1 (sec) of a data file captured by daq-acquire. """
 
-def plot_daq_main():
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('--t0',
+                      type='float',
+                      dest='t0',
+                      help='start time (sec) - default start of recording',
+                      default=None
+                      )
+    parser.add_option('--t1',
+                      type='float',
+                      dest='t1',
+                      help='end time (sec) - default end of recording',
+                      default=None
+                      )
+    parser.add_option('-c', '--channels',
+                      type='string',
+                      dest='channels',
+                      help='list of channels to output, e.g. "2 5" - default all',
+                      default=None
+                      )
+    parser.add_option('--stats',
+                      action='store_true',
+                      dest='stats',
+                      help='output min, max, mean and count of the in range samples of each channel over the range',
+                      default=False
+                      )
+    parser.add_option('--index_only',
+                      action='store_true',
+                      dest='index_only',
+                      help='compute --stats from the chunk index alone, over the whole chunks covering the range',
+                      default=False
+                      )
+    parser.add_option('--precision',
+                      type='int',
+                      dest='precision',
+                      help='digits after the decimal point - default %d'%(DEFAULT_PRECISION,),
+                      default=DEFAULT_PRECISION
+                      )
+    parser.add_option('--format',
+                      type='string',
+                      dest='format',
+                      help='select data file format (text,raw,npy,chunked) - default from file extension',
+                      default=None
+                      )
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('a single data file is required')
+
+    datafile = args[0]
+    try:
+        recording = loader.open_recording(datafile, options.format)
+    except (IOError, ValueError), err:
+        err_msg = "%s: error: unable to open data file '%s' - %s\n"%(PROG_NAME,datafile,err)
+        sys.stderr.write(err_msg)
+        sys.exit(1)
+
+    # Map channel numbers to columns of the recording
+    columns = range(recording.nchans)
+    if options.channels is not None:
+        try:
+            channels = [int(x) for x in options.channels.split()]
+            columns = [list(recording.channels).index(x) for x in channels]
+        except ValueError:
+            err_msg = "%s: error: channels '%s' not in recording (channels %s)\n"
+            sys.stderr.write(err_msg%(PROG_NAME,options.channels,' '.join([str(x) for x in recording.channels])))
+            sys.exit(1)
+
+    start, stop = recording.get_scan_range(options.t0, options.t1)
+    if options.stats:
+        try:
+            stats = recording.get_stats(start, stop, columns, options.index_only)
+        except ValueError, err:
+            sys.stderr.write('%s: error: %s\n'%(PROG_NAME,err))
+            sys.exit(1)
+        t = recording.get_t(stats['start'], stats['stop'])
+        print '# scans %d to %d, t %f to %f'%(stats['start'], stats['stop'], t[0], t[-1])
+        print '# channel min max mean count'
+        value_fmt = '%%.%df'%(options.precision,)
+        for i, column in enumerate(columns):
+            values = [value_fmt%(stats[key][i],) for key in ('min', 'max', 'mean')]
+            print recording.channels[column], ' '.join(values), stats['count'][i]
+        return
+
+    for i in xrange(start, stop, loader.STATS_READ_SCANS):
+        j = min(i + loader.STATS_READ_SCANS, stop)
+        write_samples(sys.stdout, recording.get_t(i, j), recording.get_samples(i, j, columns),
+                      options.precision)
+
+def open_event_recorder(config, info):
     """
-    main function for plot_daq command-line program
+    Returns EventRecorder for the trigger settings in the configuration.
     """
-    
+    import trigger
+    if not config['trigger_channel'] in info['channels']:
+        raise ValueError, 'trigger channel %d is not acquired'%(config['trigger_channel'],)
+    if info.get('physical'):
+        raise ValueError, 'trigger can not be used with average, decimate or summary'
+    column = list(info['channels']).index(config['trigger_channel'])
+    return trigger.EventRecorder(config['output_file'], info, column, config['trigger_level'],
+                                 config['trigger_edge'], config['pre_trigger'],
+                                 config['post_trigger'], config['holdoff'],
+                                 config['format'], config['precision'])
+
+def open_shm_ring(config, info):
+    """
+    Returns ShmProducer for the shared memory ring in the configuration.
+    """
+    import shmring
+    try:
+        return shmring.ShmProducer(config['shm_ring'], len(info['channels']),
+                                   config['shm_scans'], info)
+    except (IOError, OSError, ValueError), err:
+        err_msg = '%s: error: unable to create shared memory ring - %s\n'%(PROG_NAME,err)
+        sys.stderr.write(err_msg)
+        sys.exit(1)
+
+def get_processor(config, info):
+    """
+    Returns Processor for the averaging, decimation and summary settings
+    in the configuration or None if there is no processing.
+    """
+    if config['average'] is None and config['decimate'] is None and config['summary'] is None:
+        return None
+    import process
+    converter = converter_from_info(info)
+    processor = process.Processor(converter, config['average'], config['decimate'],
+                                  config['fir_taps'], config['summary'])
+    if not processor.active():
+        return None
+    if config['verbose']:
+        output_info = processor.get_info(info)
+        msg = 'processing: %s, output sample period %g sec\n'
+        stages = ', '.join(['%s(%d)'%(x['stage'], x['n']) for x in output_info['processing']])
+        sys.stderr.write(msg%(stages, output_info['sample_period']))
+    return processor
+
+def put_processed(state, metrics, raw=None):
+    """
+    Process block of raw samples, or flush the processor at the end of the
+    acquisition if raw is None, and queue the output for the writer.
+    """
+    metrics = get_metrics(metrics)
+    t0 = metrics.start()
+    if raw is None:
+        output = state['processor'].flush()
+    else:
+        output = state['processor'].process(raw)
+    metrics.stop('process', t0)
+    if output is not None:
+        state['writer_thread'].put(*output)
+
+def run_scope(config, info, state, stop_event):
+    """
+    Show live scope view of the acquisition in stream_main. Waits for the
+    first block and returns when the scope window is closed.
+    """
+    while state['scope_buffer'] is None and not stop_event.isSet():
+        stop_event.wait(0.05)
+    if state['scope_buffer'] is None:
+        return
     import matplotlib.pylab as pylab
+    import scope
+    writer_thread = state['writer_thread']
+    def status():
+        fill = writer_thread.queue.qsize()
+        return 'writer queue %d of %d'%(fill, writer_thread.queue_size)
+    converter = converter_from_info(info)
+    view = scope.Scope(state['scope_buffer'], converter, info['channels'], stop_event,
+                       status, config['frame_rate'], config['scope_cpu'])
+    pylab.show()
+    return view
+
+def open_metrics_reporter(config, metrics):
+    """
+    Returns MetricsReporter for the metrics format, file and period in the
+    configuration.
+    """
+    if config['metrics_file'] is None:
+        fid = sys.stderr
+    else:
+        try:
+            fid = open(config['metrics_file'], 'w')
+        except IOError, err:
+            err_msg = '%s: error: unable to open metrics file - %s\n'%(PROG_NAME,err)
+            sys.stderr.write(err_msg)
+            sys.exit(1)
+    import instrument
+    return instrument.MetricsReporter(metrics, config['metrics'], fid, config['metrics_period'])
+
+def open_output(config, info):
+    """
+    Open writer for the output file and format in the configuration. If a
+    trigger channel is set the writer is an EventRecorder which writes
+    only the triggered events.
+    """
+    try:
+        if config['trigger_channel'] is not None:
+            return open_event_recorder(config, info)
+        return formats.open_writer(config['output_file'], info, config['format'], config['precision'],
+                                   config['compressor'], config['filters'], config['level'],
+                                   config['compress_threads'])
+    except (IOError, ValueError), err:
+        err_msg = '%s: error: unable to open output - %s\n'%(PROG_NAME,err)
+        sys.stderr.write(err_msg)
+        sys.exit(1)
 
 
+def plot_daq_main():
+    """
+    main function for plot_daq command-line program
+    """
+    import loader
+    import pyramid
+
     # Setup input option parser
-    usage = """%prog [OPTION]...
+    usage = """%prog [OPTION]... FILE
 
     %prog simple script for plotting data captured by daq_acquire
      commmand-line program. """
 
     # Set up command line option parser 
     parser = optparse.OptionParser(usage=usage)
+    parser.add_option('--format',
+                      type='string',
+                      dest='format',
+                      help='select data file format (text,raw,npy,chunked) - default from file extension',
+                      default=None
+                      )
     options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('a single data file is required')
+
+    datafile = args[0]
+    try:
+        recording = loader.open_recording(datafile, options.format)
+    except (IOError, ValueError), err:
+        err_msg = "%s: error: unable to open data file '%s' - %s\n"%(PROG_NAME,datafile,err)
+        sys.stderr.write(err_msg)
+        sys.exit(1)
 
-    datafile = sys.argv[1]
-    data = pylab.load(datafile)
-
-    t = data[:,0]
-    samples = data[:,1:]
-
-    for i in range(samples.shape[1]):
-        pylab.figure(i)
-        pylab.plot(t,samples[:,i])
-        pylab.xlabel('t (sec)')
-        pylab.ylabel('(V)')
-        pylab.title('channel %d'%(i,))
-    pylab.show()
+    pyramid.plot_recording(recording)
 
 # ---------------------------------------------------------------------
 if __name__=="__main__":
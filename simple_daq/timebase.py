@@ -0,0 +1,141 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Implicit time axis for acquired scans. The time of a sample is
+determined by the scan index, the actual scan period chosen by the driver
+(cmd.scan_begin_arg after command test) and, within a scan, the position
+of the channel times the conversion period (cmd.convert_arg). A TimeAxis
+holds only these values and creates time arrays when they are asked for,
+either as a whole (numpy.asarray(t)) or a slice at a time (t[i:j]).
+
+"""
+import numpy
+
+
+class TimeAxis(object):
+    """
+    Times (sec) of scans start_index to start_index + scan_num relative to
+    the start of the acquisition, i.e.
+
+        t[i] = (start_index + i)*sample_period + channel*convert_period
+
+    start_time is the wall clock time of the start of the acquisition, if
+    known. The time axis can be used like a one dimensional array.
+    """
+
+    ndim = 1
+
+    def __init__(self, start_index, scan_num, sample_period, convert_period=0.0,
+                 start_time=None, channel=0):
+        self.start_index = start_index
+        self.scan_num = scan_num
+        self.sample_period = sample_period
+        self.convert_period = convert_period
+        self.start_time = start_time
+        self.channel = channel
+
+    def __len__(self):
+        return self.scan_num
+
+    @property
+    def shape(self):
+        return (self.scan_num,)
+
+    @property
+    def offset(self):
+        """
+        Time of the channel's sample within a scan.
+        """
+        return self.channel*self.convert_period
+
+    def get(self, start=0, stop=None, step=1):
+        """
+        Returns array of the times of scans start to stop (relative to the
+        time axis).
+        """
+        if stop is None:
+            stop = self.scan_num
+        index = numpy.arange(self.start_index + start, self.start_index + stop, step)
+        return index*self.sample_period + self.offset
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.get(*key.indices(self.scan_num))
+        key = int(key)
+        if key < 0:
+            key += self.scan_num
+        if key < 0 or key >= self.scan_num:
+            raise IndexError, 'time axis index out of range'
+        return (self.start_index + key)*self.sample_period + self.offset
+
+    def __array__(self, dtype=None):
+        t = self.get()
+        if dtype is not None:
+            t = t.astype(dtype)
+        return t
+
+    def __iter__(self):
+        return iter(self.get())
+
+    def for_channel(self, channel):
+        """
+        Returns time axis for the samples of the channel at position channel
+        in the scan.
+        """
+        return TimeAxis(self.start_index, self.scan_num, self.sample_period,
+                        self.convert_period, self.start_time, channel)
+
+    def absolute(self):
+        """
+        Returns array of wall clock times (sec since the epoch).
+        """
+        if self.start_time is None:
+            raise ValueError, 'start time of acquisition is not known'
+        return self.start_time + self.get()
+
+    def __add__(self, other):
+        return self.get() + other
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.get() - other
+
+    def __rsub__(self, other):
+        return other - self.get()
+
+    def __mul__(self, other):
+        return self.get()*other
+
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        return self.get()/other
+
+    __truediv__ = __div__
+
+    def __repr__(self):
+        msg = 'TimeAxis(start_index=%d, scan_num=%d, sample_period=%g, convert_period=%g, channel=%d)'
+        return msg%(self.start_index, self.scan_num, self.sample_period, self.convert_period, self.channel)
@@ -0,0 +1,274 @@
+"""
+simple_daq
+Copyright (C) William Dickson, 2008.
+
+wbd@caltech.edu
+www.willdickson.com
+
+This file is part of simple_daq.
+
+simple_daq is free software: you can redistribute it and/or modify it
+under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+simple_daq is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with simple_daq.  If not, see
+<http://www.gnu.org/licenses/>.
+
+---------------------------------------------------------------------
+
+Purpose: Software triggered capture of events from a continuous stream.
+The trigger channel of each block is converted to physical units and
+compared with the trigger level as a whole to find the level crossings.
+The last pre_num scans are kept in a circular history so each event
+holds pre_num scans before the trigger and post_num scans from the
+trigger on, and only the events are written - each to its own output
+file (see EventRecorder).
+
+"""
+import os
+import numpy
+import formats
+from convert import converter_from_info
+
+TRIGGER_EDGES = ('rising', 'falling', 'both')
+EVENT_NAME_FORMAT = '%s_%04d%s'  # base, event number, extension
+
+
+class History(object):
+    """
+    Circular buffer of the last capacity scans of a stream.
+    """
+
+    def __init__(self, capacity, nchans, dtype=numpy.uint16):
+        self.capacity = capacity
+        self.data = numpy.zeros((capacity, nchans), dtype=dtype)
+        self.end = 0                     # scan index after the last scan
+
+    def write(self, block):
+        """
+        Append (scan_num, nchans) block to the history.
+        """
+        n = block.shape[0]
+        m = min(n, self.capacity)
+        if m > 0:
+            pos = numpy.arange(self.end + n - m, self.end + n) % self.capacity
+            self.data[pos] = block[n - m:]
+        self.end += n
+
+    def get(self, start, stop):
+        """
+        Returns copy of scans start to stop, which must be within the last
+        capacity scans.
+        """
+        if start < self.end - self.capacity or stop > self.end:
+            raise ValueError, 'scans %d to %d are not in history'%(start, stop)
+        return self.data.take(numpy.arange(start, stop) % self.capacity, axis=0)
+
+
+class Event(object):
+    """
+    Scans start to stop around the trigger at scan index trigger. filled
+    is the number of scans received so far.
+    """
+
+    def __init__(self, num, trigger, start, stop, nchans, dtype):
+        self.num = num
+        self.trigger = trigger
+        self.start = start
+        self.stop = stop
+        self.data = numpy.empty((stop - start, nchans), dtype=dtype)
+        self.filled = 0
+
+    def complete(self):
+        return self.filled == self.data.shape[0]
+
+    def fill(self, index, block):
+        """
+        Copy the event's scans from block starting at scan index.
+        """
+        pos = self.start + self.filled
+        i = pos - index
+        j = min(self.stop, index + block.shape[0]) - index
+        if i < 0 or j <= i:
+            return
+        self.data[self.filled:self.filled + j - i] = block[i:j]
+        self.filled += j - i
+
+
+class Trigger(object):
+    """
+    Finds events in a stream of blocks of raw sample codes. A trigger
+    occurs when the samples of column channel, converted with converter,
+    cross level on the given edge ('rising', 'falling' or 'both'). After
+    a trigger further triggers are ignored for holdoff scans (default
+    post_num so events do not overlap). Each event has pre_num scans
+    before the trigger scan and post_num scans from it on, fewer before the
+    trigger if it is within pre_num scans of the start of the stream.
+    """
+
+    def __init__(self, converter, nchans, channel, level, edge='rising', pre_num=0,
+                 post_num=1, holdoff=None, dtype=numpy.uint16):
+        if not edge in TRIGGER_EDGES:
+            raise ValueError, "unknown trigger edge '%s'"%(edge,)
+        self.converter = converter.select([channel])
+        self.nchans = nchans
+        self.channel = channel
+        self.level = level
+        self.edge = edge
+        self.pre_num = pre_num
+        self.post_num = post_num
+        if holdoff is None:
+            holdoff = post_num
+        self.holdoff = max(holdoff, 1)
+        self.dtype = dtype
+        self.history = History(pre_num, nchans, dtype)
+        self.last = None                 # last trigger channel sample
+        self.next_allowed = 0            # first scan index of next trigger
+        self.event_num = 0
+        self.pending = []
+
+    def crossings(self, x):
+        """
+        Returns array of positions in x of the samples at which the level
+        is crossed. The previous block's last sample precedes x[0].
+        """
+        offset = 1
+        if self.last is not None:
+            x = numpy.concatenate((self.last, x))
+            offset = 0
+        below = x < self.level
+        above = x > self.level
+        if self.edge == 'rising':
+            cross = below[:-1] & ~below[1:]
+        elif self.edge == 'falling':
+            cross = above[:-1] & ~above[1:]
+        else:
+            cross = (below[:-1] & ~below[1:]) | (above[:-1] & ~above[1:])
+        # NaN (out of range) samples never trigger
+        cross &= ~numpy.isnan(x[1:])
+        return cross.nonzero()[0] + offset
+
+    def process(self, index, raw):
+        """
+        Process (scan_num, nchans) block of raw sample codes starting at
+        scan index. Returns list of the events completed by the block.
+        """
+        done = []
+        for event in self.pending:
+            event.fill(index, raw)
+        x = self.converter.convert(raw[:, self.channel:self.channel + 1])[:,0]
+        if x.shape[0] > 0:
+            triggers = self.crossings(x) + index
+            self.last = x[-1:]
+            pos = triggers.searchsorted(self.next_allowed)
+            while pos < triggers.shape[0]:
+                t = int(triggers[pos])
+                start = max(t - self.pre_num, 0)
+                event = Event(self.event_num, t, start, t + self.post_num, self.nchans, self.dtype)
+                self.event_num += 1
+                if start < index:
+                    event.data[:index - start] = self.history.get(start, index)
+                    event.filled = index - start
+                event.fill(index, raw)
+                self.pending.append(event)
+                self.next_allowed = t + self.holdoff
+                pos = triggers.searchsorted(self.next_allowed)
+        if self.pre_num > 0:
+            self.history.write(raw)
+        for event in list(self.pending):
+            if event.complete():
+                self.pending.remove(event)
+                done.append(event)
+        return done
+
+    def flush(self):
+        """
+        Returns the events which were not completed when the stream ended,
+        truncated to the scans received.
+        """
+        done = []
+        for event in self.pending:
+            event.data = event.data[:event.filled]
+            event.stop = event.start + event.filled
+            done.append(event)
+        self.pending = []
+        return done
+
+
+def get_event_filename(filename, num):
+    """
+    Returns name of output file for event num of output file filename.
+    """
+    base, ext = os.path.splitext(filename)
+    return EVENT_NAME_FORMAT%(base, num, ext)
+
+
+class EventRecorder(formats.Writer):
+    """
+    Writer which passes the blocks of a stream through a Trigger and
+    writes each event, in format fmt, to its own file named from filename
+    with get_event_filename (to stdout one after another if filename is
+    None). The event's info has the keys event, trigger_index,
+    trigger_time and trigger (the trigger settings) and t0, the time of the
+    event's first scan from the start of the acquisition.
+    """
+
+    def __init__(self, filename, info, channel, level, edge='rising', pre_num=0,
+                 post_num=1, holdoff=None, fmt=None, precision=formats.TEXT_DEFAULT_PRECISION):
+        formats.Writer.__init__(self, filename, info)
+        self.fmt = formats.get_format(filename, fmt)
+        self.precision = precision
+        converter = converter_from_info(info)
+        self.trigger = Trigger(converter, self.nchans, channel, level, edge,
+                               pre_num, post_num, holdoff)
+        self.event_files = []
+
+    def write(self, index, raw):
+        for event in self.trigger.process(index, raw):
+            self.write_event(event)
+        self.scan_num = max(self.scan_num, index + raw.shape[0])
+
+    def write_event(self, event):
+        trigger = self.trigger
+        period = self.info['sample_period']
+        info = dict(self.info)
+        info['event'] = event.num
+        info['trigger_index'] = event.trigger
+        info['trigger_time'] = event.trigger*period
+        info['trigger'] = {
+            'channel' : self.info['channels'][trigger.channel],
+            'level' : trigger.level,
+            'edge' : trigger.edge,
+            'pre_num' : trigger.pre_num,
+            'post_num' : trigger.post_num,
+            'holdoff' : trigger.holdoff,
+            }
+        info['t0'] = info.get('t0', 0.0) + event.start*period
+        info['sample_num'] = event.data.shape[0]
+        filename = None
+        if self.filename is not None:
+            filename = get_event_filename(self.filename, event.num)
+        writer = formats.open_writer(filename, info, self.fmt, self.precision)
+        try:
+            writer.write(0, event.data)
+        finally:
+            writer.close()
+        self.event_files.append(filename)
+
+    def close(self):
+        for event in self.trigger.flush():
+            if event.data.shape[0] > 0:
+                self.write_event(event)
+
+    def report(self):
+        """
+        Returns string summarizing the events written.
+        """
+        return 'trigger events: %d written\n'%(len(self.event_files),)
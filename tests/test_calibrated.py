@@ -0,0 +1,87 @@
+"""
+Tests of the lookup table conversion of calibrated channels against
+evaluating the calibration polynomials with numpy.polyval.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+
+from simple_daq import convert
+
+RANGES = [(-10.0, 10.0, 0), (0.0, 5.0, 0), (-1.0, 1.0, 0)]
+MAXDATA = [4095, 65535, 4095]
+# (coefficients, expansion origin), lowest order first as in comedilib
+POLYNOMIALS = [
+    [[0.1, 0.005, -2.0e-7, 3.0e-10], 2048.0],
+    [[-0.02, 7.63e-5, 1.0e-12], 32767.5],
+    None,
+    ]
+
+
+def expected(raw, ranges, maxdata, polynomials, oor):
+    """
+    Returns raw converted with numpy.polyval, or linearly from the range
+    for channels without a polynomial.
+    """
+    out = numpy.empty(raw.shape)
+    for i in range(raw.shape[1]):
+        x = raw[:,i].astype(numpy.float64)
+        if polynomials[i] is None:
+            rng = ranges[i]
+            out[:,i] = rng[0] + (rng[1] - rng[0])*x/maxdata[i]
+        else:
+            coefficients, origin = polynomials[i]
+            out[:,i] = numpy.polyval(coefficients[::-1], x - origin)
+        if oor == convert.OOR_NAN:
+            out[(raw[:,i] == 0) | (raw[:,i] == maxdata[i]), i] = numpy.nan
+    return out
+
+
+class CalibratedTest(unittest.TestCase):
+
+    def setUp(self):
+        state = numpy.random.RandomState(0)
+        raw = state.randint(0, 4096, size=(2000, 3)).astype(numpy.uint16)
+        raw[:,1] = state.randint(0, 65536, size=2000)
+        raw[::50] = 0
+        raw[::70, 0] = 4095
+        raw[::90, 1] = 65535
+        self.raw = raw
+
+    def test_table(self):
+        for oor in (convert.OOR_NAN, convert.OOR_NUMBER):
+            converter = convert.RawConverter(RANGES, MAXDATA, oor, POLYNOMIALS)
+            self.assertTrue(converter.calibrated())
+            self.assertTrue(converter.get_table(numpy.float64) is not None)
+            samples = converter.convert(self.raw)
+            ref = expected(self.raw, RANGES, MAXDATA, POLYNOMIALS, oor)
+            self.assertTrue(numpy.allclose(samples, ref, rtol=1.0e-12, atol=1.0e-12, equal_nan=True), oor)
+
+    def test_float32_table(self):
+        converter = convert.RawConverter(RANGES, MAXDATA, polynomials=POLYNOMIALS)
+        samples = converter.convert(self.raw, dtype=numpy.float32)
+        self.assertEqual(samples.dtype, numpy.float32)
+        ref = expected(self.raw, RANGES, MAXDATA, POLYNOMIALS, convert.OOR_NAN)
+        self.assertTrue(numpy.allclose(samples, ref, rtol=1.0e-6, atol=1.0e-6, equal_nan=True))
+
+    def test_no_table(self):
+        # More codes than fit a table - the polynomials are evaluated
+        maxdata = [(1 << 18) - 1]
+        raw = numpy.random.RandomState(1).randint(0, 1 << 18, size=(1000, 1)).astype(numpy.uint32)
+        raw[::100] = maxdata[0]
+        polynomials = [[[0.5, 3.0e-6, 1.0e-14], 131072.0]]
+        converter = convert.RawConverter(RANGES[:1], maxdata, polynomials=polynomials)
+        self.assertTrue(converter.get_table(numpy.float64) is None)
+        ref = expected(raw, RANGES[:1], maxdata, polynomials, convert.OOR_NAN)
+        self.assertTrue(numpy.allclose(converter.convert(raw), ref, rtol=1.0e-12, atol=1.0e-12, equal_nan=True))
+
+    def test_select(self):
+        converter = convert.RawConverter(RANGES, MAXDATA, polynomials=POLYNOMIALS)
+        samples = converter.select([2, 0]).convert(self.raw[:,[2, 0]])
+        ref = converter.convert(self.raw)[:,[2, 0]]
+        self.assertTrue(numpy.allclose(samples, ref, rtol=0.0, atol=0.0, equal_nan=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests that chunks come back unchanged through every combination of
+filters and compressor, directly and through a chunked file.
+
+usage: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from simple_daq import codec
+from simple_daq import formats
+from simple_daq import loader
+
+FILTER_LISTS = ['', 'delta', 'shuffle', 'delta+shuffle', 'shuffle+delta']
+
+
+def get_chunk(nscans=3000, nchans=3):
+    """
+    Returns chunk with a slow channel, a noisy channel and a channel
+    jumping between the smallest and largest codes.
+    """
+    state = numpy.random.RandomState(0)
+    chunk = numpy.empty((nscans, nchans), dtype=numpy.uint16)
+    chunk[:,0] = 2048 + (1000*numpy.sin(0.01*numpy.arange(nscans))).astype(int)
+    chunk[:,1] = state.randint(0, 1 << 16, size=nscans)
+    chunk[:,2:] = 0
+    chunk[1::2, 2:] = 65535
+    return chunk
+
+
+class CodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.chunk = get_chunk()
+
+    def test_round_trip(self):
+        for compressor in sorted(codec.COMPRESSORS):
+            for filters in FILTER_LISTS:
+                filters = codec.parse_filters(filters)
+                for level in (0, 1, 9):
+                    data = codec.encode_chunk(self.chunk, compressor, filters, level)
+                    out = codec.decode_chunk(data, 3, compressor, filters)
+                    self.assertEqual(out.shape, self.chunk.shape)
+                    self.assertTrue((out == self.chunk).all(), (compressor, filters, level))
+
+    def test_small_chunks(self):
+        for chunk in (self.chunk[:1], self.chunk[:0], self.chunk[::7, ::2]):
+            for filters in FILTER_LISTS:
+                filters = codec.parse_filters(filters)
+                data = codec.encode_chunk(chunk, 'zlib', filters)
+                out = codec.decode_chunk(data, chunk.shape[1], 'zlib', filters)
+                self.assertEqual(out.shape, chunk.shape)
+                self.assertTrue((out == chunk).all())
+
+    def test_parse_filters(self):
+        self.assertEqual(codec.parse_filters('delta+shuffle'), ('delta', 'shuffle'))
+        self.assertEqual(codec.parse_filters('none'), ())
+        self.assertEqual(codec.parse_filters(''), ())
+        self.assertEqual(codec.parse_filters(None), ())
+        self.assertEqual(codec.parse_filters(['shuffle']), ('shuffle',))
+        self.assertRaises(ValueError, codec.parse_filters, 'delta+rle')
+        self.assertRaises(ValueError, codec.get_compressor, 'snappy')
+
+    def test_pool(self):
+        pool = codec.CompressPool(2)
+        try:
+            jobs = [pool.submit(self.chunk[i:i + 500], 'bz2', ('delta',), 5) for i in range(0, 3000, 500)]
+            for i, job in zip(range(0, 3000, 500), jobs):
+                self.assertEqual(job.result(), codec.encode_chunk(self.chunk[i:i + 500], 'bz2', ('delta',), 5))
+            job = pool.submit(self.chunk, 'snappy', (), 1)
+            self.assertRaises(ValueError, job.result)
+        finally:
+            pool.close()
+
+
+class ChunkedFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_codec.')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_round_trip(self):
+        chunk = get_chunk()
+        info = {
+            'channels' : [0, 1, 2],
+            'ranges' : [[-10.0, 10.0, 0]]*3,
+            'maxdata' : [65535]*3,
+            'sample_period' : 0.001,
+            }
+        filename = os.path.join(self.work_dir, 'data.sdq')
+        for compressor in sorted(codec.COMPRESSORS):
+            for filters in FILTER_LISTS:
+                writer = formats.ChunkedWriter(filename, info, chunk_size=1000, compressor=compressor,
+                                               filters=filters, threads=1)
+                for i in range(0, chunk.shape[0], 700):
+                    writer.write(i, chunk[i:i + 700])
+                writer.close()
+                recording = loader.open_recording(filename)
+                self.assertEqual(recording.header['codec'], compressor)
+                self.assertTrue((recording.get_raw() == chunk).all(), (compressor, filters))
+                recording.fid.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Tests of the configuration file cache and the read only Config.
+
+usage: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from simple_daq import config
+
+
+class ConfigFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_config.')
+        self.filename = os.path.join(self.work_dir, 'daq-config')
+        self.write('# comment line\nSample_Freq 500\nchannels 0  1\n\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write(self, text, mtime=None):
+        fid = open(self.filename, 'w')
+        fid.write(text)
+        fid.close()
+        if mtime is not None:
+            os.utime(self.filename, (mtime, mtime))
+
+    def test_parse(self):
+        self.assertEqual(config.parse_config_file(self.filename),
+                         {'sample_freq' : '500', 'channels' : '0 1'})
+
+    def test_cache_returns_copy(self):
+        options = config.parse_config_file(self.filename)
+        options['sample_freq'] = '1'
+        self.assertEqual(config.parse_config_file(self.filename)['sample_freq'], '500')
+
+    def test_cache_reparses_changed_file(self):
+        config.parse_config_file(self.filename)
+        mtime = os.stat(self.filename).st_mtime
+        self.write('sample_freq 250\n', mtime + 10)
+        self.assertEqual(config.parse_config_file(self.filename), {'sample_freq' : '250'})
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, config.parse_config_file, os.path.join(self.work_dir, 'none'))
+
+
+class ResolveConfigTest(unittest.TestCase):
+
+    def test_layers(self):
+        layers = [('command line', {'a' : 1}), ('file', {'a' : 2, 'b' : 3})]
+        resolved = config.resolve_config(layers)
+        self.assertEqual((resolved['a'], resolved.b), (1, 3))
+        self.assertEqual(resolved.sources['b'], 'file')
+        self.assertRaises(TypeError, resolved.__setitem__, 'a', 5)
+        changed = resolved.replace(a=7)
+        self.assertEqual((changed.a, resolved.a), (7, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
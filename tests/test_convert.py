@@ -0,0 +1,69 @@
+"""
+Tests of the vectorized conversion of raw sample codes against the per
+sample comedi_to_phys formula.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+
+from simple_daq import convert
+
+RANGES = [(-10.0, 10.0, 0), (0.0, 5.0, 0), (-1.0, 1.0, 1)]
+MAXDATA = [4095, 65535, 4095]
+
+
+def to_phys(code, rng, maxdata, oor=convert.OOR_NAN):
+    """
+    comedi_to_phys for one sample code.
+    """
+    if oor == convert.OOR_NAN and (code == 0 or code == maxdata):
+        return numpy.nan
+    return rng[0] + (rng[1] - rng[0])*code/float(maxdata)
+
+
+class RawConverterTest(unittest.TestCase):
+
+    def setUp(self):
+        raw = numpy.random.RandomState(0).randint(0, 4096, size=(500, 3)).astype(numpy.uint16)
+        raw[:,1] *= 16
+        raw[::50] = 0
+        raw[::70, 0] = 4095
+        raw[::90, 1] = 65535
+        self.raw = raw
+
+    def expected(self, oor):
+        expected = numpy.empty(self.raw.shape)
+        for i in range(self.raw.shape[0]):
+            for j in range(self.raw.shape[1]):
+                expected[i, j] = to_phys(int(self.raw[i, j]), RANGES[j], MAXDATA[j], oor)
+        return expected
+
+    def test_convert(self):
+        for oor in (convert.OOR_NAN, convert.OOR_NUMBER):
+            converter = convert.RawConverter(RANGES, MAXDATA, oor)
+            samples = converter.convert(self.raw)
+            self.assertTrue(numpy.allclose(samples, self.expected(oor), rtol=0, atol=1.0e-12, equal_nan=True))
+
+    def test_interleaved_input(self):
+        converter = convert.RawConverter(RANGES, MAXDATA)
+        samples = converter.convert(self.raw.ravel())
+        self.assertEqual(samples.shape, self.raw.shape)
+        self.assertTrue(numpy.allclose(samples, self.expected(convert.OOR_NAN), equal_nan=True))
+        self.assertRaises(ValueError, converter.convert, self.raw.ravel()[:-1])
+
+    def test_float32_out(self):
+        converter = convert.RawConverter(RANGES, MAXDATA)
+        out = numpy.empty(self.raw.shape, dtype=numpy.float32)
+        self.assertTrue(converter.convert(self.raw, out=out) is out)
+        self.assertTrue(numpy.allclose(out, self.expected(convert.OOR_NAN), atol=1.0e-5, equal_nan=True))
+
+    def test_select(self):
+        converter = convert.RawConverter(RANGES, MAXDATA).select([2, 0])
+        samples = converter.convert(self.raw[:,[2, 0]])
+        self.assertTrue(numpy.allclose(samples, self.expected(convert.OOR_NAN)[:,[2, 0]], equal_nan=True))
+        self.assertEqual(converter.unit_names(), ['mA', 'V'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Tests that the raw, npy and chunked output formats read back what was
+written, including chunked files which were never closed.
+
+usage: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from simple_daq import formats
+from simple_daq import loader
+from simple_daq.convert import converter_from_info
+
+NSCANS = 2500
+CHUNK_SIZE = 1000
+
+
+def get_info():
+    return {
+        'device' : 'sim',
+        'subdev' : 0,
+        'channels' : [0, 1, 2],
+        'gains' : [0, 0, 0],
+        'aref' : 'ground',
+        'ranges' : [[-10.0, 10.0, 0], [-5.0, 5.0, 0], [0.0, 5.0, 0]],
+        'maxdata' : [4095, 4095, 4095],
+        'units' : ['V', 'V', 'V'],
+        'sample_freq' : 1000,
+        'sample_period' : 0.001,
+        'convert_period' : 0.0,
+        'sample_num' : NSCANS,
+        'start_time' : 0.0,
+        }
+
+
+def write_blocks(writer, raw, block_size=333):
+    """
+    Write raw to writer in blocks of block_size scans.
+    """
+    for i in range(0, raw.shape[0], block_size):
+        writer.write(i, raw[i:i + block_size])
+
+
+class FormatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_formats.')
+        self.raw = numpy.random.RandomState(0).randint(0, 4096, size=(NSCANS, 3)).astype(numpy.uint16)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def test_get_format(self):
+        self.assertEqual(formats.get_format(None), 'text')
+        self.assertEqual(formats.get_format('a.RAW'), 'raw')
+        self.assertEqual(formats.get_format('a.npy'), 'npy')
+        self.assertEqual(formats.get_format('a.sdq'), 'chunked')
+        self.assertEqual(formats.get_format('a.sdq', 'text'), 'text')
+        self.assertRaises(ValueError, formats.get_format, 'a.txt', 'hdf5')
+
+    def test_raw(self):
+        filename = self.path('data.raw')
+        writer = formats.open_writer(filename, get_info())
+        # Blocks may arrive out of order
+        writer.write(1000, self.raw[1000:])
+        writer.write(0, self.raw[:1000])
+        writer.close()
+        recording = loader.open_recording(filename)
+        self.assertEqual(len(recording), NSCANS)
+        self.assertTrue((recording.get_raw() == self.raw).all())
+        self.assertEqual(recording.info['channels'], [0, 1, 2])
+
+    def test_npy(self):
+        filename = self.path('data.npy')
+        writer = formats.open_writer(filename, get_info())
+        write_blocks(writer, self.raw)
+        writer.close()
+        recording = loader.open_recording(filename)
+        expected = converter_from_info(get_info()).convert(self.raw)
+        self.assertEqual(len(recording), NSCANS)
+        self.assertTrue(numpy.allclose(recording.get_samples(), expected, rtol=0.0, atol=1.0e-12, equal_nan=True))
+        self.assertTrue(numpy.allclose(recording.get_samples(10, 20, channels=[2]),
+                                       expected[10:20, [2]], rtol=0.0, atol=1.0e-12, equal_nan=True))
+
+    def test_chunked(self):
+        filename = self.path('data.sdq')
+        for compressor, filters in (('zlib', 'delta+shuffle'), ('none', '')):
+            writer = formats.ChunkedWriter(filename, get_info(), chunk_size=CHUNK_SIZE,
+                                           compressor=compressor, filters=filters, threads=2)
+            write_blocks(writer, self.raw)
+            writer.close()
+            recording = loader.open_recording(filename)
+            self.assertEqual(len(recording), NSCANS)
+            self.assertEqual(recording.index.shape[0], 3)
+            self.assertTrue((recording.get_raw() == self.raw).all())
+            self.assertTrue((recording.get_raw(999, 2001, channels=[1]) == self.raw[999:2001, [1]]).all())
+        self.assertRaises(ValueError, writer.write, 0, self.raw[:10])
+
+    def test_chunked_not_closed(self):
+        # Only the chunks written before the crash can be read back
+        filename = self.path('data.sdq')
+        writer = formats.ChunkedWriter(filename, get_info(), chunk_size=CHUNK_SIZE, threads=0)
+        write_blocks(writer, self.raw)
+        writer.fid.flush()
+        recording = loader.open_recording(filename)
+        self.assertEqual(len(recording), 2*CHUNK_SIZE)
+        self.assertTrue((recording.get_raw() == self.raw[:2*CHUNK_SIZE]).all())
+        writer.close()
+
+    def test_processed_codes_rejected(self):
+        info = get_info()
+        info['physical'] = True
+        for name in ('data.raw', 'data.sdq'):
+            self.assertRaises(ValueError, formats.open_writer, self.path(name), info)
+
+
+if __name__ == '__main__':
+    unittest.main()
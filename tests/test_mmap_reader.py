@@ -0,0 +1,143 @@
+"""
+Tests of the mmap read engine against the simulated device's file backed
+kernel buffer, including data which wraps around the end of the buffer.
+
+usage: python -m unittest discover tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from simple_daq import backend
+from simple_daq import simple_daq
+from simple_daq.reader import MmapReader, OverrunError
+
+NCHANS = 2
+SCAN_BYTES = 2*NCHANS
+
+
+def expected_samples(channels, sample_period, index, nscans):
+    """
+    Returns the simulated device waveform for the given scans.
+    """
+    ref = backend.SimulatedDevice()
+    ref.cmd = backend.SimCmd([backend.cr_pack(x, 0, 0) for x in channels])
+    ref.cmd.scan_begin_arg = int(round(sample_period*1.0e9))
+    ref.channels = list(channels)
+    return ref.waveform(index, nscans)
+
+
+class MmapViewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = backend.SimulatedDevice(use_mmap=True)
+        self.device.open()
+        self.reader = MmapReader(self.device.fileno(), self.device.buffer(0))
+
+    def tearDown(self):
+        self.reader.close()
+        self.device.close()
+
+    def fill(self, data):
+        # Write as the producer thread does, without starting a command
+        self.device.running = True
+        self.device.write(data)
+        self.device.running = False
+
+    def test_wraparound_views(self):
+        start = backend.SIM_BUFFER_SIZE - 100
+        self.device.buf_head = self.device.buf_tail = start
+        data = numpy.arange(150, dtype=numpy.uint16).tostring()
+        self.fill(data)
+        view_list = self.reader.views()
+        self.assertEqual([x.shape[0] for x in view_list], [100, 200])
+        self.assertEqual(''.join(x.tostring() for x in view_list), data)
+        self.reader.mark_read(300)
+        self.assertEqual(self.device.buf_tail, start + 300)
+        self.assertEqual(self.reader.views(), [])
+
+    def test_wraparound_readinto(self):
+        start = backend.SIM_BUFFER_SIZE - 6
+        self.device.buf_head = self.device.buf_tail = start
+        data = numpy.arange(8, dtype=numpy.uint16)
+        self.fill(data.tostring())
+        buf = numpy.zeros((5,), dtype=numpy.uint16)
+        self.assertEqual(self.reader.readinto(buf), 10)
+        self.assertTrue((buf == data[:5]).all())
+        self.assertEqual(self.reader.readinto(buf), 6)
+        self.assertTrue((buf[:3] == data[5:]).all())
+        self.assertEqual(self.reader.readinto(buf), 0)
+
+    def test_overrun(self):
+        # Comedi fails the contents call after an overrun, running or not
+        self.reader.buffer.contents = lambda: -1
+        buf = numpy.zeros((5,), dtype=numpy.uint16)
+        for running in (True, False):
+            self.device.running = running
+            self.assertRaises(OverrunError, self.reader.readinto, buf)
+        self.device.running = False
+
+
+class MmapStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        # Keep configuration files in the home and current directories out
+        self.work_dir = tempfile.mkdtemp(prefix='test_mmap_reader.')
+        self.cwd = os.getcwd()
+        self.home = os.environ.get('HOME')
+        self.argv = sys.argv
+        os.environ['HOME'] = self.work_dir
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        sys.argv = self.argv
+        if self.home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = self.home
+        os.chdir(self.cwd)
+        shutil.rmtree(self.work_dir)
+
+    def test_stream_wraps_kernel_buffer(self):
+        # Several times the kernel buffer, with blocks which straddle the wrap
+        nscans = 3*backend.SIM_BUFFER_SIZE//SCAN_BYTES + 777
+        sys.argv = ['daq-acquire', '-d', 'sim:speed=0,mmap=1', '-c', '0 1',
+                    '-n', str(nscans), '-b', '999', '-e', 'mmap']
+        config = simple_daq.set_config()
+        device = simple_daq.open_device(config)
+        try:
+            reader = simple_daq.get_reader(device, config)
+            self.assertTrue(isinstance(reader, MmapReader))
+            reader.close()
+        finally:
+            device.close()
+        info = {}
+        blocks = []
+        for index, t, raw in simple_daq.stream_data(config, convert=False, info=info):
+            self.assertEqual(index, sum(x.shape[0] for x in blocks))
+            blocks.append(raw.copy())
+        data = numpy.concatenate(blocks)
+        self.assertEqual(data.shape, (nscans, NCHANS))
+        expected = expected_samples([0, 1], info['sample_period'], 0, nscans)
+        self.assertTrue((data == expected).all())
+
+    def test_read_engine_uses_buffer(self):
+        # The buffer file of the simulated device is not readable as a
+        # device, so every engine has to read it through the buffer
+        nscans = 5000
+        sys.argv = ['daq-acquire', '-d', 'sim:speed=0,mmap=1', '-c', '0 1',
+                    '-n', str(nscans), '-e', 'read']
+        config = simple_daq.set_config()
+        info = {}
+        blocks = [raw.copy() for index, t, raw in simple_daq.stream_data(config, convert=False, info=info)]
+        data = numpy.concatenate(blocks)
+        self.assertEqual(data.shape, (nscans, NCHANS))
+        expected = expected_samples([0, 1], info['sample_period'], 0, nscans)
+        self.assertTrue((data == expected).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
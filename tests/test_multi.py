@@ -0,0 +1,55 @@
+"""
+Tests of merging the scans of several devices.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+
+from simple_daq.multi import ScanMerger
+from simple_daq.reader import OverrunError
+
+
+def scans(start, stop, value):
+    """
+    Returns (stop - start, 1) block of scan numbers plus value.
+    """
+    return (numpy.arange(start, stop) + value).astype(numpy.uint16)[:,None]
+
+
+class ScanMergerTest(unittest.TestCase):
+
+    def test_align_start(self):
+        # Device 1 starts 5 scans after device 0
+        merger = ScanMerger([1, 1], 0.001)
+        merger.start(0, 100.0)
+        merger.add(0, scans(0, 20, 0))
+        self.assertEqual(merger.pop(), None)
+        merger.start(1, 100.005)
+        merger.add(1, scans(0, 10, 1000))
+        self.assertEqual(merger.offsets(), [5, 0])
+        index, raw = merger.pop()
+        self.assertEqual((index, raw.shape), (0, (10, 2)))
+        self.assertTrue((raw[:,0] == numpy.arange(5, 15)).all())
+        self.assertTrue((raw[:,1] == numpy.arange(1000, 1010)).all())
+
+    def test_stalled_device(self):
+        merger = ScanMerger([1, 1], 0.001, max_pending=100)
+        merger.start(0, 100.0)
+        merger.start(1, 100.0)
+        merger.add(1, scans(0, 10, 0))
+        for i in range(0, 100, 25):
+            merger.add(0, scans(i, i + 25, 0))
+            merger.pop()
+        # 90 scans of device 0 are waiting for device 1
+        self.assertRaises(OverrunError, merger.add, 0, scans(100, 111, 0))
+
+    def test_late_start(self):
+        merger = ScanMerger([1, 1], 0.001, max_pending=50)
+        merger.start(0, 100.0)
+        merger.add(0, scans(0, 50, 0))
+        self.assertRaises(OverrunError, merger.add, 0, scans(50, 60, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Tests that the processing stages give the same result fed block by block
+as fed the whole recording at once.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+
+from simple_daq import process
+from simple_daq.convert import RawConverter
+
+NSCANS = 10007
+NCOLS = 2
+# Block sizes which split groups, including empty and single scan blocks
+BLOCK_SIZES = [1000, 1, 0, 333, 4096, 7]
+
+
+def split_blocks(x):
+    """
+    Returns list of consecutive blocks of x of sizes cycling through
+    BLOCK_SIZES.
+    """
+    blocks = []
+    pos = 0
+    i = 0
+    while pos < x.shape[0]:
+        n = BLOCK_SIZES[i % len(BLOCK_SIZES)]
+        blocks.append(x[pos:pos + n])
+        pos += n
+        i += 1
+    return blocks
+
+
+def run_stage(stage, blocks):
+    """
+    Returns output of stage fed the blocks, then flushed.
+    """
+    out = [stage.process(x) for x in blocks]
+    out.append(stage.flush())
+    return numpy.concatenate(out)
+
+
+def fir_reference(x, taps, n):
+    """
+    Returns the zero padded, centered FIR filter output of x at every n'th
+    input scan.
+    """
+    half = (taps.shape[0] - 1)//2
+    padded = numpy.concatenate((numpy.zeros((half, x.shape[1])), x, numpy.zeros((half, x.shape[1]))))
+    nout = (x.shape[0] - 1)//n + 1
+    y = numpy.zeros((nout, x.shape[1]))
+    for m in range(nout):
+        y[m] = numpy.dot(taps, padded[m*n:m*n + taps.shape[0]])
+    return y
+
+
+class StageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.x = numpy.random.RandomState(0).normal(size=(NSCANS, NCOLS))
+
+    def test_block_average(self):
+        for n in (1, 10, 64):
+            whole = run_stage(process.BlockAverage(n, NCOLS), [self.x])
+            blocks = run_stage(process.BlockAverage(n, NCOLS), split_blocks(self.x))
+            self.assertEqual(whole.shape[0], -(-NSCANS//n))
+            self.assertTrue(numpy.allclose(blocks, whole, rtol=0.0, atol=1.0e-12), n)
+            self.assertTrue(numpy.allclose(whole[1], self.x[n:2*n].mean(axis=0)))
+            self.assertTrue(numpy.allclose(whole[-1], self.x[(NSCANS - 1)//n*n:].mean(axis=0)))
+
+    def test_fir_decimator(self):
+        for n, numtaps in ((4, None), (10, 31), (3, 200)):
+            whole = run_stage(process.FirDecimator(n, NCOLS, numtaps), [self.x])
+            stage = process.FirDecimator(n, NCOLS, numtaps)
+            blocks = run_stage(stage, split_blocks(self.x))
+            self.assertTrue(numpy.allclose(blocks, whole, rtol=0.0, atol=1.0e-12), n)
+            ref = fir_reference(self.x, stage.taps, n)
+            self.assertEqual(whole.shape, ref.shape)
+            self.assertTrue(numpy.allclose(whole, ref, rtol=0.0, atol=1.0e-12), n)
+
+    def test_fir_short_stream(self):
+        # Fewer scans than the filter history
+        x = self.x[:5]
+        stage = process.FirDecimator(2, NCOLS, 41)
+        y = run_stage(stage, split_blocks(x))
+        self.assertTrue(numpy.allclose(y, fir_reference(x, stage.taps, 2), rtol=0.0, atol=1.0e-12))
+
+    def test_fir_dc_gain(self):
+        y = run_stage(process.FirDecimator(8, 1), [numpy.ones((1000, 1))])
+        self.assertTrue(numpy.allclose(y[10:-10], 1.0))
+
+    def test_summary(self):
+        whole = run_stage(process.Summary(100, NCOLS), [self.x])
+        blocks = run_stage(process.Summary(100, NCOLS), split_blocks(self.x))
+        self.assertTrue(numpy.allclose(blocks, whole, rtol=0.0, atol=1.0e-12))
+        self.assertTrue(numpy.allclose(whole[0, :3], [self.x[:100, 0].min(), self.x[:100, 0].max(),
+                                                      numpy.sqrt((self.x[:100, 0]**2).mean())]))
+
+
+class ProcessorTest(unittest.TestCase):
+
+    def test_blocks(self):
+        raw = numpy.random.RandomState(1).randint(1, 4095, size=(NSCANS, NCOLS)).astype(numpy.uint16)
+        converter = RawConverter([(-10.0, 10.0, 0)]*NCOLS, [4095]*NCOLS)
+        outputs = []
+        for blocks in ([raw], split_blocks(raw)):
+            processor = process.Processor(converter, average=3, decimate=4, summary=5)
+            parts = [processor.process(x) for x in blocks] + [processor.flush()]
+            parts = [x for x in parts if x is not None]
+            index = 0
+            for i, y in parts:
+                self.assertEqual(i, index)
+                index += y.shape[0]
+            outputs.append(numpy.concatenate([x[1] for x in parts]))
+        self.assertEqual(outputs[0].shape[1], 3*NCOLS)
+        self.assertTrue(numpy.allclose(outputs[0], outputs[1], rtol=0.0, atol=1.0e-12))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+"""
+Tests of the plot titles of the pyramid plot.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+
+from simple_daq import loader
+from simple_daq import pyramid
+
+
+class ColumnTitlesTest(unittest.TestCase):
+
+    def test_single_device(self):
+        recording = loader.ArrayRecording(numpy.zeros((10, 2)), 0.001, [3, 5])
+        self.assertEqual(pyramid.get_column_titles(recording.info, recording.channels),
+                         ['channel 3', 'channel 5'])
+
+    def test_devices_from_info(self):
+        info = {
+            'channels' : [0, 1, 0, 1],
+            'devices' : [
+                {'device' : 'sim', 'channels' : [0, 1]},
+                {'device' : 'sim:freq=2', 'channels' : [0, 1]},
+                ],
+            }
+        recording = loader.ArrayRecording(numpy.zeros((10, 4)), 0.001, info['channels'], info)
+        self.assertEqual(pyramid.get_column_titles(recording.info, recording.channels),
+                         ['sim channel 0', 'sim channel 1', 'sim:freq=2 channel 0', 'sim:freq=2 channel 1'])
+        self.assertEqual(recording.sample_period, 0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests of reading samples from a file-descriptor directly into numpy
+arrays.
+
+usage: python -m unittest discover tests
+"""
+import os
+import errno
+import threading
+import unittest
+import numpy
+
+from simple_daq.reader import FdReader, PollReader, ReadTimeout, OverrunError
+
+
+class PipeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.read_fd)
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+
+    def write_pieces(self, data, sizes):
+        # Write data in pieces of the given sizes, splitting samples
+        pos = 0
+        i = 0
+        while pos < len(data):
+            n = sizes[i % len(sizes)]
+            os.write(self.write_fd, data[pos:pos + n])
+            pos += n
+            i += 1
+        os.close(self.write_fd)
+        self.write_fd = None
+
+    def test_fill(self):
+        data = numpy.arange(3000, dtype=numpy.uint16).reshape((1000, 3))
+        thread = threading.Thread(target=self.write_pieces, args=(data.tostring(), [1, 333, 4096]))
+        thread.start()
+        reader = FdReader(self.read_fd)
+        out = numpy.zeros((1200, 3), dtype=numpy.uint16)
+        calls = []
+        nbytes = reader.fill(out, calls.append)
+        thread.join()
+        reader.close()
+        self.assertEqual(nbytes, data.nbytes)
+        self.assertTrue((out[:1000] == data).all())
+        self.assertEqual(calls[-1], data.nbytes)
+
+    def test_poll_timeout(self):
+        reader = PollReader(self.read_fd, timeout=0.01)
+        buf = numpy.zeros((10,), dtype=numpy.uint16)
+        self.assertRaises(ReadTimeout, reader.readinto, buf)
+        self.assertEqual(reader.stats['timeouts'], 1)
+        os.write(self.write_fd, buf[:4].tostring())
+        self.assertEqual(reader.readinto(buf), 8)
+        self.assertEqual(reader.stats['reads'], 1)
+        reader.close()
+
+    def test_poll_overrun(self):
+        # Comedi fails the read with EPIPE after an overrun
+        class OverrunFile(object):
+            def readinto(self, buf):
+                raise IOError(errno.EPIPE, 'Broken pipe')
+        reader = PollReader(self.read_fd)
+        reader.fid = OverrunFile()
+        os.write(self.write_fd, 'x')
+        self.assertRaises(OverrunError, reader.readinto, numpy.zeros((10,), dtype=numpy.uint16))
+        self.assertEqual(reader.stats['overruns'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests of the raw sample ring buffer - writes of any size read back as
+scan aligned blocks, across the end of the buffer.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+
+from simple_daq.ringbuffer import RingBuffer
+
+NCHANS = 3
+BLOCK_SIZE = 10
+BLOCK_NUM = 4
+
+
+def scans(start, stop):
+    """
+    Returns (stop - start, NCHANS) raw codes numbered by scan and channel.
+    """
+    index = numpy.arange(start, stop)[:,None]*NCHANS + numpy.arange(NCHANS)[None,:]
+    return (index % (1 << 16)).astype(numpy.uint16)
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def test_odd_sized_writes_wrap(self):
+        ring = RingBuffer(NCHANS, BLOCK_SIZE, BLOCK_NUM)
+        data = scans(0, 25*BLOCK_SIZE).tostring()
+        pos = 0
+        index = 0
+        sizes = [1, 7, 13, 59, 2, 101]
+        i = 0
+        while pos < len(data):
+            n = min(sizes[i % len(sizes)], len(data) - pos, ring.capacity - ring.used())
+            ring.write(data[pos:pos + n])
+            pos += n
+            i += 1
+            block = ring.read_block()
+            while block is not None:
+                block_index, raw = block
+                self.assertEqual(block_index, index)
+                self.assertEqual(raw.shape, (BLOCK_SIZE, NCHANS))
+                self.assertTrue((raw == scans(index, index + BLOCK_SIZE)).all())
+                index += BLOCK_SIZE
+                block = ring.read_block()
+        self.assertEqual(index, 25*BLOCK_SIZE)
+
+    def test_partial_block(self):
+        ring = RingBuffer(NCHANS, BLOCK_SIZE, BLOCK_NUM)
+        data = scans(0, 2*BLOCK_SIZE + 3).tostring()
+        # End part way through a scan
+        ring.write(data + '\x01')
+        self.assertEqual(ring.read_block()[0], 0)
+        self.assertEqual(ring.read_block()[0], BLOCK_SIZE)
+        self.assertEqual(ring.read_block(), None)
+        index, raw = ring.read_block(partial=True)
+        self.assertEqual(index, 2*BLOCK_SIZE)
+        self.assertTrue((raw == scans(2*BLOCK_SIZE, 2*BLOCK_SIZE + 3)).all())
+        self.assertEqual(ring.read_block(partial=True), None)
+
+    def test_write_view_commit(self):
+        ring = RingBuffer(NCHANS, BLOCK_SIZE, BLOCK_NUM)
+        ring.write(scans(0, 3*BLOCK_SIZE + 5).tostring())
+        for i in range(3):
+            ring.read_block()
+        # Free space is only up to the end of the buffer
+        view = ring.write_view()
+        self.assertEqual(view.shape[0], ring.capacity - ring.write_pos)
+        view[:] = numpy.frombuffer(scans(3*BLOCK_SIZE + 5, 4*BLOCK_SIZE).tostring(), dtype=numpy.uint8)
+        ring.commit(view.shape[0])
+        index, raw = ring.read_block()
+        self.assertEqual(index, 3*BLOCK_SIZE)
+        self.assertTrue((raw == scans(3*BLOCK_SIZE, 4*BLOCK_SIZE)).all())
+
+    def test_overflow(self):
+        ring = RingBuffer(NCHANS, BLOCK_SIZE, BLOCK_NUM)
+        ring.write(scans(0, BLOCK_NUM*BLOCK_SIZE).tostring())
+        self.assertRaises(ValueError, ring.write, '\x00')
+        self.assertRaises(ValueError, ring.commit, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
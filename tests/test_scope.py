@@ -0,0 +1,81 @@
+"""
+Tests of the scope ring buffer read by snapshot while it is written.
+
+usage: python -m unittest discover tests
+"""
+import time
+import threading
+import unittest
+import numpy
+
+from simple_daq.scope import ScopeBuffer
+
+
+def bins(start, stop, nchans=2, decimate=1):
+    """
+    Returns raw codes whose bins hold their own bin number (mod 2**16).
+    """
+    values = (numpy.arange(start, stop) % (1 << 16)).astype(numpy.uint16)
+    return numpy.repeat(values, decimate)[:,None].repeat(nchans, axis=1)
+
+
+class ScopeBufferTest(unittest.TestCase):
+
+    def check_snapshot(self, count, mins, maxs):
+        expected = bins(count - mins.shape[0], count)
+        self.assertTrue((mins == expected).all())
+        self.assertTrue((maxs == expected).all())
+
+    def test_wraparound(self):
+        buf = ScopeBuffer(2, 1.0, window=100, points=100)
+        buf.push(bins(0, 250))
+        count, mins, maxs = buf.snapshot()
+        self.assertEqual((count, mins.shape[0]), (250, 100))
+        self.check_snapshot(count, mins, maxs)
+
+    def test_partial_bins(self):
+        buf = ScopeBuffer(2, 1.0, window=40, points=10)
+        self.assertEqual(buf.decimate, 4)
+        raw = bins(0, 30, decimate=4)
+        for i in range(0, raw.shape[0], 7):
+            buf.push(raw[i:i + 7])
+        count, mins, maxs = buf.snapshot()
+        self.assertEqual(count, 30)
+        self.check_snapshot(count, mins, maxs)
+
+    def test_claimed_bins_dropped(self):
+        buf = ScopeBuffer(2, 1.0, window=100, points=100)
+        buf.push(bins(0, 150))
+        # Writer has claimed 30 bins and overwritten their slots, but not
+        # yet advanced count
+        buf.claimed = buf.count + 30
+        buf.min[50:80] = 0xffff
+        count, mins, maxs = buf.snapshot()
+        self.assertEqual((count, mins.shape[0]), (150, 70))
+        self.check_snapshot(count, mins, maxs)
+
+    def test_concurrent_writer(self):
+        buf = ScopeBuffer(2, 1.0, window=64, points=64)
+        done = threading.Event()
+
+        def writer():
+            index = 0
+            while not done.isSet():
+                n = 1 + index % 37
+                buf.push(bins(index, index + n))
+                index += n
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            t_end = time.time() + 0.5
+            while time.time() < t_end:
+                count, mins, maxs = buf.snapshot()
+                self.check_snapshot(count, mins, maxs)
+        finally:
+            done.set()
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
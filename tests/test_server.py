@@ -0,0 +1,77 @@
+"""
+Tests of the stream server's per client queues.
+
+usage: python -m unittest discover tests
+"""
+import json
+import socket
+import struct
+import unittest
+import numpy
+
+from simple_daq import server
+
+
+def parse_frames(data):
+    """
+    Returns list of (frame type, index, payload) of the frames in data.
+    """
+    frames = []
+    pos = 0
+    while pos < len(data):
+        header = struct.unpack(server.FRAME_HEADER, data[pos:pos + server.FRAME_HEADER_SIZE])
+        pos += server.FRAME_HEADER_SIZE
+        magic, frame_type, dtype, nchans, index, scan_num, nbytes = header
+        frames.append((frame_type, index, data[pos:pos + nbytes]))
+        pos += nbytes
+    return frames
+
+
+class ClientQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        # Server thread is not started, the test sends for it
+        self.server = server.StreamServer(address='127.0.0.1:0')
+        self.server.set_info({'channels' : [0, 1], 'sample_period' : 0.001})
+        sock, self.peer = socket.socketpair()
+        sock.setblocking(0)
+        self.client = server.Client(sock, 'test', self.server.queue_size)
+        self.server.clients.append(self.client)
+
+    def tearDown(self):
+        self.server.close()
+        self.peer.close()
+
+    def sent_frames(self):
+        while self.client.pending():
+            self.server.send(self.client)
+        self.peer.setblocking(0)
+        data = ''
+        while True:
+            try:
+                chunk = self.peer.recv(1 << 16)
+            except socket.error:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return parse_frames(data)
+
+    def test_info_frame_not_dropped(self):
+        self.server.lock.acquire()
+        try:
+            self.server.handle_request(self.client, '{"queue_size": 1, "channels": [1]}')
+        finally:
+            self.server.lock.release()
+        raw = numpy.zeros((10, 2), dtype=numpy.uint16)
+        for i in range(3):
+            self.server.publish(10*i, raw)
+        frames = self.sent_frames()
+        self.assertEqual([(x[0], x[1]) for x in frames],
+                         [(server.FRAME_INFO, 0), (server.FRAME_DATA, 20)])
+        self.assertEqual(json.loads(frames[0][2])['channels'], [1])
+        self.assertEqual(self.client.dropped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Tests of the shared memory ring - reads which wrap around the end of the
+ring, and detection of scans overwritten before or while they are read.
+
+usage: python -m unittest discover tests
+"""
+import os
+import unittest
+import numpy
+
+from simple_daq import shmring
+
+CAPACITY = 100
+NCHANS = 2
+
+
+def get_scans(start, stop):
+    """
+    Returns scans start to stop, each holding its own index.
+    """
+    index = numpy.arange(start, stop, dtype=numpy.uint16)
+    return numpy.column_stack((index, index + 1))
+
+
+class ShmRingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.name = 'test_shmring.%d'%(os.getpid(),)
+        self.producer = shmring.ShmProducer(self.name, NCHANS, CAPACITY, info={'channels' : [0, 1]})
+        self.consumer = shmring.ShmConsumer(self.name)
+
+    def tearDown(self):
+        self.consumer.close()
+        self.producer.close()
+
+    def publish(self, start, stop):
+        self.producer.publish(start, get_scans(start, stop))
+
+    def read_all(self):
+        blocks = []
+        while True:
+            block = self.consumer.read(timeout=0.0)
+            if block is None:
+                return blocks
+            blocks.append(block)
+
+    def test_info_and_slots(self):
+        self.assertEqual(self.consumer.info, {'channels' : [0, 1]})
+        self.assertEqual(self.producer.consumers(), [(os.getpid(), 0)])
+
+    def test_wrap(self):
+        self.publish(0, 70)
+        index, view = self.consumer.read()
+        self.assertEqual(index, 0)
+        self.assertTrue((view == get_scans(0, 70)).all())
+        self.assertFalse(view.flags.writeable)
+        self.publish(70, 150)
+        # The view stops at the end of the ring
+        blocks = self.read_all()
+        self.assertEqual([(i, x.shape[0]) for i, x in blocks], [(70, 30), (100, 50)])
+        for i, x in blocks:
+            self.assertTrue(self.consumer.valid(i))
+            self.assertTrue((x == get_scans(i, i + x.shape[0])).all())
+        self.assertEqual(self.consumer.lost, 0)
+        self.assertEqual(self.producer.lag(), 0)
+
+    def test_overwritten_while_read(self):
+        self.publish(0, 60)
+        index, view = self.consumer.read()
+        self.assertTrue(self.consumer.valid(index))
+        # Scans 0 to 9 are overwritten by scan 100 on
+        self.publish(60, 110)
+        self.assertFalse(self.consumer.valid(index))
+        self.assertTrue(self.consumer.valid(10))
+        self.assertRaises(shmring.ShmOverrun, self.consumer.check, index)
+        self.consumer.check(10)
+
+    def test_claim_before_commit(self):
+        # A producer part way through writing scans 100 to 120 has
+        # claimed them but not committed them
+        self.publish(0, 100)
+        index, view = self.consumer.read(max_scans=30)
+        self.producer.counters[shmring.CLAIM] = 120
+        self.assertFalse(self.consumer.valid(index))
+        self.assertEqual(self.consumer.available(), 70)
+
+    def test_lost_scans(self):
+        self.publish(0, 50)
+        self.consumer.read(max_scans=10)
+        self.publish(50, 250)
+        self.assertEqual(self.producer.lag(), 240)
+        blocks = self.read_all()
+        self.assertEqual(blocks[0][0], 150)
+        self.assertEqual(self.consumer.lost, 140)
+        self.assertEqual(sum(x.shape[0] for i, x in blocks), CAPACITY)
+        self.assertTrue((numpy.concatenate([x for i, x in blocks]) == get_scans(150, 250)).all())
+
+    def test_latest_and_closed(self):
+        self.publish(0, 40)
+        consumer = shmring.ShmConsumer(self.name, latest=True)
+        try:
+            self.assertEqual(consumer.available(), 0)
+            self.publish(40, 45)
+            index, view = consumer.read()
+            self.assertEqual((index, view.shape[0]), (40, 5))
+            self.producer.counters[shmring.CLOSED] = 1
+            self.assertEqual(consumer.read(), None)
+        finally:
+            consumer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
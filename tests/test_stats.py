@@ -0,0 +1,110 @@
+"""
+Tests that Recording.get_stats gives the same statistics for every output
+format, for calibrated channels and with saturated samples.
+
+usage: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from simple_daq import formats
+from simple_daq import loader
+from simple_daq.convert import converter_from_info
+
+NSCANS = 5000
+CHUNK_SIZE = 1000
+FORMATS = {
+    'text' : 'stats.txt',
+    'raw' : 'stats.raw',
+    'npy' : 'stats.npy',
+    'chunked' : 'stats.sdq',
+    }
+
+
+def get_info():
+    # Channel 0 has a nonlinear calibration polynomial
+    return {
+        'device' : 'sim',
+        'subdev' : 0,
+        'channels' : [0, 1],
+        'gains' : [0, 0],
+        'aref' : 'ground',
+        'ranges' : [[-10.0, 10.0, 0], [-5.0, 5.0, 0]],
+        'maxdata' : [4095, 4095],
+        'units' : ['V', 'V'],
+        'polynomials' : [[[0.1, 0.005, -2.0e-7, 3.0e-10], 2048.0], None],
+        'sample_freq' : 1000,
+        'sample_period' : 0.001,
+        'convert_period' : 0.0,
+        'sample_num' : NSCANS,
+        'start_time' : 0.0,
+        }
+
+
+class StatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_stats.')
+        raw = numpy.random.RandomState(0).randint(0, 4096, size=(NSCANS, 2)).astype(numpy.uint16)
+        raw[::97, 0] = 0
+        raw[::89, 1] = 4095
+        # Channel 1 saturated for the whole of the third chunk
+        raw[2*CHUNK_SIZE:3*CHUNK_SIZE, 1] = 4095
+        self.raw = raw
+        self.converter = converter_from_info(get_info())
+        self.recordings = {}
+        for fmt, name in FORMATS.items():
+            filename = os.path.join(self.work_dir, name)
+            if fmt == 'chunked':
+                writer = formats.ChunkedWriter(filename, get_info(), chunk_size=CHUNK_SIZE, threads=0)
+            else:
+                writer = formats.open_writer(filename, get_info(), fmt)
+            for i in range(0, NSCANS, 700):
+                writer.write(i, raw[i:i + 700])
+            writer.close()
+            self.recordings[fmt] = loader.open_recording(filename, fmt)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def check_stats(self, start, stop):
+        samples = self.converter.convert(self.raw[start:stop])
+        for fmt, recording in self.recordings.items():
+            stats = recording.get_stats(start, stop)
+            for i in range(2):
+                valid = samples[:,i][~numpy.isnan(samples[:,i])]
+                self.assertEqual(stats['count'][i], valid.shape[0], fmt)
+                if valid.shape[0] == 0:
+                    for key in ('min', 'max', 'mean'):
+                        self.assertTrue(numpy.isnan(stats[key][i]), fmt)
+                    continue
+                # The text format is rounded to its precision
+                places = 5 if fmt == 'text' else 10
+                self.assertAlmostEqual(stats['min'][i], valid.min(), places, fmt)
+                self.assertAlmostEqual(stats['max'][i], valid.max(), places, fmt)
+                self.assertAlmostEqual(stats['mean'][i], valid.mean(), places, fmt)
+
+    def test_whole_recording(self):
+        self.check_stats(0, NSCANS)
+
+    def test_partial_chunks(self):
+        self.check_stats(123, 4321)
+
+    def test_saturated_range(self):
+        self.check_stats(2*CHUNK_SIZE, 3*CHUNK_SIZE)
+
+    def test_index_only(self):
+        recording = self.recordings['chunked']
+        self.assertTrue(recording.stats is not None)
+        stats = recording.get_stats(1500, 3500, index_only=True)
+        self.assertEqual((stats['start'], stats['stop']), (1000, 4000))
+        expected = recording.get_stats(1000, 4000)
+        for key in ('min', 'max', 'mean', 'count'):
+            self.assertTrue(numpy.allclose(stats[key], expected[key], rtol=1.0e-12, equal_nan=True), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
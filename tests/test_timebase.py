@@ -0,0 +1,68 @@
+"""
+Tests of the implicit time axis and of converting between scan indices
+and times.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+
+from simple_daq.timebase import TimeAxis
+from simple_daq import loader
+
+# Periods which are not exact in binary
+SAMPLE_PERIOD = 1.0/3000.0
+CONVERT_PERIOD = 7.0e-6
+
+
+class TimeAxisTest(unittest.TestCase):
+
+    def test_values(self):
+        t = TimeAxis(100, 50, SAMPLE_PERIOD, CONVERT_PERIOD, start_time=1000.0)
+        index = numpy.arange(100, 150)
+        self.assertEqual(len(t), 50)
+        self.assertTrue((numpy.asarray(t) == index*SAMPLE_PERIOD).all())
+        self.assertTrue((t[10:20] == index[10:20]*SAMPLE_PERIOD).all())
+        self.assertTrue((t[::7] == index[::7]*SAMPLE_PERIOD).all())
+        self.assertEqual(t[-1], 149*SAMPLE_PERIOD)
+        self.assertRaises(IndexError, t.__getitem__, 50)
+        chan = t.for_channel(2)
+        self.assertTrue((numpy.asarray(chan) == index*SAMPLE_PERIOD + 2*CONVERT_PERIOD).all())
+        self.assertTrue((t.absolute() == 1000.0 + index*SAMPLE_PERIOD).all())
+        self.assertRaises(ValueError, TimeAxis(0, 10, SAMPLE_PERIOD).absolute)
+
+    def test_blocks(self):
+        # Block by block times are those of the whole acquisition, with
+        # no error accumulating over the blocks
+        whole = TimeAxis(0, 100000, SAMPLE_PERIOD).get()
+        blocks = [TimeAxis(i, 999, SAMPLE_PERIOD).get() for i in range(0, 100000, 999)]
+        self.assertTrue((numpy.concatenate(blocks)[:100000] == whole).all())
+
+
+class IndexTimeTest(unittest.TestCase):
+
+    def setUp(self):
+        info = {'convert_period' : CONVERT_PERIOD, 't0' : 2.5}
+        self.recording = loader.ArrayRecording(numpy.zeros((5000, 3)), SAMPLE_PERIOD, info=info)
+
+    def test_round_trip(self):
+        t = self.recording.get_t()
+        index = [self.recording.time_to_index(x) for x in t]
+        self.assertEqual(index, range(5000))
+        # Times between scans go to the next scan
+        self.assertEqual(self.recording.time_to_index(t[10] + 0.5*SAMPLE_PERIOD), 11)
+
+    def test_scan_range(self):
+        t = self.recording.get_t()
+        self.assertEqual(self.recording.get_scan_range(t[100], t[200]), (100, 200))
+        self.assertEqual(self.recording.get_scan_range(None, t[200]), (0, 200))
+        self.assertEqual(self.recording.get_scan_range(t[100], None), (100, 5000))
+        self.assertEqual(self.recording.get_scan_range(0.0, 100.0), (0, 5000))
+
+    def test_channel_times(self):
+        t = self.recording.get_t(10, 20)
+        self.assertTrue(numpy.allclose(self.recording.get_t(10, 20, channel=2), t + 2*CONVERT_PERIOD))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Tests that triggered events are found at the level crossings and hold
+the right scans before and after the trigger, however the stream is split
+into blocks.
+
+usage: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+
+from simple_daq import trigger
+from simple_daq import loader
+from simple_daq.convert import RawConverter
+
+NSCANS = 5000
+LOW = 100
+HIGH = 3000
+LEVEL = 1000.0
+RISING = [50, 1000, 1010, 2000, 4990]   # 1010 is within the holdoff
+FALLING = [500, 1005, 1500, 2500]
+PRE_NUM = 100
+POST_NUM = 200
+
+
+def get_raw():
+    """
+    Returns trigger channel stepping between LOW and HIGH at the RISING
+    and FALLING scans, and a channel counting scans.
+    """
+    raw = numpy.zeros((NSCANS, 2), dtype=numpy.uint16)
+    raw[:,0] = LOW
+    for start in RISING:
+        stop = min([x for x in FALLING if x > start] or [NSCANS])
+        raw[start:stop, 0] = HIGH
+    raw[:,1] = numpy.arange(NSCANS) % 4000 + 1
+    return raw
+
+
+def get_info():
+    return {
+        'channels' : [0, 1],
+        'ranges' : [[0.0, 4095.0, 0], [0.0, 4095.0, 0]],
+        'maxdata' : [4095, 4095],
+        'sample_period' : 0.001,
+        }
+
+
+def run_trigger(raw, block_size, **kwargs):
+    """
+    Returns events found in raw processed block_size scans at a time.
+    """
+    converter = RawConverter(get_info()['ranges'], get_info()['maxdata'])
+    trig = trigger.Trigger(converter, 2, 0, LEVEL, **kwargs)
+    events = []
+    for i in range(0, raw.shape[0], block_size):
+        events.extend(trig.process(i, raw[i:i + block_size]))
+    events.extend(trig.flush())
+    return events
+
+
+class TriggerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.raw = get_raw()
+
+    def check_events(self, events, triggers):
+        self.assertEqual([x.trigger for x in events], triggers)
+        self.assertEqual([x.num for x in events], range(len(triggers)))
+        for event in events:
+            start = max(event.trigger - PRE_NUM, 0)
+            stop = min(event.trigger + POST_NUM, NSCANS)
+            self.assertEqual((event.start, event.stop), (start, stop))
+            self.assertTrue((event.data == self.raw[start:stop]).all())
+
+    def test_rising(self):
+        # The first event has fewer pre trigger scans, the last is cut off
+        # by the end of the stream
+        for block_size in (NSCANS, 1000, 77, 1):
+            events = run_trigger(self.raw, block_size, pre_num=PRE_NUM, post_num=POST_NUM)
+            self.check_events(events, [50, 1000, 2000, 4990])
+            self.assertEqual([x.data.shape[0] for x in events], [250, 300, 300, 110])
+
+    def test_falling(self):
+        events = run_trigger(self.raw, 333, edge='falling', pre_num=PRE_NUM, post_num=POST_NUM)
+        self.check_events(events, [500, 1005, 1500, 2500])
+
+    def test_both(self):
+        events = run_trigger(self.raw, 333, edge='both', pre_num=PRE_NUM, post_num=POST_NUM, holdoff=1)
+        self.check_events(events, [50, 500, 1000, 1005, 1010, 1500, 2000, 2500, 4990])
+
+    def test_no_pre_trigger(self):
+        events = run_trigger(self.raw, 64, post_num=POST_NUM)
+        self.assertEqual([(x.start, x.stop) for x in events],
+                         [(t, min(t + POST_NUM, NSCANS)) for t in (50, 1000, 2000, 4990)])
+
+    def test_history(self):
+        history = trigger.History(10, 2)
+        history.write(self.raw[:25])
+        history.write(self.raw[25:28])
+        self.assertTrue((history.get(18, 28) == self.raw[18:28]).all())
+        self.assertRaises(ValueError, history.get, 17, 28)
+
+
+class EventRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_trigger.')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_event_files(self):
+        raw = get_raw()
+        filename = os.path.join(self.work_dir, 'events.raw')
+        recorder = trigger.EventRecorder(filename, get_info(), 0, LEVEL, pre_num=PRE_NUM, post_num=POST_NUM)
+        for i in range(0, NSCANS, 500):
+            recorder.write(i, raw[i:i + 500])
+        recorder.close()
+        self.assertEqual(recorder.event_files,
+                         [trigger.get_event_filename(filename, i) for i in range(4)])
+        recording = loader.open_recording(recorder.event_files[1])
+        self.assertEqual(recording.info['trigger_index'], 1000)
+        self.assertAlmostEqual(recording.info['t0'], 0.9)
+        self.assertTrue((recording.get_raw() == raw[900:1200]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Tests that the block formatted text output is byte for byte the same as
+the original row by row '%f' output.
+
+usage: python -m unittest discover tests
+"""
+import unittest
+import numpy
+from cStringIO import StringIO
+
+from simple_daq import formats
+
+
+def write_samples_rows(fid, t, samples):
+    """
+    The original row by row text writer.
+    """
+    for i in xrange(0,t.shape[0]):
+        fid.write('%f '%(t[i],))
+        for j in range(0,samples.shape[1]):
+            fid.write('%f '%(samples[i,j],))
+        fid.write('\n')
+
+
+def format_both(t, samples, block_rows):
+    """
+    Returns the output of write_samples and of the original writer.
+    """
+    fid = StringIO()
+    formats.write_samples(fid, t, samples, block_rows=block_rows)
+    if samples.ndim == 1:
+        samples = samples.reshape((t.shape[0], 1))
+    ref = StringIO()
+    write_samples_rows(ref, t, samples)
+    return fid.getvalue(), ref.getvalue()
+
+
+class WriteSamplesTest(unittest.TestCase):
+
+    def setUp(self):
+        state = numpy.random.RandomState(0)
+        self.t = 0.001*numpy.arange(1000)
+        self.samples = state.uniform(-10.0, 10.0, size=(1000, 3))
+        # Values which round at the sixth digit, huge, tiny and missing
+        self.samples[0] = [0.0000005, -0.0000005, 1.0e12]
+        self.samples[1] = [1.0e-9, -0.0, numpy.nan]
+        self.samples[2] = [numpy.inf, -numpy.inf, 2.5]
+
+    def test_identical(self):
+        for block_rows in (1, 7, 1000, 4096):
+            out, ref = format_both(self.t, self.samples, block_rows)
+            self.assertEqual(out, ref, block_rows)
+
+    def test_float32_samples(self):
+        out, ref = format_both(self.t, self.samples.astype(numpy.float32), 100)
+        self.assertEqual(out, ref)
+
+    def test_single_channel(self):
+        out, ref = format_both(self.t, self.samples[:,0].copy(), 300)
+        self.assertEqual(out, ref)
+
+    def test_empty(self):
+        out, ref = format_both(self.t[:0], self.samples[:0], 100)
+        self.assertEqual(out, '')
+        self.assertEqual(ref, '')
+
+
+if __name__ == '__main__':
+    unittest.main()